@@ -8,8 +8,11 @@ from containers import Container
 from managers.recital_manager import RecitalManager
 from models.database import Database
 from models.user import UserGroups
+from resource_access.recitals_content_ra import RecitalsContentRA
+from resource_access.recitals_ra import RecitalsRA
 from resource_access.users_ra import UsersRA
 from utility.authentication import users
+from utility.data_layout import get_session_file, is_flat_layout_file
 
 
 class AdminCommands(StrEnum):
@@ -18,6 +21,7 @@ class AdminCommands(StrEnum):
     DROP_DB = "drop_db"
     CLEAR_DB = "clear_db"
     APPROVE_SPEAKER = "approve_speaker"
+    MIGRATE_DATA_LAYOUT = "migrate_data_layout"
 
 
 @inject
@@ -67,6 +71,36 @@ def approve_speaker(parser: argparse.ArgumentParser, users_ra: UsersRA = Provide
     print(f"Speaker {speaker_email} approved.")
 
 
+@inject
+def migrate_data_layout(
+    recitals_ra: RecitalsRA = Provide(Container.recitals_ra),
+    recitals_content_ra: RecitalsContentRA = Provide(Container.recitals_content_ra),
+):
+    # Run while the server is stopped - files move before their stored names are updated
+    print("Moving data files into session folders.")
+    moved_count = recitals_content_ra.migrate_flat_layout_files()
+    print(f"Moved {moved_count} files.")
+
+    print("Updating session file names.")
+    filename_fields = ["text_filename", "source_audio_filename", "main_audio_filename", "light_audio_filename"]
+    for recital_session in recitals_ra.get_sessions_with_flat_layout_files():
+        for field in filename_fields:
+            filename = getattr(recital_session, field)
+            if filename and is_flat_layout_file(filename):
+                setattr(recital_session, field, get_session_file(recital_session.id, filename))
+        recitals_ra.upsert(recital_session)
+
+    print("Updating audio segment file names.")
+    while audio_segments := recitals_ra.get_audio_segments_with_flat_layout_files():
+        recitals_ra.update_audio_segment_filenames(
+            {
+                audio_segment.id: get_session_file(audio_segment.recital_session_id, audio_segment.filename)
+                for audio_segment in audio_segments
+            }
+        )
+    print("Done.")
+
+
 def drop_database(parser: argparse.ArgumentParser, db: Database = Provide(Container.db)):
     # Warn the user - get explicit permission to drop-create the DB
     if not parser.parse_args().y:
@@ -99,6 +133,8 @@ def run_command(command: str, parser: argparse.ArgumentParser):
         clear_database(parser)
     elif command == AdminCommands.APPROVE_SPEAKER:
         approve_speaker(parser)
+    elif command == AdminCommands.MIGRATE_DATA_LAYOUT:
+        migrate_data_layout()
     else:
         raise Exception(f"Unknown command: {command}")
 
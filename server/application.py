@@ -9,6 +9,7 @@ from configuration import configure
 from containers import Container
 from routers.api import api_app
 from routers.web_client import get_web_client_app, get_web_client_env_app
+from utility.metrics import register_session_finalization_backlog
 from utility.scheduler import JobScheduler
 
 
@@ -40,6 +41,10 @@ def create_app() -> FastAPI:
     db.create_database()
     recital_manager = container.recital_manager()
     recital_manager.schedule_session_finalization_job(defer=True)
+    data_folder_manager = container.data_folder_manager()
+    data_folder_manager.schedule_data_folder_gc_job()
+    recitals_ra = container.recitals_ra()
+    register_session_finalization_backlog(recitals_ra.get_finalization_backlog)
 
     app = FastAPI(lifespan=lifespan)
 
@@ -0,0 +1,63 @@
+"""
+Measures the session captions (WebVTT) aggregation time and peak memory
+for growing session lengths.
+
+Run from the server folder:
+
+    python -m benchmarks.captions_bench --segments 10000 100000
+"""
+
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+from engines.aggregation_engine import AggregationEngine
+from resource_access.recitals_content_ra import RecitalsContentRA
+from resource_access.recitals_ra import RecitalsRA
+
+SEGMENT_TEXT = "שלום עולם, זהו משפט לדוגמה שמוקרא בהקלטה אחת מתוך רבות"
+
+
+class SyntheticTextSegmentsRA(RecitalsRA):
+    def __init__(self, data_folder: str, segments_count: int) -> None:
+        super().__init__(session_factory=None, data_folder=data_folder, segment_writer=None)
+        self.segments_count = segments_count
+
+    def iter_session_text_segments(self, recital_session_id: str, batch_size: int = 1000):
+        for i in range(self.segments_count):
+            yield (i + 1) * 3.7, f"{SEGMENT_TEXT} {i}"
+
+
+def run(segments_count: int) -> None:
+    with tempfile.TemporaryDirectory() as data_folder:
+        recitals_ra = SyntheticTextSegmentsRA(data_folder, segments_count)
+        recitals_content_ra = RecitalsContentRA(data_folder=data_folder, content_s3_bucket=None)
+        aggregation_engine = AggregationEngine(
+            recitals_ra=recitals_ra, recitals_content_ra=recitals_content_ra, data_folder=data_folder
+        )
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        written_length = recitals_ra.store_session_text(
+            aggregation_engine.aggregate_session_captions("bench_session"), "bench_session.vtt"
+        )
+        elapsed = time.perf_counter() - started
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print(
+        f"{segments_count:>8} segments: {elapsed * 1000:9.1f} ms"
+        f" | {segments_count / elapsed:10.0f} segments/sec"
+        f" | {written_length / 1024:9.0f} KB written"
+        f" | peak memory {peak_memory / 1024:7.0f} KB"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="captions_bench.py", description="Session captions aggregation benchmark")
+    parser.add_argument("--segments", type=int, nargs="+", default=[10, 1000, 10000, 100000])
+    args = parser.parse_args()
+
+    for segments_count in args.segments:
+        run(segments_count)
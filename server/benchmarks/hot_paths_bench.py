@@ -0,0 +1,470 @@
+"""
+Microbenchmarks of the server hot paths - text extraction, session aggregation, transcoding,
+the stats cache keys, the stats queries and the cursor paginated lists.
+
+Run from the server folder:
+
+    python -m benchmarks.hot_paths_bench --save
+    python -m benchmarks.hot_paths_bench --groups aggregation cache --compare benchmarks/results/1.3.1.json
+
+--save stores the results as benchmarks/results/<version>.json - commit it with a release,
+and compare the next release against it. A case slower than --threshold times its baseline
+is reported as a regression (and the run exits with a failure code).
+
+Groups requiring what is not available here are skipped:
+- extraction - the stanza Hebrew model (downloaded by pre_download.py)
+- transform - ffmpeg on the PATH
+- stats - a dedicated Postgres DB passed as --stats-db (seeded with synthetic users and sessions once)
+- pagination - the same --stats-db
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterator, NamedTuple, Optional
+
+from sqlmodel import func, insert, select
+
+from benchmarks.captions_bench import SEGMENT_TEXT, SyntheticTextSegmentsRA
+from engines.aggregation_engine import AggregationEngine
+from engines.transform_engine import TransformEngine
+from models.recital_audio_segment import RecitalAudioSegment
+from models.recital_session import RecitalSession, RecitalSessionRead, SessionStatus
+from models.user import User
+from resource_access.recitals_content_ra import RecitalsContentRA
+from resource_access.recitals_ra import RecitalsRA
+from resource_access.stats_ra import StatsRA, TotalStats
+from utility.cache.stats import CacheKeys, region, stats_key_gen
+from utility.data_layout import get_session_file
+from utility.transcode_scheduler import TranscodeScheduler
+from version import __version__
+
+RESULTS_FOLDER = Path(__file__).parent / "results"
+MIN_ROUND_SEC = 0.05
+SEGMENTS_COUNTS = [10, 100, 1000]
+AUDIO_SEGMENT_BYTES = 60 * 1024  # About 10 seconds of browser recorded opus
+
+
+class BenchmarkCase(NamedTuple):
+    name: str
+    run: Callable[[], object]
+    setup: Optional[Callable[[], None]] = None  # Before every timed run - runs once per round
+
+
+class SkipBenchmark(Exception):
+    pass
+
+
+## Extraction
+
+
+def get_sample_paragraph(index: int) -> str:
+    # Sentences with the brackets and parentheses the normalization removes
+    return " ".join(f"{SEGMENT_TEXT} (הערה {index}.{i}) [{i}]." for i in range(5))
+
+
+def extraction_cases() -> Iterator[BenchmarkCase]:
+    try:
+        from engines.extraction_engine import ExtractionEngine
+        from engines.nlp_pipeline import NlpPipeline
+
+        extraction_engine = ExtractionEngine(NlpPipeline())
+    except Exception as e:
+        raise SkipBenchmark(f"NLP pipeline not available ({e})")
+
+    for paragraphs_count in [1, 10, 100]:
+        text = "\r\n".join(get_sample_paragraph(i) for i in range(paragraphs_count))
+        yield BenchmarkCase(
+            f"extraction.normalize_and_segment_text[{paragraphs_count} paragraphs]",
+            lambda text=text: extraction_engine._normalize_and_segment_text(text),
+        )
+
+    for paragraphs_count in [100, 1000]:
+        body = "".join(
+            f"<h2>כותרת {i}</h2><p>{get_sample_paragraph(i)}</p><aside><p>{SEGMENT_TEXT}</p></aside>"
+            for i in range(paragraphs_count)
+        )
+        html = f"<html><head><title>עמוד</title></head><body><nav><p>ניווט</p></nav>{body}<footer/></body></html>"
+        html_bytes = html.encode("utf-8")
+        yield BenchmarkCase(
+            f"extraction.extract_text_document_from_html_file[{paragraphs_count} paragraphs]",
+            lambda html_bytes=html_bytes: extraction_engine._extract_text_document_from_html_file(
+                io.BytesIO(html_bytes)
+            ),
+        )
+
+
+## Aggregation
+
+
+class SyntheticAudioSegmentsRA(RecitalsRA):
+    def __init__(self, data_folder: str, segments_count: int) -> None:
+        super().__init__(session_factory=None, data_folder=data_folder, segment_writer=None)
+        self.segments = [
+            RecitalAudioSegment(
+                recital_session_id="bench_session",
+                sequential=i,
+                filename=get_session_file("bench_session", f"bench_session.webm.seg.{i}"),
+            )
+            for i in range(segments_count)
+        ]
+
+    def get_audio_segments(self, recital_session_id: str) -> list[RecitalAudioSegment]:
+        return self.segments
+
+
+def aggregation_cases(data_folder: str) -> Iterator[BenchmarkCase]:
+    recitals_content_ra = RecitalsContentRA(data_folder=data_folder, content_s3_bucket=None)
+    segment_data = os.urandom(AUDIO_SEGMENT_BYTES)
+
+    for segments_count in SEGMENTS_COUNTS:
+        captions_engine = AggregationEngine(
+            recitals_ra=SyntheticTextSegmentsRA(data_folder, segments_count),
+            recitals_content_ra=recitals_content_ra,
+            data_folder=data_folder,
+        )
+        yield BenchmarkCase(
+            f"aggregation.aggregate_session_captions[{segments_count} segments]",
+            lambda engine=captions_engine: "".join(engine.aggregate_session_captions("bench_session")),
+        )
+
+    for segments_count in SEGMENTS_COUNTS:
+        audio_segments_ra = SyntheticAudioSegmentsRA(data_folder, segments_count)
+        audio_engine = AggregationEngine(
+            recitals_ra=audio_segments_ra, recitals_content_ra=recitals_content_ra, data_folder=data_folder
+        )
+
+        # The segments are consumed by the aggregation - written again before each run
+        def write_segments(audio_segments_ra=audio_segments_ra) -> None:
+            for segment in audio_segments_ra.segments:
+                segment_path = Path(data_folder, segment.filename)
+                segment_path.parent.mkdir(parents=True, exist_ok=True)
+                segment_path.write_bytes(segment_data)
+
+        yield BenchmarkCase(
+            f"aggregation.aggregate_session_audio[{segments_count} segments]",
+            lambda engine=audio_engine: engine.aggregate_session_audio("bench_session"),
+            setup=write_segments,
+        )
+
+
+## Transform
+
+
+class SyntheticSessionRA(RecitalsRA):
+    def __init__(self, data_folder: str, source_audio_filename: str) -> None:
+        super().__init__(session_factory=None, data_folder=data_folder, segment_writer=None)
+        self.recital_session = RecitalSession(
+            id="bench_session", status=SessionStatus.AGGREGATED, source_audio_filename=source_audio_filename
+        )
+
+    def get_by_id(self, id: str) -> RecitalSession:
+        return self.recital_session
+
+
+def transform_cases(data_folder: str) -> Iterator[BenchmarkCase]:
+    if not shutil.which("ffmpeg"):
+        raise SkipBenchmark("ffmpeg not found")
+
+    recitals_content_ra = RecitalsContentRA(data_folder=data_folder, content_s3_bucket=None)
+    for duration_min in [1, 10]:
+        # As browsers record - opus in webm
+        source_audio_filename = get_session_file("bench_session", f"bench_session_{duration_min}m.webm")
+        source_audio_path = Path(data_folder, source_audio_filename)
+        source_audio_path.parent.mkdir(parents=True, exist_ok=True)
+        subprocess.run(
+            [
+                "ffmpeg",
+                "-y",
+                "-hide_banner",
+                "-loglevel",
+                "error",
+                "-f",
+                "lavfi",
+                "-i",
+                f"sine=frequency=440:duration={duration_min * 60}",
+                "-c:a",
+                "libopus",
+                "-b:a",
+                "48k",
+                str(source_audio_path),
+            ],
+            check=True,
+        )
+
+        transform_engine = TransformEngine(
+            recitals_ra=SyntheticSessionRA(data_folder, source_audio_filename),
+            recitals_content_ra=recitals_content_ra,
+            data_folder=data_folder,
+            transcode_scheduler=TranscodeScheduler(data_folder=data_folder),
+        )
+        yield BenchmarkCase(
+            f"transform.transcode_session_audio[{duration_min} min]",
+            lambda engine=transform_engine: engine.transcode_session_audio("bench_session"),
+        )
+
+
+## Stats cache
+
+
+def cache_cases() -> Iterator[BenchmarkCase]:
+    user_stats_key = stats_key_gen({"key_range": CacheKeys.user_stats}, StatsRA.user_stats)
+    leaderboard_key = stats_key_gen({"fixed_key": CacheKeys.leaderboard}, StatsRA.leader_board)
+    user_id = str(uuid.uuid4())
+    stats_ra = StatsRA(session_factory=None)
+
+    # Fast - timed in batches
+    yield BenchmarkCase(
+        "cache.stats_key_gen[user_stats x1000]", lambda: [user_stats_key(stats_ra, user_id) for _ in range(1000)]
+    )
+    yield BenchmarkCase(
+        "cache.stats_key_gen[fixed_key x1000]", lambda: [leaderboard_key(stats_ra, 10) for _ in range(1000)]
+    )
+    yield BenchmarkCase(
+        "cache.totals_hit[x1000]",
+        lambda: [stats_ra.totals() for _ in range(1000)],
+        setup=lambda: region.set(CacheKeys.totals, TotalStats(total_duration=0, total_recordings=0)),
+    )
+
+
+## Stats queries
+
+
+def seed_stats_db(db, users_count: int, sessions_per_user: int) -> None:
+    with db.session() as session:
+        seeded_users = session.exec(select(func.count(User.id)).where(User.email.like("bench-%"))).one()
+    if seeded_users >= users_count:
+        return
+
+    print(f"Seeding {users_count} users with {sessions_per_user} sessions each.")
+    # Core inserts - the model defaults of the date fields are not applied
+    now = datetime.now(timezone.utc)
+    with db.session() as session:
+        users = [
+            {
+                "id": uuid.uuid4(),
+                "email": f"bench-{i}@example.com",
+                "name": f"Bench {i}",
+                "picture": "",
+                "updated_at": now,
+            }
+            for i in range(seeded_users, users_count)
+        ]
+        session.execute(insert(User), users)
+        sessions = [
+            {
+                "id": uuid.uuid4().hex,
+                "user_id": user["id"],
+                # Most sessions end up uploaded - the others are in the finalization pipeline
+                "status": SessionStatus.UPLOADED if j % 10 else SessionStatus.ENDED,
+                "duration": 60.0 + (i * sessions_per_user + j) % 900,
+                "disavowed": False,
+                "updated_at": now,
+            }
+            for i, user in enumerate(users)
+            for j in range(sessions_per_user)
+        ]
+        for batch_start in range(0, len(sessions), 10000):
+            session.execute(insert(RecitalSession), sessions[batch_start : batch_start + 10000])
+        session.commit()
+
+
+def open_stats_db(args: argparse.Namespace):
+    if not args.stats_db:
+        raise SkipBenchmark("no --stats-db given")
+
+    # Imported only when used - it connects the async engine of the configured server DB
+    from models.database import Database
+
+    db = Database(args.stats_db)
+    db.create_database()
+    seed_stats_db(db, args.stats_users, args.stats_sessions_per_user)
+    return db
+
+
+def stats_cases(args: argparse.Namespace) -> Iterator[BenchmarkCase]:
+    db = open_stats_db(args)
+
+    stats_ra = StatsRA(session_factory=db.session)
+    with db.session() as session:
+        user_id = session.exec(select(User.id).where(User.email == "bench-0@example.com")).one()
+
+    # Uncached - the cache is cleared before each run
+    def clear_cache() -> None:
+        region.invalidate(hard=True)
+
+    yield BenchmarkCase("stats.user_stats", lambda: stats_ra.user_stats(user_id), setup=clear_cache)
+    yield BenchmarkCase("stats.leader_board", lambda: stats_ra.leader_board(10), setup=clear_cache)
+    yield BenchmarkCase("stats.totals", lambda: stats_ra.totals(), setup=clear_cache)
+
+
+## Cursor pagination
+
+
+def pagination_cases(args: argparse.Namespace) -> Iterator[BenchmarkCase]:
+    open_stats_db(args)
+
+    # Imported only when used - the CRUD utilities load the server routers
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    from routers.crud.utils import _get_multi_by_cursor
+    from routers.sessions import join_with_text_doc_config, session_crud
+
+    async_engine = create_async_engine(args.stats_db.replace("postgresql://", "postgresql+asyncpg://"))
+    loop = asyncio.new_event_loop()
+
+    def read_page(cursor: Optional[str], total_count_mode: Optional[str]) -> dict:
+        async def read() -> dict:
+            async with AsyncSession(async_engine) as db:
+                # As read by the sessions list endpoint
+                common_read_params = dict(
+                    db=db,
+                    schema_to_select=RecitalSessionRead,
+                    sort_columns=["duration"],
+                    sort_orders=["desc"],
+                    joins_config=[join_with_text_doc_config],
+                    nest_joins=True,
+                )
+                return await _get_multi_by_cursor(
+                    session_crud,
+                    session_crud.get_multi_joined,
+                    common_read_params,
+                    db=db,
+                    cursor=cursor,
+                    items_per_page=100,
+                    total_count_mode=total_count_mode,
+                    filters={"status": SessionStatus.UPLOADED},
+                )
+
+        return loop.run_until_complete(read())
+
+    # Every page reports the count of all matching rows - not of the rows past its cursor
+    first_page = read_page(None, "exact")
+    if not first_page["next_cursor"]:
+        raise AssertionError("The sessions list has a single page - seed more sessions")
+    second_page = read_page(first_page["next_cursor"], "exact")
+    if second_page["total_count"] != first_page["total_count"]:
+        raise AssertionError(
+            f"Page 2 reports {second_page['total_count']} rows in total, page 1 {first_page['total_count']}"
+        )
+
+    cursor = first_page["next_cursor"]
+    yield BenchmarkCase("pagination.sessions.next_page", lambda: read_page(cursor, None))
+    yield BenchmarkCase("pagination.sessions.next_page.exact_count", lambda: read_page(cursor, "exact"))
+    yield BenchmarkCase("pagination.sessions.next_page.estimated_count", lambda: read_page(cursor, "estimate"))
+
+
+## Runner
+
+
+def time_case(case: BenchmarkCase, rounds: int) -> dict:
+    if case.setup:
+        case.setup()
+    case.run()  # Warm up
+
+    timings = []
+    while len(timings) < rounds or sum(timings) < MIN_ROUND_SEC:
+        if case.setup:
+            case.setup()
+        started = time.perf_counter()
+        case.run()
+        timings.append(time.perf_counter() - started)
+    return {
+        "min_ms": min(timings) * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "rounds": len(timings),
+    }
+
+
+def get_cases(group: str, args: argparse.Namespace, data_folder: str) -> Iterator[BenchmarkCase]:
+    if group == "extraction":
+        return extraction_cases()
+    elif group == "aggregation":
+        return aggregation_cases(data_folder)
+    elif group == "transform":
+        return transform_cases(data_folder)
+    elif group == "cache":
+        return cache_cases()
+    elif group == "stats":
+        return stats_cases(args)
+    elif group == "pagination":
+        return pagination_cases(args)
+    raise ValueError(f"Unknown benchmark group: {group}")
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> int:
+    print(f"\nCompared to {baseline['version']} (min times):")
+    regressions = 0
+    for name, result in results.items():
+        baseline_result = baseline["results"].get(name)
+        if not baseline_result:
+            continue
+        ratio = result["min_ms"] / baseline_result["min_ms"]
+        regressed = ratio > threshold
+        regressions += regressed
+        print(
+            f"{name:<72} {baseline_result['min_ms']:>10.2f} -> {result['min_ms']:>10.2f} ms  x{ratio:5.2f}"
+            + ("  REGRESSION" if regressed else "")
+        )
+    return regressions
+
+
+if __name__ == "__main__":
+    groups = ["extraction", "aggregation", "transform", "cache", "stats", "pagination"]
+    parser = argparse.ArgumentParser(prog="hot_paths_bench.py", description="Server hot paths microbenchmarks")
+    parser.add_argument("--groups", nargs="+", choices=groups, default=groups)
+    parser.add_argument("--rounds", type=int, default=5, help="Minimum timed runs per case")
+    parser.add_argument("--save", nargs="?", const=str(RESULTS_FOLDER / f"{__version__}.json"), help="Results file")
+    parser.add_argument("--compare", help="Baseline results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Slowdown ratio reported as a regression")
+    parser.add_argument("--stats-db", help="Connection string of a dedicated Postgres DB for the stats queries")
+    parser.add_argument("--stats-users", type=int, default=2000)
+    parser.add_argument("--stats-sessions-per-user", type=int, default=25)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as data_folder:
+        for group in args.groups:
+            try:
+                for case in get_cases(group, args, data_folder):
+                    results[case.name] = time_case(case, args.rounds)
+                    result = results[case.name]
+                    print(
+                        f"{case.name:<72} min {result['min_ms']:>10.2f} ms"
+                        f" | median {result['median_ms']:>10.2f} ms | {result['rounds']:>5} rounds"
+                    )
+            except SkipBenchmark as e:
+                print(f"{group}: skipped - {e}")
+
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "version": __version__,
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+        print(f"\nSaved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(results, json.load(f), args.threshold):
+                raise SystemExit(1)
@@ -0,0 +1,311 @@
+"""
+End-to-end load test - simulated speakers record sessions against a running server.
+Each speaker creates a session, uploads audio segments (resumable PATCH + commit, as the web client)
+and text segments at a recording cadence, ends the session and then polls its preview and the stats.
+Reports throughput, latency percentiles and error rates per endpoint.
+
+Start the server against a dedicated local Postgres DB with S3 uploads disabled
+(the async CRUD stack requires Postgres - SQLite is not supported), e.g. from the repo root:
+
+    CONTENT_DISABLE_S3_UPLOAD=True uvicorn --app-dir=server application:app
+
+Then run from the server folder - speakers are seeded directly in the server DB (same .env):
+
+    python -m benchmarks.load_test --speakers 20 --duration 300
+
+--time-scale compresses the recording cadence (e.g. 0.1 records a 10 second segment every second).
+Synthetic audio segments are generated with ffmpeg (lavfi sine source, webm/opus as browsers record).
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import subprocess
+import time
+from collections import defaultdict
+from datetime import timedelta
+from typing import Optional
+
+import httpx
+
+from configuration import configure
+from containers import Container
+from models.user import UserGroups
+from utility.authentication.users import (
+    create_access_token_payload_from_user,
+    create_empty_speaker_user,
+    encode_access_token,
+)
+
+SPEAKER_EMAIL_TEMPLATE = "load-test-speaker-{}@example.com"
+AUDIO_MIME_TYPE = "audio/webm;codecs=opus"
+SAMPLE_SENTENCE = "שלום עולם, זהו משפט לדוגמה שמוקרא בהקלטה אחת מתוך רבות"
+
+
+def seed_speakers(count: int) -> list[str]:
+    # Approved speakers with access tokens good for the test - created once, reused by later runs
+    container = configure(Container())
+    container.db().create_database()
+    users_ra = container.users_ra()
+
+    access_tokens = []
+    for i in range(count):
+        email = SPEAKER_EMAIL_TEMPLATE.format(i)
+        user = users_ra.get_by_email(email)
+        if not user:
+            user = create_empty_speaker_user(email)
+        user.group = UserGroups.SPEAKER
+        users_ra.upsert(user)
+
+        user = users_ra.get_by_email(email)
+        access_tokens.append(
+            encode_access_token(
+                create_access_token_payload_from_user(user).model_dump(),
+                expires_delta=timedelta(days=1),
+                access_token_secret_key=container.config.auth.access_token_secret_key(),
+            )
+        )
+    return access_tokens
+
+
+def generate_audio_segment(duration: float, frequency: int) -> bytes:
+    return subprocess.run(
+        [
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-f",
+            "lavfi",
+            "-i",
+            f"sine=frequency={frequency}:duration={duration}",
+            "-c:a",
+            "libopus",
+            "-b:a",
+            "48k",
+            "-f",
+            "webm",
+            "pipe:1",
+        ],
+        check=True,
+        capture_output=True,
+    ).stdout
+
+
+class LoadStats:
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.statuses: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.started = time.perf_counter()
+        self.ended: Optional[float] = None
+
+    def add(self, endpoint: str, latency: float, status: str, failed: bool) -> None:
+        self.latencies[endpoint].append(latency)
+        self.statuses[endpoint][status] += 1
+        if failed:
+            self.errors[endpoint] += 1
+
+    def get_report(self) -> list[dict]:
+        elapsed = (self.ended or time.perf_counter()) - self.started
+        report = []
+        for endpoint, latencies in sorted(self.latencies.items()):
+            percentiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else None
+            report.append(
+                {
+                    "endpoint": endpoint,
+                    "requests": len(latencies),
+                    "rps": len(latencies) / elapsed,
+                    "error_rate": self.errors[endpoint] / len(latencies),
+                    "p50_ms": (percentiles[49] if percentiles else latencies[0]) * 1000,
+                    "p90_ms": (percentiles[89] if percentiles else latencies[0]) * 1000,
+                    "p99_ms": (percentiles[98] if percentiles else latencies[0]) * 1000,
+                    "max_ms": max(latencies) * 1000,
+                    "statuses": dict(self.statuses[endpoint]),
+                }
+            )
+        return report
+
+    def print_report(self) -> None:
+        elapsed = (self.ended or time.perf_counter()) - self.started
+        print(f"\n{'endpoint':<64} {'reqs':>7} {'rps':>7} {'err%':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+        for row in self.get_report():
+            print(
+                f"{row['endpoint']:<64} {row['requests']:>7} {row['rps']:>7.2f} {row['error_rate'] * 100:>6.1f}"
+                f" {row['p50_ms']:>8.1f} {row['p90_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}"
+            )
+        total_requests = sum(len(latencies) for latencies in self.latencies.values())
+        total_errors = sum(self.errors.values())
+        print(
+            f"\n{total_requests} requests in {elapsed:.1f} sec ({total_requests / elapsed:.2f} rps),"
+            f" {total_errors} errors ({total_errors / max(total_requests, 1) * 100:.2f}%) - latencies in ms"
+        )
+
+
+class SimulatedSpeaker:
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        stats: LoadStats,
+        access_token: str,
+        audio_segment: bytes,
+        args: argparse.Namespace,
+        rng: random.Random,
+    ) -> None:
+        self.client = client
+        self.stats = stats
+        self.headers = {"Authorization": f"Bearer {access_token}"}
+        self.audio_segment = audio_segment
+        self.args = args
+        self.rng = rng
+
+    async def request(self, endpoint: str, method: str, url: str, ok_statuses=(200,), **kwargs) -> httpx.Response:
+        # The endpoint is the route template - the report groups by it
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(
+                method, url, headers={**self.headers, **kwargs.pop("headers", {})}, **kwargs
+            )
+        except httpx.HTTPError as e:
+            self.stats.add(endpoint, time.perf_counter() - started, type(e).__name__, failed=True)
+            return None
+        self.stats.add(
+            endpoint, time.perf_counter() - started, str(response.status_code), response.status_code not in ok_statuses
+        )
+        return response
+
+    async def sleep(self, seconds: float) -> None:
+        await asyncio.sleep(seconds * self.args.time_scale)
+
+    async def upload_audio_segment(self, session_id: str, segment_id: int) -> None:
+        segment_url = f"/sessions/{session_id}/audio-segments/{segment_id}"
+        response = await self.request(
+            "PATCH /sessions/{session_id}/audio-segments/{segment_id}",
+            "PATCH",
+            segment_url,
+            content=self.audio_segment,
+            headers={"Upload-Offset": "0", "Content-Type": "application/octet-stream"},
+        )
+        if response is None or response.status_code != 200:
+            return
+        await self.request(
+            "POST /sessions/{session_id}/audio-segments/{segment_id}/commit",
+            "POST",
+            f"{segment_url}/commit",
+            json={"size": len(self.audio_segment), "mime_type": AUDIO_MIME_TYPE},
+        )
+
+    async def upload_text_segments(self, session_id: str, recording_started: float) -> None:
+        # A sentence every few seconds - as the speaker advances through the text
+        sentence_index = 0
+        while True:
+            await self.sleep(self.rng.uniform(*self.args.text_interval))
+            seek_end = (time.perf_counter() - recording_started) / self.args.time_scale
+            await self.request(
+                "POST /sessions/{session_id}/upload-text-segment",
+                "POST",
+                f"/sessions/{session_id}/upload-text-segment",
+                json={"seek_end": seek_end, "text": f"{SAMPLE_SENTENCE} {sentence_index}"},
+            )
+            sentence_index += 1
+
+    async def record_session(self) -> None:
+        response = await self.request("PUT /sessions", "PUT", "/sessions", json={"document_id": None})
+        if response is None or response.status_code != 200:
+            await self.sleep(self.args.segment_sec)  # Back off - do not spin on a failing server
+            return
+        session_id = response.json()["session_id"]
+
+        recording_started = time.perf_counter()
+        text_uploader = asyncio.create_task(self.upload_text_segments(session_id, recording_started))
+        audio_uploads = []
+        try:
+            for segment_id in range(self.rng.randint(*self.args.session_segments)):
+                # A segment is uploaded as soon as it was recorded - the recording goes on meanwhile
+                await self.sleep(self.args.segment_sec)
+                audio_uploads.append(asyncio.create_task(self.upload_audio_segment(session_id, segment_id)))
+            await asyncio.gather(*audio_uploads)
+        finally:
+            text_uploader.cancel()
+            for audio_upload in audio_uploads:
+                audio_upload.cancel()
+
+        await self.request("POST /sessions/{session_id}/end", "POST", f"/sessions/{session_id}/end")
+
+        # The speaker waits on the preview while the stats screens refresh
+        for _ in range(self.args.preview_polls):
+            await self.sleep(self.args.preview_poll_interval)
+            await self.request("GET /sessions/{session_id}/preview", "GET", f"/sessions/{session_id}/preview")
+        await self.request("GET /stats/me", "GET", "/stats/me", ok_statuses=(200, 304))
+        await self.request("GET /stats/totals", "GET", "/stats/totals", ok_statuses=(200, 304))
+        await self.request("GET /stats/leaderboard", "GET", "/stats/leaderboard", ok_statuses=(200, 304))
+
+    async def run(self, start_delay: float, deadline: float) -> None:
+        await asyncio.sleep(start_delay)
+        while time.perf_counter() < deadline:
+            await self.record_session()
+
+
+async def run_load_test(args: argparse.Namespace, access_tokens: list[str], audio_segments: list[bytes]) -> LoadStats:
+    stats = LoadStats()
+    limits = httpx.Limits(max_connections=args.speakers * 2, max_keepalive_connections=args.speakers * 2)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        deadline = time.perf_counter() + args.duration
+        speakers = [
+            SimulatedSpeaker(
+                client,
+                stats,
+                access_token,
+                audio_segments[i % len(audio_segments)],
+                args,
+                random.Random(args.seed + i),
+            )
+            for i, access_token in enumerate(access_tokens)
+        ]
+        speaker_tasks = [
+            asyncio.create_task(speaker.run(args.ramp_up * i / len(speakers), deadline))
+            for i, speaker in enumerate(speakers)
+        ]
+        # Sessions in progress at the deadline are cut short - not waited for
+        await asyncio.wait(speaker_tasks, timeout=max(deadline - time.perf_counter(), 0))
+        for speaker_task in speaker_tasks:
+            speaker_task.cancel()
+        await asyncio.gather(*speaker_tasks, return_exceptions=True)
+    stats.ended = time.perf_counter()
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="load_test.py", description="Simulated speakers load test")
+    parser.add_argument("--base-url", default="http://localhost:8000/api", help="API root of the server under test")
+    parser.add_argument("--speakers", type=int, default=10, help="Concurrent recording speakers")
+    parser.add_argument("--duration", type=float, default=120, help="Test duration in seconds")
+    parser.add_argument("--ramp-up", type=float, default=10, help="Seconds over which the speakers start")
+    parser.add_argument("--segment-sec", type=float, default=10, help="Length of recorded audio segments")
+    parser.add_argument("--session-segments", type=int, nargs=2, default=[6, 18], help="Min/max segments per session")
+    parser.add_argument(
+        "--text-interval", type=float, nargs=2, default=[2, 8], help="Min/max seconds between sentences"
+    )
+    parser.add_argument("--preview-polls", type=int, default=3, help="Preview polls after each session ends")
+    parser.add_argument("--preview-poll-interval", type=float, default=5, help="Seconds between preview polls")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Multiplies all recording cadence waits")
+    parser.add_argument("--timeout", type=float, default=30, help="Request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the speakers' cadence")
+    parser.add_argument("--report-json", help="Also write the per endpoint report to this file")
+    args = parser.parse_args()
+
+    print(f"Seeding {args.speakers} speakers.")
+    access_tokens = seed_speakers(args.speakers)
+    print("Generating audio segments.")
+    # A few distinct tones - not every speaker uploads the very same bytes
+    audio_segments = [generate_audio_segment(args.segment_sec, 220 + 110 * i) for i in range(4)]
+
+    print(f"Running for {args.duration:.0f} sec against {args.base_url}.")
+    stats = asyncio.run(run_load_test(args, access_tokens, audio_segments))
+    stats.print_report()
+
+    if args.report_json:
+        with open(args.report_json, "w") as f:
+            json.dump({"args": vars(args), "endpoints": stats.get_report()}, f, indent=2)
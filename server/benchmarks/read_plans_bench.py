@@ -0,0 +1,51 @@
+"""
+Compares the per-request read planning cost of the generated CRUD list endpoints
+with and without the read plan cache.
+
+Run from the server folder:
+
+    python -m benchmarks.read_plans_bench --requests 20000
+"""
+
+import argparse
+import gc
+import time
+
+from models.recital_session import RecitalSession, RecitalSessionRead
+from models.text_document import TextDocument, TextDocumentListRead
+from routers.crud.read_plans import _build_schema_to_select, extend_schema_to_select, read_plan_cache_info
+
+# Representative "extraColumns" sent by the admin tables
+REQUESTS = [
+    (RecitalSession, RecitalSessionRead, ["user_id"]),
+    (RecitalSession, RecitalSessionRead, ["user_id", "source_audio_filename"]),
+    (TextDocument, TextDocumentListRead, ["owner_id"]),
+]
+
+
+def uncached_extend_schema_to_select(model, schema_to_select, extra_columns):
+    # The planning done on every request before the read plan cache
+    requested_columns = set(extra_columns)
+    normalized_columns = tuple(field for field in model.model_fields.keys() if field in requested_columns)
+    return _build_schema_to_select.__wrapped__(model, schema_to_select, normalized_columns)
+
+
+def run(plan_fn, requests: int) -> float:
+    gc.collect()
+    started = time.perf_counter()
+    for i in range(requests):
+        model, schema_to_select, extra_columns = REQUESTS[i % len(REQUESTS)]
+        plan_fn(model, schema_to_select, extra_columns)
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="read_plans_bench.py", description="Read plan cache benchmark")
+    parser.add_argument("--requests", type=int, default=20000, help="Number of simulated list requests")
+    args = parser.parse_args()
+
+    for name, plan_fn in [("uncached", uncached_extend_schema_to_select), ("cached", extend_schema_to_select)]:
+        elapsed = run(plan_fn, args.requests)
+        print(f"{name:>9}: {args.requests / elapsed:12.0f} plans/sec ({elapsed * 1e6 / args.requests:8.2f} us/request)")
+
+    print(read_plan_cache_info())
@@ -2,6 +2,8 @@ import logging
 
 from environs import Env
 
+from utility.query_stats import configure_slow_query_log
+from utility.tracing import configure_tracing
 from version import __version__
 
 env = Env()
@@ -36,6 +38,14 @@ def configure(container: "Container"):
     container.config.data.root_folder.from_value(env("ROOT_DATA_FOLDER", default="data"))
     container.config.data.content_s3_bucket.from_value(env("CONTENT_STORAGE_S3_BUCKET"))
     container.config.data.content_s3_disabled.from_value(env.bool("CONTENT_DISABLE_S3_UPLOAD", default=False))
+    container.config.data.content_s3_stream_segments.from_value(
+        env.bool("CONTENT_STREAM_SEGMENTS_TO_S3", default=False)
+    )
+    container.config.data.content_s3_direct_segment_uploads.from_value(
+        env.bool("CONTENT_DIRECT_SEGMENT_UPLOADS", default=False)
+    )
+    container.config.data.upload_min_free_mb.from_value(env.int("DATA_FOLDER_UPLOAD_MIN_FREE_MB", default=1024))
+    container.config.data.gc_min_free_mb.from_value(env.int("DATA_FOLDER_GC_MIN_FREE_MB", default=4096))
 
     container.config.help.basic_guide_yt_video_id.from_value(env("HELP_BASIC_GUIDE_YT_VIDEO_ID", default=None))
 
@@ -45,14 +55,48 @@ def configure(container: "Container"):
     container.config.jobs.session_finalization.interval_sec.from_value(
         env.int("JOB_SESSION_FINALIZATION_INTERVAL_SEC", default=120)
     )
+    container.config.jobs.session_finalization.max_attempts.from_value(
+        env.int("JOB_SESSION_FINALIZATION_MAX_ATTEMPTS", default=5)
+    )
+    container.config.jobs.session_finalization.backoff_base_sec.from_value(
+        env.int("JOB_SESSION_FINALIZATION_BACKOFF_BASE_SEC", default=120)
+    )
+
+    container.config.jobs.data_folder_gc.disabled.from_value(env.bool("JOB_DATA_FOLDER_GC_DISABLED", default=False))
+    container.config.jobs.data_folder_gc.interval_sec.from_value(
+        env.int("JOB_DATA_FOLDER_GC_INTERVAL_SEC", default=3600)
+    )
+    container.config.jobs.data_folder_gc.grace_period_sec.from_value(
+        env.int("JOB_DATA_FOLDER_GC_GRACE_PERIOD_SEC", default=6 * 3600)
+    )
+    container.config.jobs.data_folder_gc.session_span_retention_days.from_value(
+        env.int("JOB_DATA_FOLDER_GC_SESSION_SPAN_RETENTION_DAYS", default=30)
+    )
+
+    container.config.transcode.max_concurrency.from_value(env.int("TRANSCODE_MAX_CONCURRENCY", default=2))
+    container.config.transcode.threads.from_value(env.int("TRANSCODE_THREADS", default=2))
+    container.config.transcode.niceness.from_value(env.int("TRANSCODE_NICENESS", default=10))
+    container.config.transcode.max_load_per_cpu.from_value(env.float("TRANSCODE_MAX_LOAD_PER_CPU", default=0.75))
+    container.config.transcode.max_wait_sec.from_value(env.int("TRANSCODE_MAX_WAIT_SEC", default=60))
 
     container.config.analytics.posthog.api_key.from_value(env("PUBLIC_POSTHOG_KEY"))
     container.config.analytics.posthog.host.from_value(env("PUBLIC_POSTHOG_HOST"))
 
     container.config.client.disable_soup.from_value(env.bool("DISABLE_SOUP", default=False))
 
+    container.config.metrics.access_token.from_value(env("METRICS_ACCESS_TOKEN", default=None))
+
+    container.config.tracing.exporter.from_value(env("TRACING_EXPORTER", default=None))
+    container.config.tracing.export_file.from_value(env("TRACING_EXPORT_FILE", default="traces.jsonl"))
+
+    container.config.db.slow_query_threshold_ms.from_value(env.int("DB_SLOW_QUERY_THRESHOLD_MS", default=500))
+
     container.config.debug_mode.from_value(env.bool("DEBUG", default=False))
 
     configure_logging(container)
+    configure_slow_query_log(container.config.db.slow_query_threshold_ms())
+    configure_tracing(
+        container.config.tracing.exporter(), container.config.tracing.export_file(), container.config.version()
+    )
 
     return container
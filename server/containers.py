@@ -4,17 +4,21 @@ from engines.aggregation_engine import AggregationEngine
 from engines.extraction_engine import ExtractionEngine
 from engines.nlp_pipeline import NlpPipeline
 from engines.transform_engine import TransformEngine
+from managers.data_folder_manager import DataFolderManager
 from managers.document_manager import DocumentManager
 from managers.recital_manager import RecitalManager
 from models.database import Database
 from resource_access.documents_ra import DocumentsRA
+from resource_access.group_commit_writer import GroupCommitWriter
 from resource_access.recitals_content_ra import RecitalsContentRA
 from resource_access.recitals_ra import RecitalsRA
 from resource_access.stats_ra import StatsRA
 from resource_access.users_ra import UsersRA
 from utility.analytics.posthog import ConfiguredPosthog
 from utility.communication.email import Emailer
+from utility.profiling import ProfileStore
 from utility.scheduler import JobScheduler
+from utility.transcode_scheduler import TranscodeScheduler
 
 
 class Container(containers.DeclarativeContainer):
@@ -35,16 +39,25 @@ class Container(containers.DeclarativeContainer):
 
     db = providers.Singleton(Database, connection_str=config.db.connection_str)
     job_scheduler = providers.Singleton(JobScheduler)
+    profile_store = providers.Singleton(ProfileStore, data_folder=config.data.root_folder)
 
     documents_ra = providers.Factory(
         DocumentsRA,
         session_factory=db.provided.session,
     )
+    segment_writer = providers.Singleton(GroupCommitWriter, session_factory=db.provided.session)
     recitals_ra = providers.Factory(
-        RecitalsRA, session_factory=db.provided.session, data_folder=config.data.root_folder
+        RecitalsRA,
+        session_factory=db.provided.session,
+        data_folder=config.data.root_folder,
+        segment_writer=segment_writer,
     )
     recitals_content_ra = providers.Factory(
-        RecitalsContentRA, data_folder=config.data.root_folder, content_s3_bucket=config.data.content_s3_bucket
+        RecitalsContentRA,
+        data_folder=config.data.root_folder,
+        content_s3_bucket=config.data.content_s3_bucket,
+        stream_segments_to_storage=config.data.content_s3_stream_segments,
+        direct_segment_uploads=config.data.content_s3_direct_segment_uploads,
     )
     users_ra = providers.Factory(
         UsersRA,
@@ -58,9 +71,27 @@ class Container(containers.DeclarativeContainer):
     nlp_pipeline = providers.Singleton(NlpPipeline)
 
     extraction_engine = providers.Factory(ExtractionEngine, nlp_pipeline=nlp_pipeline)
-    transform_engine = providers.Factory(TransformEngine, recitals_ra=recitals_ra, data_folder=config.data.root_folder)
+    transcode_scheduler = providers.Singleton(
+        TranscodeScheduler,
+        data_folder=config.data.root_folder,
+        max_concurrency=config.transcode.max_concurrency,
+        threads=config.transcode.threads,
+        niceness=config.transcode.niceness,
+        max_load_per_cpu=config.transcode.max_load_per_cpu,
+        max_wait_sec=config.transcode.max_wait_sec,
+    )
+    transform_engine = providers.Factory(
+        TransformEngine,
+        recitals_ra=recitals_ra,
+        recitals_content_ra=recitals_content_ra,
+        data_folder=config.data.root_folder,
+        transcode_scheduler=transcode_scheduler,
+    )
     aggregation_engine = providers.Factory(
-        AggregationEngine, recitals_ra=recitals_ra, data_folder=config.data.root_folder
+        AggregationEngine,
+        recitals_ra=recitals_ra,
+        recitals_content_ra=recitals_content_ra,
+        data_folder=config.data.root_folder,
     )
 
     document_manager = providers.Singleton(
@@ -73,6 +104,8 @@ class Container(containers.DeclarativeContainer):
         RecitalManager,
         session_finalization_job_disabled=config.jobs.session_finalization.disabled,
         session_finalization_job_interval=config.jobs.session_finalization.interval_sec,
+        session_finalization_max_attempts=config.jobs.session_finalization.max_attempts,
+        session_finalization_backoff_base=config.jobs.session_finalization.backoff_base_sec,
         disable_s3_upload=config.data.content_s3_disabled,
         posthog=posthog,
         job_scheduler=job_scheduler,
@@ -81,3 +114,18 @@ class Container(containers.DeclarativeContainer):
         aggregation_engine=aggregation_engine,
         transform_engine=transform_engine,
     )
+
+    data_folder_manager = providers.Singleton(
+        DataFolderManager,
+        gc_job_disabled=config.jobs.data_folder_gc.disabled,
+        gc_job_interval=config.jobs.data_folder_gc.interval_sec,
+        gc_grace_period=config.jobs.data_folder_gc.grace_period_sec,
+        session_span_retention_days=config.jobs.data_folder_gc.session_span_retention_days,
+        upload_min_free_mb=config.data.upload_min_free_mb,
+        gc_min_free_mb=config.data.gc_min_free_mb,
+        disable_s3_upload=config.data.content_s3_disabled,
+        posthog=posthog,
+        job_scheduler=job_scheduler,
+        recitals_ra=recitals_ra,
+        recitals_content_ra=recitals_content_ra,
+    )
@@ -4,13 +4,14 @@ import pathlib
 import re
 import shutil
 import subprocess
-from datetime import datetime, timezone
 from pathlib import Path
+from typing import Iterator
 
-from webvtt import Caption, WebVTT
-
-from models.recital_text_segment import RecitalTextSegment
+from errors import MixedAudioSegmentsError
+from resource_access.recitals_content_ra import RecitalsContentRA
 from resource_access.recitals_ra import RecitalsRA
+from utility import tracing
+from utility.data_layout import get_session_folder
 
 
 def normalize_text_as_caption_text(text: str) -> str:
@@ -18,17 +19,18 @@ def normalize_text_as_caption_text(text: str) -> str:
 
 
 def get_caption_time_string(seconds: float) -> str:
-    # Format to hh:mm:ss.zzz
-    return datetime.fromtimestamp(seconds, tz=timezone.utc).strftime("%H:%M:%S.%f")[:-3]
+    # Format to hh:mm:ss.zzz - hours keep counting past a day
+    total_millis = round(seconds * 1000)
+    hours, total_millis = divmod(total_millis, 3_600_000)
+    minutes, total_millis = divmod(total_millis, 60_000)
+    secs, millis = divmod(total_millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
 
 
-def create_caption(text: str, start: float, end: float) -> Caption:
-    return Caption(
-        # Format to hh:mm:ss.zzz
-        start=get_caption_time_string(start),
-        end=get_caption_time_string(end),
-        text=normalize_text_as_caption_text(text),
-    )
+def format_caption(text: str, start: float, end: float) -> str:
+    caption = f"{get_caption_time_string(start)} --> {get_caption_time_string(end)}"
+    text = normalize_text_as_caption_text(text)
+    return f"{caption}\n{text}" if text else caption
 
 
 def parse_audio_info(audio_info):
@@ -65,40 +67,51 @@ def get_audio_properties(input_file):
 
 
 class AggregationEngine:
-    def __init__(self, recitals_ra: RecitalsRA, data_folder: str) -> None:
+    def __init__(self, recitals_ra: RecitalsRA, recitals_content_ra: RecitalsContentRA, data_folder: str) -> None:
         self.recitals_ra = recitals_ra
+        self.recitals_content_ra = recitals_content_ra
         self.data_folder = data_folder
 
-    def aggregate_session_captions(self, session_id: str, format: str = "vtt") -> str:
+    def aggregate_session_captions(self, session_id: str, format: str = "vtt") -> Iterator[str]:
+        # Streams the captions file content one caption at a time - memory use does not
+        # depend on the session length. Yields nothing if the session has no text segments.
         if not format == "vtt":
             raise ValueError("Only `vtt` format is supported")
 
-        vtt = WebVTT()
-
-        vtt.header_comments.append("IVRIT.AI Recital Session Captions")
-        vtt.header_comments.append(f"Session ID: {session_id}")
-
-        prev_seek = 0
-        for text_segment in self.recitals_ra.get_session_text_segments(session_id):
-            text_segment: RecitalTextSegment = text_segment
-            vtt.captions.append(
-                create_caption(
-                    text_segment.text,
-                    prev_seek,
-                    text_segment.seek_end,
-                )
-            )
-            prev_seek = text_segment.seek_end
-
-        if prev_seek == 0:
-            return None
+        prev_seek = None
+        for seek_end, text in self.recitals_ra.iter_session_text_segments(session_id):
+            if prev_seek is None:
+                yield "WEBVTT\n\n"
+                yield "NOTE IVRIT.AI Recital Session Captions\n\n"
+                yield f"NOTE Session ID: {session_id}\n\n"
+                yield format_caption(text, 0, seek_end)
+            else:
+                yield "\n\n" + format_caption(text, prev_seek, seek_end)
+            prev_seek = seek_end
 
-        return vtt.content
+        if prev_seek is not None:
+            yield "\n"
 
     def _get_audio_segment_file_names(self, session_id: str) -> list[str]:
         audio_segments = self.recitals_ra.get_audio_segments(session_id)
         maybe_audio_segments_filenames = [segment.filename for segment in audio_segments]
 
+        # Segments streamed to the storage are aggregated there
+        stored_audio_segments_keys = [
+            f for f in maybe_audio_segments_filenames if self.recitals_content_ra.is_storage_key(session_id, f)
+        ]
+        # Recorded while CONTENT_STREAM_SEGMENTS_TO_S3 was switched - either side alone would drop audio
+        # and misalign it with the captions, so the session fails finalization and is left to an admin
+        if stored_audio_segments_keys and len(stored_audio_segments_keys) != len(maybe_audio_segments_filenames):
+            raise MixedAudioSegmentsError(
+                f"{len(stored_audio_segments_keys)} of the {len(maybe_audio_segments_filenames)} audio segments"
+                " are in the storage - the others are local"
+            )
+        if stored_audio_segments_keys:
+            # Keep the ones we can find - a single listing of the session segments
+            existing_keys = self.recitals_content_ra.list_storage_keys(f"{session_id}/segments/")
+            return [f for f in stored_audio_segments_keys if f in existing_keys]
+
         # Check the existence of the segment file names.
         # Keep the ones we can find
         return [f for f in maybe_audio_segments_filenames if Path(self.data_folder, f).exists()]
@@ -108,31 +121,66 @@ class AggregationEngine:
             os.remove(Path(self.data_folder, seg_filename))
 
     def delete_session_audio(self, session_id: str) -> None:
-        # Find all files that start with the session_id and end with .seg.*
-        # and delete them
+        # Find all files of the session which end with .seg.* and delete them
         # We do not rely on the recorded audio segments since we want to clear as much data
         # from the local storage as possible for this session
-        for file_to_del in pathlib.Path(self.data_folder).glob(f"{session_id}*.seg.*"):
-            os.remove(file_to_del)
+        # Only the session folder is listed - not the whole data folder
+        folders = [pathlib.Path(self.data_folder, get_session_folder(session_id))]
+        # Until the data layout is migrated - segments of the flat legacy layout may still be there
+        if self.recitals_content_ra.has_flat_layout_files():
+            folders.append(pathlib.Path(self.data_folder))
+        for folder in folders:
+            for file_to_del in folder.glob(f"{session_id}*.seg.*"):
+                os.remove(file_to_del)
 
     def aggregate_session_audio(self, session_id: str) -> str:
-        audio_segments_filenames = self._get_audio_segment_file_names(session_id)
+        with tracing.span("aggregate.audio.list_segments") as list_span:
+            audio_segments_filenames = self._get_audio_segment_file_names(session_id)
+            list_span.set_attributes(segments=len(audio_segments_filenames))
 
         if len(audio_segments_filenames) == 0:
             return None
 
         first_audio_segment_filename = audio_segments_filenames[0]
 
+        if self.recitals_content_ra.is_storage_key(session_id, first_audio_segment_filename):
+            return self._aggregate_stored_session_audio(session_id, audio_segments_filenames)
+
         # Get the base file name that will represent concatenated segments data
         concatenated_filename = re.sub(r"\.seg\..*", "", first_audio_segment_filename)
 
         # Concat all segments into a single file
-        with open(Path(self.data_folder, concatenated_filename), "wb") as concat_file:
-            for seg_filename in audio_segments_filenames:
-                with open(Path(self.data_folder, seg_filename), "rb") as seg_file:
-                    shutil.copyfileobj(seg_file, concat_file)
+        with tracing.span("aggregate.audio.concat") as concat_span:
+            with open(Path(self.data_folder, concatenated_filename), "wb") as concat_file:
+                for seg_filename in audio_segments_filenames:
+                    with open(Path(self.data_folder, seg_filename), "rb") as seg_file:
+                        shutil.copyfileobj(seg_file, concat_file)
+                concat_span.set_attributes(bytes=concat_file.tell())
 
         # Delete all segments files - now they are stored into a single file
-        self._delete_audio_segment_file_names(audio_segments_filenames)
+        with tracing.span("aggregate.audio.delete_segments"):
+            self._delete_audio_segment_file_names(audio_segments_filenames)
 
         return concatenated_filename
+
+    def _aggregate_stored_session_audio(self, session_id: str, audio_segments_keys: list[str]) -> str:
+        source_audio_key = self.recitals_content_ra.get_audio_storage_key(
+            session_id, audio_segments_keys[0], "source.audio"
+        )
+
+        # Concat all segments into a single stored object - streamed in order as the parts of a multipart upload
+        with tracing.span("aggregate.audio.concat"):
+            if not self.recitals_content_ra.concat_in_storage(
+                audio_segments_keys,
+                source_audio_key,
+                metadata=self.recitals_content_ra.get_session_object_metadata(session_id),
+            ):
+                raise Exception("Error concatenating session audio segments in storage")
+
+        # Delete all segments objects - now they are stored into a single object
+        with tracing.span("aggregate.audio.delete_segments"):
+            failures = self.recitals_content_ra.delete_from_storage(audio_segments_keys)
+        if failures:
+            print(f"Warning - {len(failures)} audio segments of session {session_id} were not deleted from storage")
+
+        return source_audio_key
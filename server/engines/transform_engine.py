@@ -1,93 +1,305 @@
+import fcntl
 import json
 import os
 import subprocess
+import threading
 from pathlib import Path
+from typing import Optional
 
+from resource_access.recitals_content_ra import RecitalsContentRA
 from resource_access.recitals_ra import RecitalsRA
+from utility import tracing
+from utility.data_layout import get_session_file
+from utility.metrics import MEDIA_TOOL_DURATION
+from utility.transcode_scheduler import TranscodeScheduler
+
+# Enough of the head of a stored audio to probe its codec
+STORED_AUDIO_PROBE_BYTES = 1024 * 1024
+
+# Linux ioctl sharing the data of one file with another, copy on write (btrfs, xfs and others)
+FICLONE = 0x40049409
 
 
 def parse_audio_info(audio_info):
     if audio_info is not None and "streams" in audio_info:
+        audio_format = audio_info.get("format", {})
         for stream in audio_info["streams"]:
             if stream["codec_type"] == "audio":
                 codec_name = str(stream["codec_name"])
                 channels = int(stream["channels"])
-                return {"channels": channels, "codec_name": codec_name}
+                return {
+                    "channels": channels,
+                    "codec_name": codec_name,
+                    "format_name": str(audio_format.get("format_name", "")),
+                }
     return None
 
 
+def probe_audio_properties(input, input_data: bytes = None):
+    # Run ffprobe to get audio properties in JSON format
+    cmd = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-print_format",
+        "json",
+        "-show_format",
+        "-show_streams",
+        "-select_streams",
+        "a",
+        input,
+    ]
+    with tracing.span("transcode.probe") as probe_span:
+        with MEDIA_TOOL_DURATION.labels("ffprobe", "probe").time():
+            result = subprocess.run(cmd, input=input_data, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+        output = result.stdout
+
+        # Parse the JSON output
+        info = None
+        try:
+            raw_info = json.loads(output)
+            info = parse_audio_info(raw_info)
+        except:
+            print("Warning - Unable to probe input audio source properties...")
+            pass
+
+        if info:
+            probe_span.set_attributes(codec=info["codec_name"], channels=info["channels"])
+
+    return info
+
+
 def get_audio_properties(input_file):
     # Check if the file exists
     if not os.path.isfile(input_file):
         print("Warning - Input audio file does not exist...", input_file)
         return None
 
-    # Run ffprobe to get audio properties in JSON format
-    cmd = ["ffprobe", "-v", "error", "-print_format", "json", "-show_streams", "-select_streams", "a", input_file]
-    result = subprocess.run(cmd, stderr=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
-    output = result.stdout
+    return probe_audio_properties(str(input_file))
 
-    # Parse the JSON output
-    info = None
+
+def get_output_audio_file_extension(audio_info) -> str:
+    output_audio_file_extension = "mka"  # Very generic - can take almost any encoding
+    if audio_info is not None:
+        if audio_info["codec_name"] == "vorbis":  # Place in a webm container
+            output_audio_file_extension = "webm"
+    return output_audio_file_extension
+
+
+def is_output_audio_container(audio_info, output_audio_file_extension: str) -> bool:
+    # Browsers record webm - a matroska container, lacking only its duration and index (cues).
+    # The "-acodec copy" remux into mka / webm writes those - the main audio is then a valid source as well.
+    return (
+        audio_info is not None
+        and output_audio_file_extension in ("mka", "webm")
+        and "matroska" in audio_info["format_name"].split(",")
+    )
+
+
+def clone_file(source: Path, target: Path) -> str:
+    # Replaces the target with the source without copying any data - a reflink where the filesystem
+    # supports it, otherwise a hardlink. Raises OSError when neither is possible (e.g. across filesystems),
+    # the target is then left as is.
+    cloned_file = target.with_name(f"{target.name}.clone")
+    cloned_file.unlink(missing_ok=True)
     try:
-        raw_info = json.loads(output)
-        info = parse_audio_info(raw_info)
-    except:
-        print("Warning - Unable to probe input audio source properties...")
-        pass
+        with open(source, "rb") as source_file, open(cloned_file, "wb") as cloned:
+            fcntl.ioctl(cloned.fileno(), FICLONE, source_file.fileno())
+        method = "reflink"
+    except OSError:
+        cloned_file.unlink(missing_ok=True)
+        os.link(source, cloned_file)
+        method = "hardlink"
 
-    return info
+    os.replace(cloned_file, target)
+    return method
+
+
+# ffmpeg output formats - needed when writing to a pipe, where there is no file extension to go by
+output_audio_formats = {"mka": "matroska", "webm": "webm", "mp3": "mp3"}
 
 
 class TransformEngine:
-    def __init__(self, recitals_ra: RecitalsRA, data_folder: str) -> None:
+    def __init__(
+        self,
+        recitals_ra: RecitalsRA,
+        recitals_content_ra: RecitalsContentRA,
+        data_folder: str,
+        transcode_scheduler: TranscodeScheduler,
+    ) -> None:
         self.recitals_ra = recitals_ra
+        self.recitals_content_ra = recitals_content_ra
         self.data_folder = data_folder
+        self.transcode_scheduler = transcode_scheduler
 
-    def transcode_session_audio(self, session_id: str) -> str:
+    def transcode_session_audio(self, session_id: str) -> tuple[str, str]:
         recital_session = self.recitals_ra.get_by_id(session_id)
+        if self.recitals_content_ra.is_storage_key(session_id, recital_session.source_audio_filename):
+            return self._transcode_stored_session_audio(session_id, recital_session.source_audio_filename)
+
         source_audio_filename = Path(self.data_folder, recital_session.source_audio_filename)
 
         if not source_audio_filename or not os.path.isfile(source_audio_filename):
             print("Warning - Source audio file does not exist...", source_audio_filename)
-            return None
+            return None, None
 
+        tracing.set_span_attributes(source_bytes=os.path.getsize(source_audio_filename))
         audio_info = get_audio_properties(source_audio_filename)
+        output_audio_file_extension = get_output_audio_file_extension(audio_info)
 
-        output_audio_file_extension = "mka"  # Very generic - can take almost any encoding
-        if audio_info is not None:
-            if audio_info["codec_name"] == "vorbis":  # Place in a webm container
-                output_audio_file_extension = "webm"
-
-        main_output_audio_file = f"{session_id}.{output_audio_file_extension}"
+        main_output_audio_file = get_session_file(session_id, f"{session_id}.{output_audio_file_extension}")
         abs_main_output_audio_file = Path(self.data_folder, main_output_audio_file)
+        abs_main_output_audio_file.parent.mkdir(parents=True, exist_ok=True)
 
-        main_ffmpeg_cmd = [
-            "ffmpeg",
-            "-y",
-            "-i",
+        # ffmpeg cannot write over its input - a main audio named as the source is remuxed aside first
+        remux_in_place = abs_main_output_audio_file == source_audio_filename
+        abs_remux_output_audio_file = (
+            abs_main_output_audio_file.with_name(f"{abs_main_output_audio_file.name}.remux")
+            if remux_in_place
+            else abs_main_output_audio_file
+        )
+        main_ffmpeg_cmd = self.transcode_scheduler.build_ffmpeg_command(
             str(source_audio_filename),
-            "-acodec",
-            "copy",
-            str(abs_main_output_audio_file),
-        ]
+            ["-acodec", "copy", "-f", output_audio_formats[output_audio_file_extension]],
+            str(abs_remux_output_audio_file),
+        )
 
-        light_output_audio_file = f"{session_id}.mp3"
+        light_output_audio_file = get_session_file(session_id, f"{session_id}.mp3")
         abs_light_output_audio_file = Path(self.data_folder, light_output_audio_file)
-        light_ffmpeg_cmd = [
-            "ffmpeg",
-            "-y",
-            "-i",
-            str(source_audio_filename),
-            str(abs_light_output_audio_file),
-        ]
+        light_ffmpeg_cmd = self.transcode_scheduler.build_ffmpeg_command(
+            str(source_audio_filename), [], str(abs_light_output_audio_file)
+        )
 
         try:
-            subprocess.check_call(main_ffmpeg_cmd, stderr=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
-            subprocess.check_call(light_ffmpeg_cmd, stderr=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+            with tracing.span("transcode.main") as main_span:
+                with self.transcode_scheduler.slot(), MEDIA_TOOL_DURATION.labels("ffmpeg", "main").time():
+                    subprocess.check_call(main_ffmpeg_cmd, stderr=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                if remux_in_place:
+                    os.replace(abs_remux_output_audio_file, abs_main_output_audio_file)
+                elif is_output_audio_container(audio_info, output_audio_file_extension):
+                    main_span.set_attributes(
+                        source_linked=self._link_source_audio(abs_main_output_audio_file, source_audio_filename)
+                    )
+                main_span.set_attributes(bytes=os.path.getsize(abs_main_output_audio_file))
+            with tracing.span("transcode.light") as light_span, self.transcode_scheduler.slot():
+                with MEDIA_TOOL_DURATION.labels("ffmpeg", "light").time():
+                    subprocess.check_call(light_ffmpeg_cmd, stderr=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                light_span.set_attributes(bytes=os.path.getsize(abs_light_output_audio_file))
         except OSError as e:
             print("Warning - Error while transcoding audio input. Skipping.")
             print(e)
-            return None
+            return None, None
 
         return main_output_audio_file, light_output_audio_file
+
+    def _link_source_audio(self, main_audio_file: Path, source_audio_file: Path) -> Optional[str]:
+        # The main audio has the very stream of the source - the source is kept once, as a link to it
+        try:
+            return clone_file(main_audio_file, source_audio_file)
+        except OSError as e:
+            print("Warning - Unable to link the source audio to the main audio, keeping both.")
+            print(e)
+            return None
+
+    def _transcode_stored_audio(
+        self,
+        session_id: str,
+        source_key: str,
+        target_key: str,
+        ffmpeg_args: list[str],
+        operation: str,
+        content_type: str = None,
+    ) -> bool:
+        # Stored source -> ffmpeg stdin, ffmpeg stdout -> stored target - nothing is spooled locally
+        ffmpeg_cmd = self.transcode_scheduler.build_ffmpeg_command("pipe:0", ffmpeg_args, "pipe:1")
+        with tracing.span(f"transcode.{operation}") as transcode_span, self.transcode_scheduler.slot():
+            try:
+                process = subprocess.Popen(
+                    ffmpeg_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+                )
+            except OSError as e:
+                print("Warning - Error while transcoding audio input. Skipping.")
+                print(e)
+                return False
+
+            returncode, source_fed, uploaded = self._pipe_stored_audio(
+                process, session_id, source_key, target_key, operation, content_type
+            )
+            failed = returncode != 0 or not source_fed
+            if failed:
+                transcode_span.set_error(f"ffmpeg exit code {returncode}")
+
+        if failed:
+            print(f"Warning - Error while transcoding stored audio {source_key} (exit code {returncode})")
+            return False
+        return uploaded
+
+    def _pipe_stored_audio(
+        self,
+        process: subprocess.Popen,
+        session_id: str,
+        source_key: str,
+        target_key: str,
+        operation: str,
+        content_type: str,
+    ) -> tuple[int, bool, bool]:
+        # A truncated source may still transcode "successfully" - so how the feeding went counts as well
+        source_fed = False
+
+        def feed_source() -> None:
+            nonlocal source_fed
+            try:
+                source_fed = self.recitals_content_ra.download_stream_from_storage(source_key, process.stdin)
+            except Exception as e:
+                print(e)  # Likely ffmpeg exited early - its exit code tells why
+            finally:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+
+        # Includes streaming from and to the storage - ffmpeg runs at the pace of both
+        with MEDIA_TOOL_DURATION.labels("ffmpeg", f"stored_{operation}").time():
+            feeder = threading.Thread(target=feed_source, name=f"transcode-feed-{session_id}", daemon=True)
+            feeder.start()
+            uploaded = self.recitals_content_ra.upload_stream_to_storage(
+                process.stdout,
+                target_key,
+                metadata=self.recitals_content_ra.get_session_object_metadata(session_id),
+                content_type=content_type,
+            )
+            if not uploaded:
+                process.kill()
+            returncode = process.wait()
+            feeder.join()
+
+        return returncode, source_fed, uploaded
+
+    def _transcode_stored_session_audio(self, session_id: str, source_audio_key: str) -> tuple[str, str]:
+        source_audio_head = self.recitals_content_ra.read_from_storage(source_audio_key, STORED_AUDIO_PROBE_BYTES)
+        if not source_audio_head:
+            print("Warning - Source audio does not exist in storage...", source_audio_key)
+            return None, None
+
+        audio_info = probe_audio_properties("pipe:0", source_audio_head)
+        output_audio_file_extension = get_output_audio_file_extension(audio_info)
+
+        main_output_audio_key = self.recitals_content_ra.get_audio_storage_key(
+            session_id, f"{session_id}.{output_audio_file_extension}", "main.audio"
+        )
+        main_ffmpeg_args = ["-acodec", "copy", "-f", output_audio_formats[output_audio_file_extension]]
+        if not self._transcode_stored_audio(
+            session_id, source_audio_key, main_output_audio_key, main_ffmpeg_args, "main"
+        ):
+            return None, None
+
+        light_output_audio_key = self.recitals_content_ra.get_audio_storage_key(
+            session_id, f"{session_id}.mp3", "light.audio"
+        )
+        light_ffmpeg_args = ["-f", output_audio_formats["mp3"]]
+        if not self._transcode_stored_audio(
+            session_id, source_audio_key, light_output_audio_key, light_ffmpeg_args, "light", content_type="audio/mp3"
+        ):
+            return None, None
+
+        return main_output_audio_key, light_output_audio_key
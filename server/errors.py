@@ -1,2 +1,10 @@
 class MissingSessionError(ValueError):
     pass
+
+
+class TranscodeDeferredError(Exception):
+    pass
+
+
+class MixedAudioSegmentsError(Exception):
+    pass
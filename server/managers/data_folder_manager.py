@@ -0,0 +1,193 @@
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from pydantic import BaseModel, Field
+
+from models.recital_session import RecitalSession, SessionStatus
+from resource_access.recitals_content_ra import LocalDataFile, RecitalsContentRA
+from resource_access.recitals_ra import RecitalsRA
+from utility.analytics.posthog import ConfiguredPosthog
+from utility.scheduler import JobScheduler
+
+# Free space is checked on every upload - a statvfs at most this often
+FREE_SPACE_CHECK_INTERVAL_SEC = 5
+# Low free space triggers a collection - at most this often
+PRESSURE_COLLECTION_MIN_INTERVAL_SEC = 300
+
+BYTES_IN_MB = 1024 * 1024
+
+
+class DataFolderCollectionReport(BaseModel):
+    dry_run: bool
+    sessions_scanned: int = 0
+    files_scanned: int = 0
+    bytes_scanned: int = 0
+    reclaimable_files: int = 0
+    reclaimable_bytes: int = 0
+    reclaimable_bytes_by_reason: dict[str, int] = Field(default_factory=dict)
+    removed_files: int = 0
+    removed_bytes: int = 0
+    free_bytes: int = 0
+
+
+class DataFolderManager:
+    def __init__(
+        self,
+        gc_job_disabled: bool,
+        gc_job_interval: int,
+        gc_grace_period: int,
+        session_span_retention_days: int,
+        upload_min_free_mb: int,
+        gc_min_free_mb: int,
+        disable_s3_upload: bool,
+        posthog: ConfiguredPosthog,
+        job_scheduler: JobScheduler,
+        recitals_ra: RecitalsRA,
+        recitals_content_ra: RecitalsContentRA,
+    ) -> None:
+        self.gc_job_disabled = gc_job_disabled
+        self.gc_job_interval = gc_job_interval
+        self.gc_grace_period = gc_grace_period
+        self.session_span_retention_days = session_span_retention_days
+        self.upload_min_free_bytes = upload_min_free_mb * BYTES_IN_MB
+        self.gc_min_free_bytes = gc_min_free_mb * BYTES_IN_MB
+        self.disable_s3_upload = disable_s3_upload
+        self.posthog = posthog
+        self.job_scheduler = job_scheduler
+        self.recitals_ra = recitals_ra
+        self.recitals_content_ra = recitals_content_ra
+        self.gc_job_id = "data_folder_gc_job"
+        self.free_bytes: Optional[int] = None
+        self.free_bytes_checked_at = 0.0
+        self.pressure_collection_at = 0.0
+
+    def schedule_data_folder_gc_job(self, run_now=False) -> None:
+        if self.gc_job_disabled:
+            return
+
+        trigger = IntervalTrigger(seconds=self.gc_job_interval)
+        if run_now:
+            trigger = DateTrigger(run_date=datetime.now(timezone.utc) + timedelta(seconds=1))
+        self.job_scheduler.add_job(
+            self._data_folder_gc_task,
+            id=self.gc_job_id if not run_now else f"{self.gc_job_id}_now",
+            replace_existing=True,
+            trigger=trigger,
+        )
+
+    def _data_folder_gc_task(self) -> None:
+        report = self.collect_garbage()
+        pruned_session_spans = self.prune_session_spans()
+        self.posthog.capture(
+            "server",
+            "Data Folder Collected",
+            {
+                "source": "server",
+                "$process_person_profile": False,
+                **report.model_dump(),
+                "pruned_session_spans": pruned_session_spans,
+            },
+        )
+
+    def prune_session_spans(self) -> int:
+        # The timelines of sessions done with (uploaded or discarded) are only kept for a while
+        if self.session_span_retention_days <= 0:
+            return 0
+        started_before = datetime.now(timezone.utc) - timedelta(days=self.session_span_retention_days)
+        return self.recitals_ra.delete_session_spans([SessionStatus.UPLOADED, SessionStatus.DISCARDED], started_before)
+
+    def has_upload_capacity(self) -> bool:
+        now = time.monotonic()
+        if self.free_bytes is None or now - self.free_bytes_checked_at > FREE_SPACE_CHECK_INTERVAL_SEC:
+            self.free_bytes = self.recitals_content_ra.get_data_folder_free_bytes()
+            self.free_bytes_checked_at = now
+
+            # Getting low - reclaim what we can before uploads are refused
+            if (
+                self.free_bytes < self.gc_min_free_bytes
+                and now - self.pressure_collection_at > PRESSURE_COLLECTION_MIN_INTERVAL_SEC
+            ):
+                print(f"Warning - Data folder free space is low ({self.free_bytes // BYTES_IN_MB}MB)")
+                self.pressure_collection_at = now
+                self.schedule_data_folder_gc_job(run_now=True)
+
+        return self.free_bytes >= self.upload_min_free_bytes
+
+    def _get_reclaim_reason(
+        self, recital_session: Optional[RecitalSession], data_file: LocalDataFile, segment_filenames: set[str]
+    ) -> Optional[str]:
+        # Recently written files may belong to work in progress - never touched
+        if data_file.modified_at > time.time() - self.gc_grace_period:
+            return None
+
+        if recital_session is None:
+            return "orphaned_session"
+        if recital_session.status == SessionStatus.DISCARDED:
+            return "discarded_session"
+        if recital_session.status == SessionStatus.UPLOADED:
+            # Without S3 uploads the local files are the only copy
+            return "uploaded_session" if not self.disable_s3_upload else None
+        if data_file.filename.endswith((".part", ".tmp")):
+            return "abandoned_partial_file"
+
+        if recital_session.status == SessionStatus.AGGREGATED:
+            session_filenames = {
+                recital_session.text_filename,
+                recital_session.source_audio_filename,
+                recital_session.main_audio_filename,
+                recital_session.light_audio_filename,
+            }
+            return "unreferenced_file" if data_file.filename not in session_filenames else None
+
+        # Active and ended sessions still need their segments - aggregation rewrites any other outputs
+        if ".seg." in data_file.filename and data_file.filename not in segment_filenames:
+            return "unreferenced_segment"
+
+        return None
+
+    def collect_garbage(self, dry_run: bool = False) -> DataFolderCollectionReport:
+        report = DataFolderCollectionReport(dry_run=dry_run)
+
+        for session_folders in self.recitals_content_ra.iter_session_folder_batches():
+            session_ids = [session_id for session_id, _ in session_folders]
+            recital_sessions = {
+                recital_session.id: recital_session for recital_session in self.recitals_ra.get_by_ids(session_ids)
+            }
+            segment_filenames = self.recitals_ra.get_audio_segment_filenames(session_ids)
+
+            for session_id, data_files in session_folders:
+                recital_session = recital_sessions.get(session_id)
+                report.sessions_scanned += 1
+                for data_file in data_files:
+                    report.files_scanned += 1
+                    report.bytes_scanned += data_file.size
+
+                    reason = self._get_reclaim_reason(recital_session, data_file, segment_filenames)
+                    if not reason:
+                        continue
+
+                    report.reclaimable_files += 1
+                    report.reclaimable_bytes += data_file.size
+                    report.reclaimable_bytes_by_reason[reason] = (
+                        report.reclaimable_bytes_by_reason.get(reason, 0) + data_file.size
+                    )
+
+                    if not dry_run and self.recitals_content_ra.remove_local_data_file_if_unmodified(data_file):
+                        report.removed_files += 1
+                        report.removed_bytes += data_file.size
+
+                # Folders of sessions which may still get uploads are kept
+                if not dry_run and (
+                    recital_session is None
+                    or recital_session.status in [SessionStatus.DISCARDED, SessionStatus.UPLOADED]
+                ):
+                    self.recitals_content_ra.remove_empty_session_folder(session_id)
+
+        report.free_bytes = self.recitals_content_ra.get_data_folder_free_bytes()
+        self.free_bytes = report.free_bytes
+        self.free_bytes_checked_at = time.monotonic()
+
+        return report
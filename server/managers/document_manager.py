@@ -79,6 +79,20 @@ class DocumentManager:
         doc = self.documents_ra.get_by_id(document_id)
         return doc
 
+    def load_document_paragraphs(
+        self, document_id: UUID, start: int, count: int, user: User
+    ) -> Optional[tuple[TextDocument, int, list[list[str]]]]:
+        # Visible as in the documents lists - admins see all, others their own and the public ones
+        doc = self.documents_ra.get_by_id(document_id, include_text=False)
+        if not doc or not (user.is_admin() or doc.owner_id == user.id or doc.public):
+            return None
+
+        total_paragraphs = self.documents_ra.get_paragraphs_count(document_id)
+        if total_paragraphs == 0:
+            return doc, 0, []
+
+        return doc, total_paragraphs, self.documents_ra.get_paragraphs(document_id, start, count)
+
     def load_own_documents(self, user: User, include_text: bool = False) -> list[TextDocument]:
         if not user:
             raise ValueError("User is required")
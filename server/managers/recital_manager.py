@@ -1,3 +1,4 @@
+import asyncio
 from datetime import datetime, timedelta, timezone
 
 from apscheduler.triggers.combining import OrTrigger
@@ -7,15 +8,21 @@ from pydantic import BaseModel
 
 from engines.aggregation_engine import AggregationEngine
 from engines.transform_engine import TransformEngine
-from errors import MissingSessionError
-from models.recital_session import SessionStatus
-from models.recital_text_segment import RecitalTextSegment
+from errors import MissingSessionError, TranscodeDeferredError
+from models.recital_session import RecitalSession, SessionStatus
+from models.recital_session_span import RecitalSessionSpan
 from models.user import User
 from resource_access.recitals_content_ra import RecitalsContentRA
 from resource_access.recitals_ra import RecitalsRA
 from utility.analytics.posthog import ConfiguredPosthog
 from utility.scheduler import JobScheduler
 from utility.cache import stats as stats_cache
+from utility.data_layout import get_session_file
+from utility.http.server_timing import timed
+from utility import tracing
+
+# Upper bound on the wait between finalization attempts of a failing session
+MAX_FINALIZATION_BACKOFF = timedelta(hours=6)
 
 
 class TextSegmentRequestBody(BaseModel):
@@ -28,6 +35,8 @@ class RecitalManager:
         self,
         session_finalization_job_disabled: bool,
         session_finalization_job_interval: int,
+        session_finalization_max_attempts: int,
+        session_finalization_backoff_base: int,
         disable_s3_upload: bool,
         posthog: ConfiguredPosthog,
         job_scheduler: JobScheduler,
@@ -38,6 +47,8 @@ class RecitalManager:
     ) -> None:
         self.session_finalization_job_disabled = session_finalization_job_disabled
         self.session_finalization_job_interval = session_finalization_job_interval
+        self.session_finalization_max_attempts = session_finalization_max_attempts
+        self.session_finalization_backoff_base = session_finalization_backoff_base
         self.disable_s3_upload = disable_s3_upload
         self.posthog = posthog
         self.job_scheduler = job_scheduler
@@ -89,6 +100,82 @@ class RecitalManager:
         recital_session.duration = max(recital_session.duration or 0, duration)
         self.recitals_ra.upsert(recital_session)
 
+    def _reset_finalization_failures(self, recital_session: RecitalSession) -> None:
+        recital_session.finalization_attempts = 0
+        recital_session.finalization_next_attempt_at = None
+        recital_session.finalization_error = None
+
+    def _record_finalization_failure(self, session_id: str, stage: str, error: str) -> None:
+        tracing.set_span_error(f"{stage}: {error}")
+        try:
+            # Reload - the in-flight instance may hold partial changes
+            recital_session = self.recitals_ra.get_by_id(session_id)
+            if not recital_session:
+                return
+
+            attempts = (recital_session.finalization_attempts or 0) + 1
+            backoff = min(
+                timedelta(seconds=self.session_finalization_backoff_base * 2 ** (attempts - 1)),
+                MAX_FINALIZATION_BACKOFF,
+            )
+            recital_session.finalization_attempts = attempts
+            recital_session.finalization_next_attempt_at = datetime.now(timezone.utc) + backoff
+            recital_session.finalization_error = f"{stage}: {error}"
+
+            quarantine = attempts >= self.session_finalization_max_attempts
+            if quarantine:
+                recital_session.quarantined = True
+
+            self.recitals_ra.upsert(recital_session)
+        except Exception as e:
+            print(f"Error recording finalization failure for session {session_id}")
+            print(e)
+            return
+
+        if quarantine:
+            print(f"Session {session_id} quarantined after {attempts} failed finalization attempts")
+            self.posthog.capture(
+                "server",
+                "Session Finalization Quarantined",
+                {
+                    "session_id": session_id,
+                    "stage": stage,
+                    "attempts": attempts,
+                },
+            )
+
+    def _store_session_timeline(self, timeline: tracing.SessionTimeline) -> None:
+        self.recitals_ra.add_session_spans(
+            [
+                RecitalSessionSpan(
+                    recital_session_id=timeline.session_id,
+                    trace_id=trace_span.trace_id,
+                    span_id=trace_span.span_id,
+                    parent_span_id=trace_span.parent_span_id,
+                    name=trace_span.name,
+                    started_at=trace_span.started_at,
+                    duration=trace_span.duration,
+                    status=trace_span.status,
+                    attributes=trace_span.attributes,
+                )
+                for trace_span in timeline.spans
+            ]
+        )
+
+    def get_session_timeline(self, session_id: str) -> list[RecitalSessionSpan]:
+        if not self.recitals_ra.get_by_id(session_id):
+            raise MissingSessionError()
+        return self.recitals_ra.get_session_spans(session_id)
+
+    def release_quarantined_session(self, session_id: str) -> None:
+        recital_session = self.recitals_ra.get_by_id(session_id)
+        if not recital_session:
+            raise MissingSessionError()
+
+        recital_session.quarantined = False
+        self._reset_finalization_failures(recital_session)
+        self.recitals_ra.upsert(recital_session)
+
     def aggregate_ended_sessions(self) -> None:
         ended_sessions = self.recitals_ra.get_ended_sessions()
 
@@ -97,74 +184,92 @@ class RecitalManager:
 
         for ended_session in ended_sessions:
             session_id = ended_session.id
-            try:
-                recital_session = self.recitals_ra.get_by_id(session_id)
-                if not recital_session:
-                    raise MissingSessionError()
-
-                # Aggregate text
-                if not recital_session.text_filename:
-                    vtt_file_content = self.aggregation_engine.aggregate_session_captions(recital_session.id)
-                    if vtt_file_content:
-                        text_filename = f"{session_id}.vtt"
-                        self.recitals_ra.store_session_text(vtt_file_content, text_filename)
-                        recital_session.text_filename = text_filename
-                        self.recitals_ra.upsert(recital_session)
-                    else:
-                        print(f"No textual content found for session {session_id} - disavowing")
-                        recital_session.disavowed = True
+            with tracing.session_trace(session_id, "session.aggregate", self._store_session_timeline):
+                try:
+                    recital_session = self.recitals_ra.get_by_id(session_id)
+                    if not recital_session:
+                        raise MissingSessionError()
+
+                    # Aggregate text
+                    if not recital_session.text_filename:
+                        with tracing.span("aggregate.captions"):
+                            vtt_file_content = self.aggregation_engine.aggregate_session_captions(recital_session.id)
+                            if self.recitals_content_ra.stream_segments_to_storage:
+                                text_filename = self.recitals_content_ra.store_text_in_storage(
+                                    session_id, vtt_file_content
+                                )
+                            else:
+                                text_filename = get_session_file(session_id, f"{session_id}.vtt")
+                                if not self.recitals_ra.store_session_text(vtt_file_content, text_filename):
+                                    text_filename = None
+
+                        if text_filename:
+                            recital_session.text_filename = text_filename
+                            self.recitals_ra.upsert(recital_session)
+                        else:
+                            print(f"No textual content found for session {session_id} - disavowing")
+                            recital_session.disavowed = True
+                            self.recitals_ra.upsert(recital_session)
+                            continue
+
+                    # Aggregate audio segments into a single file if not done yet
+                    if not recital_session.source_audio_filename:
+                        with tracing.span("aggregate.audio"):
+                            source_audio_filename = self.aggregation_engine.aggregate_session_audio(recital_session.id)
+                        if not source_audio_filename:
+                            print(f"No audio found for session {session_id} - disavowing")
+                            recital_session.disavowed = True
+                            self.recitals_ra.upsert(recital_session)
+                            continue
+
+                        recital_session.source_audio_filename = source_audio_filename
                         self.recitals_ra.upsert(recital_session)
-                        continue
-
-                # Aggregate audio segments into a single file if not done yet
-                if not recital_session.source_audio_filename:
-                    source_audio_filename = self.aggregation_engine.aggregate_session_audio(recital_session.id)
-                    if not source_audio_filename:
-                        print(f"No audio found for session {session_id} - disavowing")
-                        recital_session.disavowed = True
-                        self.recitals_ra.upsert(recital_session)
-                        continue
 
-                    recital_session.source_audio_filename = source_audio_filename
-                    self.recitals_ra.upsert(recital_session)
+                    # Transcode the audio into the target formats if not done yet
+                    if not recital_session.main_audio_filename:
+                        with tracing.span("transcode"):
+                            main_audio_filename, light_audio_filename = self.transform_engine.transcode_session_audio(
+                                recital_session.id
+                            )
+
+                        if main_audio_filename:
+                            recital_session.light_audio_filename = light_audio_filename
+                            recital_session.main_audio_filename = main_audio_filename
+                            recital_session.status = SessionStatus.AGGREGATED  # done aggregating
+                            self._reset_finalization_failures(recital_session)
+                        else:
+                            print(f"Could not transcode audio for session {session_id} - skipping")
+                            self.posthog.capture(
+                                "server",
+                                "Session Aggregation Transcode Failed",
+                                {
+                                    "session_id": session_id,
+                                },
+                            )
+                            self._record_finalization_failure(session_id, "transcode", "Could not transcode audio")
+                            continue
 
-                # Transcode the audio into the target formats if not done yet
-                if not recital_session.main_audio_filename:
-                    main_audio_filename, light_audio_filename = self.transform_engine.transcode_session_audio(
-                        recital_session.id
-                    )
+                        self.recitals_ra.upsert(recital_session)
 
-                    if main_audio_filename:
-                        recital_session.light_audio_filename = light_audio_filename
-                        recital_session.main_audio_filename = main_audio_filename
-                        recital_session.status = SessionStatus.AGGREGATED  # done aggregating
-                    else:
-                        print(f"Could not transcode audio for session {session_id} - skipping")
                         self.posthog.capture(
                             "server",
-                            "Session Aggregation Transcode Failed",
+                            "Session Aggregation Done",
                             {
+                                "source": "server",
                                 "session_id": session_id,
+                                "duration": recital_session.duration,
                             },
                         )
-                        continue
-
-                    self.recitals_ra.upsert(recital_session)
 
-                    self.posthog.capture(
-                        "server",
-                        "Session Aggregation Done",
-                        {
-                            "source": "server",
-                            "session_id": session_id,
-                            "duration": recital_session.duration,
-                        },
-                    )
-
-            except Exception as e:
-                print(f"Error aggregating session {session_id} - skipping")
-                print(e)
-                continue
+                except TranscodeDeferredError as e:
+                    # Not a failure - the box is busy, the next run picks up where this one stopped
+                    print(f"Transcoding deferred for session {session_id} - {e}")
+                    break
+                except Exception as e:
+                    print(f"Error aggregating session {session_id} - skipping")
+                    print(e)
+                    self._record_finalization_failure(session_id, "aggregate", repr(e))
+                    continue
 
     def upload_aggregated_sessions(self) -> None:
         aggregated_sessions = self.recitals_ra.get_aggregated_sessions()
@@ -176,55 +281,87 @@ class RecitalManager:
 
         for aggregated_session in aggregated_sessions:
             session_id = aggregated_session.id
-            try:
-                recital_session = self.recitals_ra.get_by_id(session_id)
-                if not recital_session:
-                    raise MissingSessionError()
-
-                text_filename = recital_session.text_filename
-                source_audio_filename = recital_session.source_audio_filename
-                audio_filename = recital_session.main_audio_filename
-                light_audio_filename = recital_session.light_audio_filename
+            with tracing.session_trace(session_id, "session.upload", self._store_session_timeline):
+                try:
+                    recital_session = self.recitals_ra.get_by_id(session_id)
+                    if not recital_session:
+                        raise MissingSessionError()
+
+                    text_filename = recital_session.text_filename
+                    source_audio_filename = recital_session.source_audio_filename
+                    audio_filename = recital_session.main_audio_filename
+                    light_audio_filename = recital_session.light_audio_filename
+
+                    if not self.disable_s3_upload:
+                        # A source linked to the main audio is stored once - the session points at the main audio
+                        source_stored_as_main = self.recitals_content_ra.are_identical_data_files(
+                            source_audio_filename, audio_filename
+                        )
+                        if source_stored_as_main:
+                            recital_session.source_audio_filename = self.recitals_content_ra.get_audio_storage_key(
+                                session_id, audio_filename, "main.audio"
+                            )
+
+                        # Upload the files to the content storage
+                        # Content finalized in the storage (streamed sessions) is already in place
+                        uploads = [
+                            (text_filename, self.recitals_content_ra.upload_text_to_storage, "text"),
+                            (
+                                audio_filename,
+                                lambda session_id, filename: self.recitals_content_ra.upload_main_audio_to_storage(
+                                    session_id, filename, is_source_audio=source_stored_as_main
+                                ),
+                                "audio",
+                            ),
+                            (
+                                recital_session.source_audio_filename,
+                                self.recitals_content_ra.upload_source_audio_to_storage,
+                                "source audio",
+                            ),
+                            (
+                                light_audio_filename,
+                                self.recitals_content_ra.upload_light_audio_to_storage,
+                                "light audio",
+                            ),
+                        ]
+                        for filename, upload_to_storage, content_name in uploads:
+                            if self.recitals_content_ra.is_storage_key(session_id, filename):
+                                continue
+                            with tracing.span(f"upload.{content_name.replace(' ', '_')}"):
+                                if not upload_to_storage(session_id, filename):
+                                    raise Exception(f"Error uploading session {content_name} to storage")
+
+                        # Delete the source files after they were uploaded
+                        self.recitals_content_ra.remove_local_data_file(text_filename)
+                        self.recitals_content_ra.remove_local_data_file(audio_filename)
+                        self.recitals_content_ra.remove_local_data_file(source_audio_filename)
+                        self.recitals_content_ra.remove_local_data_file(light_audio_filename)
+                        self.recitals_content_ra.remove_session_local_data(session_id)
+
+                    # Mark the session as published
+                    recital_session.status = SessionStatus.UPLOADED
+                    self._reset_finalization_failures(recital_session)
+                    self.recitals_ra.upsert(recital_session)
+                    uploaded_sessions_mutated = True
 
-                if not self.disable_s3_upload:
-                    # Upload the files to the content storage
-                    if not self.recitals_content_ra.upload_text_to_storage(session_id, text_filename):
-                        raise Exception("Error uploading session text to storage")
-                    if not self.recitals_content_ra.upload_main_audio_to_storage(session_id, audio_filename):
-                        raise Exception("Error uploading session audio to storage")
-                    if not self.recitals_content_ra.upload_source_audio_to_storage(session_id, source_audio_filename):
-                        raise Exception("Error uploading session source audio to storage")
-                    if not self.recitals_content_ra.upload_light_audio_to_storage(session_id, light_audio_filename):
-                        raise Exception("Error uploading session source audio to storage")
-
-                    # Delete the source files after they were uploaded
-                    self.recitals_content_ra.remove_local_data_file(text_filename)
-                    self.recitals_content_ra.remove_local_data_file(audio_filename)
-                    self.recitals_content_ra.remove_local_data_file(source_audio_filename)
-                    self.recitals_content_ra.remove_local_data_file(light_audio_filename)
+                    # Invalidate the stats cache for this user
+                    stats_cache.invalidate_stats_by_user_id(recital_session.user_id)
 
-                # Mark the session as published
-                recital_session.status = SessionStatus.UPLOADED
-                self.recitals_ra.upsert(recital_session)
-                uploaded_sessions_mutated = True
-
-                # Invalidate the stats cache for this user
-                stats_cache.invalidate_stats_by_user_id(recital_session.user_id)
-
-                self.posthog.capture(
-                    "server",
-                    "Session Upload Done",
-                    {
-                        "source": "server",
-                        "session_id": session_id,
-                        "duration": recital_session.duration,
-                    },
-                )
+                    self.posthog.capture(
+                        "server",
+                        "Session Upload Done",
+                        {
+                            "source": "server",
+                            "session_id": session_id,
+                            "duration": recital_session.duration,
+                        },
+                    )
 
-            except Exception as e:
-                print(f"Error uploading session {session_id} - skipping")
-                print(e)
-                continue
+                except Exception as e:
+                    print(f"Error uploading session {session_id} - skipping")
+                    print(e)
+                    self._record_finalization_failure(session_id, "upload", repr(e))
+                    continue
 
         if uploaded_sessions_mutated:
             stats_cache.invalidate_cross_user_stats()
@@ -236,16 +373,50 @@ class RecitalManager:
             return
 
         discarded_sessions_mutated = False
+        # Stored content of all the sessions is deleted together - in as few requests as possible
+        storage_keys_by_session: dict[str, list[str]] = {}
         for disavowed_session in disavowed_sessions:
             session_id = disavowed_session.id
 
-            if self.discard_session(session_id):
+            if self.discard_session(session_id, storage_keys_by_session):
                 discarded_sessions_mutated = True
 
+        self._delete_sessions_content_from_storage(storage_keys_by_session)
+
         if discarded_sessions_mutated:
             stats_cache.invalidate_cross_user_stats()
 
-    def discard_session(self, session_id: str) -> bool:
+    def _delete_sessions_content_from_storage(self, storage_keys_by_session: dict[str, list[str]]) -> None:
+        storage_keys = [storage_key for keys in storage_keys_by_session.values() for storage_key in keys]
+        if not storage_keys:
+            return
+
+        failures = self.recitals_content_ra.delete_from_storage(storage_keys)
+        if not failures:
+            return
+
+        for session_id, session_storage_keys in storage_keys_by_session.items():
+            session_failures = {key: failures[key] for key in session_storage_keys if key in failures}
+            if not session_failures:
+                continue
+
+            print(f"Error deleting session {session_id} content from storage")
+            for storage_key, reason in session_failures.items():
+                print(f"  {storage_key}: {reason}")
+            self.posthog.capture(
+                "server",
+                "error deleting session content from storage",
+                {
+                    "source": "server",
+                    "$process_person_profile": False,
+                    "session_id": session_id,
+                    "failed_keys": list(session_failures.keys()),
+                },
+            )
+
+    def discard_session(self, session_id: str, storage_keys_by_session: dict[str, list[str]] | None = None) -> bool:
+        # When storage_keys_by_session is provided, stored content is collected into it for
+        # a later bulk deletion instead of being deleted right away
         try:
             recital_session = self.recitals_ra.get_by_id(session_id)
             if not recital_session:
@@ -264,9 +435,16 @@ class RecitalManager:
             # Invalidate the stats cache for this user
             stats_cache.invalidate_stats_by_user_id(recital_session.user_id)
 
+            session_storage_keys = []
             if original_status in [SessionStatus.ACTIVE, SessionStatus.ENDED]:
                 # delete audio segment files which may have been uploaded (but not yet aggregated)
                 self.aggregation_engine.delete_session_audio(session_id)
+                # Including segments streamed to the storage
+                session_storage_keys.extend(
+                    filename
+                    for filename in self.recitals_ra.get_audio_segment_filenames([session_id])
+                    if self.recitals_content_ra.is_storage_key(session_id, filename)
+                )
                 # In case audio aggregation failed and the session is not yet marked as aggregated
                 if recital_session.text_filename:
                     self.recitals_content_ra.remove_local_data_file(recital_session.text_filename)
@@ -288,19 +466,28 @@ class RecitalManager:
                 if audio_filename:
                     self.recitals_content_ra.remove_local_data_file(audio_filename)
 
-            if original_status == SessionStatus.UPLOADED:
-                # Delete remote files which might have been created during upload
-                if not self.recitals_content_ra.delete_session_content_from_storage(session_id):
-                    print(f"Error deleting session {session_id} content from storage")
-                    self.posthog.capture(
-                        "server",
-                        "error deleting session content from storage",
-                        {
-                            "source": "server",
-                            "$process_person_profile": False,
-                            "session_id": session_id,
-                        },
-                    )
+            # Whatever else the session left locally
+            self.recitals_content_ra.remove_session_local_data(session_id)
+
+            session_filenames = [
+                recital_session.text_filename,
+                recital_session.main_audio_filename,
+                recital_session.source_audio_filename,
+                recital_session.light_audio_filename,
+            ]
+            if original_status == SessionStatus.UPLOADED or any(
+                self.recitals_content_ra.is_storage_key(session_id, filename) for filename in session_filenames
+            ):
+                # Delete remote files which might have been created during upload (or finalized in the storage)
+                session_storage_keys.extend(
+                    self.recitals_content_ra.get_session_storage_keys(session_id, *session_filenames)
+                )
+
+            if session_storage_keys:
+                if storage_keys_by_session is not None:
+                    storage_keys_by_session[session_id] = session_storage_keys
+                else:
+                    self._delete_sessions_content_from_storage({session_id: session_storage_keys})
 
         except:
             print(f"Error deleting session {session_id} content")
@@ -314,12 +501,24 @@ class RecitalManager:
 
         return True
 
-    def add_text_segment(self, session_id: str, user: User, segment: TextSegmentRequestBody) -> None:
-        recital_session = self.recitals_ra.get_by_id_and_user_id(session_id, user.id)
+    async def add_text_segments(self, session_id: str, user: User, segments: list[TextSegmentRequestBody]) -> None:
+        # The session is validated once per call - however many segments it carries
+        recital_session = self.recitals_ra.get_access_by_id_and_user_id(session_id, user.id)
         if not recital_session or recital_session.disavowed:
             raise MissingSessionError()
 
-        text_segment = RecitalTextSegment(recital_session=recital_session, seek_end=segment.seek_end, text=segment.text)
-        self.recitals_ra.add_text_segment(text_segment)
+        if not segments:
+            return
+
+        # Awaited - so requests arriving meanwhile get grouped into the same commit
+        with timed("db"):
+            await asyncio.wrap_future(
+                self.recitals_ra.add_text_segments(
+                    session_id, [(segment.seek_end, segment.text) for segment in segments]
+                )
+            )
+
+        self.schedule_session_duration_update_job(session_id, max(segment.seek_end for segment in segments))
 
-        self.schedule_session_duration_update_job(session_id, segment.seek_end)
+    async def add_text_segment(self, session_id: str, user: User, segment: TextSegmentRequestBody) -> None:
+        await self.add_text_segments(session_id, user, [segment])
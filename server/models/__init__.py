@@ -1,6 +1,8 @@
 import models.database
 import models.recital_audio_segment
 import models.recital_session
+import models.recital_session_span
 import models.recital_text_segment
 import models.text_document
+import models.text_document_paragraph
 import models.user
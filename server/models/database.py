@@ -6,10 +6,14 @@ from typing import AsyncGenerator, Callable
 
 from sqlalchemy import orm
 from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from sqlmodel import Session, SQLModel, create_engine
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from configuration import get_db_connection_str
+from utility.http.server_timing import record_engine_timings
+from utility.metrics import instrument_engine_pool, timed_pool_class
+from utility.query_stats import record_query_stats
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +21,10 @@ logger = logging.getLogger(__name__)
 class Database:
 
     def __init__(self, connection_str: str) -> None:
-        self._engine = create_engine(connection_str)
+        self._engine = create_engine(connection_str, poolclass=timed_pool_class(QueuePool, "sync"))
+        instrument_engine_pool(lambda: self._engine.pool, "sync")
+        record_engine_timings(self._engine)
+        record_query_stats(self._engine)
         self._session_factory = orm.scoped_session(
             orm.sessionmaker(
                 autocommit=False,
@@ -54,7 +61,13 @@ class Database:
 # particular way which does not jive with the DI container we use.
 # For that - we expose this async DB connection directly.
 
-async_engine = create_async_engine(get_db_connection_str().replace("postgresql://", "postgresql+asyncpg://"))
+async_engine = create_async_engine(
+    get_db_connection_str().replace("postgresql://", "postgresql+asyncpg://"),
+    poolclass=timed_pool_class(AsyncAdaptedQueuePool, "async"),
+)
+instrument_engine_pool(lambda: async_engine.pool, "async")
+record_engine_timings(async_engine.sync_engine)
+record_query_stats(async_engine.sync_engine)
 async_session = orm.sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
 
 
@@ -1,6 +1,7 @@
 import uuid
+from typing import Optional
 
-from sqlmodel import Field, Relationship, SQLModel
+from sqlmodel import Field, Relationship, SQLModel, UniqueConstraint
 
 from .mixins.date_fields import DateFieldsMixin
 from .recital_session import RecitalSession
@@ -9,10 +10,13 @@ from .recital_session import RecitalSession
 class RecitalAudioSegment(SQLModel, DateFieldsMixin, table=True):
 
     __tablename__ = "recital_audio_segments"
+    # Segment uploads are retried - a segment is stored once however many times it is committed
+    __table_args__ = (UniqueConstraint("recital_session_id", "sequential"),)
 
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     recital_session_id: str = Field(index=True, foreign_key="recital_sessions.id")
     sequential: int
     filename: str
+    size: Optional[int] = Field(default=None)
 
     recital_session: "RecitalSession" = Relationship(back_populates="audio_segments")
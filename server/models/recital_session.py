@@ -1,10 +1,11 @@
+from datetime import datetime
 from enum import Enum
 from typing import Optional
 from uuid import UUID
 
 from pydantic import BaseModel
 from sqlalchemy import Index
-from sqlmodel import Field, Relationship, SQLModel
+from sqlmodel import TIMESTAMP, Field, Relationship, SQLModel
 
 from .mixins.date_fields import DateFieldsMixin
 from .text_document import TextDocument
@@ -37,6 +38,14 @@ class RecitalSession(RecitalSessionBase, SQLModel, table=True):
     light_audio_filename: str = Field(nullable=True)
     text_filename: str = Field(nullable=True)
 
+    # Finalization (aggregation + upload) failure tracking
+    finalization_attempts: int = Field(default=0, nullable=False, sa_column_kwargs={"server_default": "0"})
+    finalization_next_attempt_at: Optional[datetime] = Field(
+        default=None, index=True, nullable=True, sa_type=TIMESTAMP(timezone=True)
+    )
+    finalization_error: Optional[str] = Field(default=None, nullable=True)
+    quarantined: bool = Field(default=False, nullable=False, sa_column_kwargs={"server_default": "false"})
+
     user: Optional["User"] = Relationship(back_populates="recital_sessions")
     text_segments: list["RecitalTextSegment"] = Relationship(back_populates="recital_session")
     audio_segments: list["RecitalAudioSegment"] = Relationship(back_populates="recital_session")
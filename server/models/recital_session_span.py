@@ -0,0 +1,21 @@
+import uuid
+from datetime import datetime
+from typing import Any, Optional
+
+from sqlmodel import JSON, TIMESTAMP, Column, Field, SQLModel
+
+
+class RecitalSessionSpan(SQLModel, table=True):
+    __tablename__ = "recital_session_spans"
+
+    # A traced stage of the session finalization - the spans of a session make its timeline
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    recital_session_id: str = Field(index=True, foreign_key="recital_sessions.id")
+    trace_id: str
+    span_id: str
+    parent_span_id: Optional[str] = Field(default=None, nullable=True)
+    name: str
+    started_at: datetime = Field(sa_type=TIMESTAMP(timezone=True))
+    duration: float  # Seconds
+    status: str
+    attributes: dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSON))
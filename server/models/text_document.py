@@ -47,3 +47,12 @@ class TextDocumentListRead(DateFieldsMixin, BaseModel):
 
 class TextDocumentOwner(BaseModel):
     name: str
+
+
+class TextDocumentParagraphsRead(BaseModel):
+    document_id: uuid.UUID
+    title: Optional[str]
+    public: Optional[bool]
+    start: int
+    total_paragraphs: int
+    paragraphs: list[list[str]]
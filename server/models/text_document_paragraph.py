@@ -0,0 +1,11 @@
+import uuid
+
+from sqlmodel import JSON, Column, Field, SQLModel
+
+
+class TextDocumentParagraph(SQLModel, table=True):
+    __tablename__ = "text_document_paragraphs"
+
+    document_id: uuid.UUID = Field(primary_key=True, foreign_key="text_documents.id")
+    paragraph_index: int = Field(primary_key=True)
+    sentences: list[str] = Field(default_factory=list, sa_column=Column(JSON))
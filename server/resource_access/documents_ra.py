@@ -3,9 +3,11 @@ from typing import Callable, Iterator
 from uuid import UUID
 
 from sqlalchemy.orm import defer
-from sqlmodel import Session, select
+from sqlmodel import Session, delete, func, insert, select
 
 from models.text_document import TextDocument
+from models.text_document_paragraph import TextDocumentParagraph
+from utility.cache import documents as documents_cache
 
 
 class DocumentsRA:
@@ -17,9 +19,12 @@ class DocumentsRA:
         with self.session_factory() as session:
             return session.exec(select(TextDocument))
 
-    def get_by_id(self, id: UUID) -> TextDocument:
+    def get_by_id(self, id: UUID, include_text: bool = True) -> TextDocument:
         with self.session_factory() as session:
-            results = session.exec(select(TextDocument).filter(TextDocument.id == id))
+            select_stmt = select(TextDocument).filter(TextDocument.id == id)
+            if not include_text:
+                select_stmt = select_stmt.options(defer(TextDocument.text))
+            results = session.exec(select_stmt)
             return results.first()
 
     def get_by_owner_id(self, owner_id: str, include_text: bool = False) -> Iterator[TextDocument]:
@@ -30,8 +35,41 @@ class DocumentsRA:
             results = session.exec(select_stmt)
             return results.all()
 
+    def get_paragraphs(self, document_id: UUID, start: int, count: int) -> list[list[str]]:
+        with self.session_factory() as session:
+            results = session.exec(
+                select(TextDocumentParagraph.sentences)
+                .filter(
+                    TextDocumentParagraph.document_id == document_id,
+                    TextDocumentParagraph.paragraph_index >= start,
+                    TextDocumentParagraph.paragraph_index < start + count,
+                )
+                .order_by(TextDocumentParagraph.paragraph_index)
+            )
+            return results.all()
+
+    def get_paragraphs_count(self, document_id: UUID) -> int:
+        with self.session_factory() as session:
+            results = session.exec(select(func.count()).filter(TextDocumentParagraph.document_id == document_id))
+            return results.one()
+
     def upsert(self, text_document: TextDocument) -> None:
         with self.session_factory() as session:
             session.merge(text_document)
+            session.flush()
+
+            # Keep the normalized paragraphs in sync with the document text
+            session.execute(delete(TextDocumentParagraph).where(TextDocumentParagraph.document_id == text_document.id))
+            if text_document.text:
+                session.execute(
+                    insert(TextDocumentParagraph),
+                    [
+                        dict(document_id=text_document.id, paragraph_index=i, sentences=sentences)
+                        for i, sentences in enumerate(text_document.text)
+                    ],
+                )
+
             session.commit()
+
+            documents_cache.invalidate_document(text_document.id)
             return text_document
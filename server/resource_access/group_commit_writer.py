@@ -0,0 +1,92 @@
+import queue
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+from contextlib import AbstractContextManager
+from typing import Callable
+
+from sqlalchemy.sql.dml import Insert
+from sqlmodel import Session
+
+from utility.query_stats import query_source
+
+# Upper bound on the rows written in a single transaction
+MAX_GROUP_COMMIT_ROWS = 1000
+
+
+class GroupCommitWriter:
+    """
+    Write-behind inserter shared by all requests.
+    Rows submitted while the previous transaction commits are grouped together and
+    written with multi-row inserts in a single transaction - so under concurrent load,
+    many small inserts cost one DB round trip. Submitters wait on the returned future,
+    which resolves only once their rows are committed.
+    Rows are grouped per insert statement - pass the same (module level) statement
+    for rows which should be written together.
+    """
+
+    def __init__(self, session_factory: Callable[..., AbstractContextManager[Session]]) -> None:
+        self.session_factory = session_factory
+        self.queue: queue.Queue[tuple[Insert, list[dict], Future]] = queue.Queue()
+        self.thread: threading.Thread = None
+        self.thread_lock = threading.Lock()
+
+    def submit(self, statement: Insert, rows: list[dict]) -> Future:
+        future = Future()
+        if not rows:
+            future.set_result(0)
+            return future
+
+        self._ensure_started()
+        self.queue.put((statement, rows, future))
+        return future
+
+    def _ensure_started(self) -> None:
+        if self.thread is not None:
+            return
+        with self.thread_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="group-commit-writer", daemon=True)
+                self.thread.start()
+
+    def _run(self) -> None:
+        with query_source("group commit writer"):
+            self._write_forever()
+
+    def _write_forever(self) -> None:
+        while True:
+            pending = [self.queue.get()]
+            pending_rows = len(pending[0][1])
+            # Take whatever accumulated meanwhile - no waiting for more
+            while pending_rows < MAX_GROUP_COMMIT_ROWS:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                pending.append(item)
+                pending_rows += len(item[1])
+
+            self._flush(pending)
+
+    def _flush(self, pending: list[tuple[Insert, list[dict], Future]]) -> None:
+        rows_by_statement = defaultdict(list)
+        for statement, rows, _ in pending:
+            rows_by_statement[statement].extend(rows)
+
+        try:
+            with self.session_factory() as session:
+                for statement, rows in rows_by_statement.items():
+                    session.execute(statement, rows)
+                session.commit()
+        except Exception as e:
+            if len(pending) > 1:
+                # Do not fail everyone for a single bad submission - retry each on its own
+                for item in pending:
+                    self._flush([item])
+                return
+
+            pending[0][2].set_exception(e)
+            return
+
+        for _, rows, future in pending:
+            future.set_result(len(rows))
@@ -1,8 +1,37 @@
+import filecmp
 import os
+import shutil
+import tempfile
+import time
+from mimetypes import guess_extension
 from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, NamedTuple, Optional
 
 import boto3
-from botocore.exceptions import ClientError
+from botocore.exceptions import BotoCoreError, ClientError
+
+from utility.data_layout import (
+    SESSIONS_FOLDER,
+    get_flat_layout_file_session_id,
+    get_session_file,
+    get_session_folder,
+)
+from utility.metrics import STORAGE_REQUEST_DURATION, STORAGE_UPLOAD_BYTES
+from utility.tracing import set_span_attributes
+
+# S3 DeleteObjects accepts at most this many keys per request
+MAX_DELETE_OBJECTS_KEYS = 1000
+# S3 multipart uploads require all parts but the last to be at least 5MB
+STORAGE_MULTIPART_PART_SIZE = 8 * 1024 * 1024
+STORAGE_READ_CHUNK_SIZE = 1024 * 1024
+# Stored with every finalized session object ("layout" metadata) - see "Bucket layout" in the README
+STORAGE_LAYOUT_VERSION = "2"
+
+
+class LocalDataFile(NamedTuple):
+    filename: str  # Relative to the data folder
+    size: int
+    modified_at: float
 
 
 class RecitalsContentRA:
@@ -11,9 +40,16 @@ class RecitalsContentRA:
         self,
         data_folder: str,
         content_s3_bucket: str,
+        stream_segments_to_storage: bool = False,
+        direct_segment_uploads: bool = False,
     ) -> None:
         self.data_folder = data_folder
         self.content_s3_bucket = content_s3_bucket
+        # Audio segments go straight to the content storage - and sessions are finalized there
+        self.stream_segments_to_storage = stream_segments_to_storage
+        # Clients may upload audio segments to the content storage themselves - only when finalized there
+        self.direct_segment_uploads = stream_segments_to_storage and direct_segment_uploads
+        self.flat_layout_files_found: Optional[bool] = None
 
         # Create the data folder if it does not exist
         Path(self.data_folder).mkdir(parents=True, exist_ok=True)
@@ -27,6 +63,78 @@ class RecitalsContentRA:
     def get_data_folder(self) -> str:
         return self.data_folder
 
+    def get_session_object_metadata(self, session_id: str, **extra_metadata: str) -> dict[str, str]:
+        return {"session": session_id, "layout": STORAGE_LAYOUT_VERSION, **extra_metadata}
+
+    def get_audio_segment_filename(self, session_id: str, segment_id: int, mime_type: str) -> str:
+        file_extension = guess_extension(mime_type.split(";")[0]) or ".bin"
+        return get_session_file(session_id, f"{session_id}{file_extension}.seg.{segment_id}")
+
+    # Audio segment bytes land in a ".part" file until the segment is committed.
+    # The name keeps the "<session>*.seg.*" form - session cleanup removes leftovers as well.
+    def _get_audio_segment_upload_path(self, session_id: str, segment_id: int) -> Path:
+        return Path(self.data_folder, get_session_file(session_id, f"{session_id}.seg.{segment_id}.part"))
+
+    def get_audio_segment_upload_offset(self, session_id: str, segment_id: int) -> int:
+        try:
+            return os.path.getsize(self._get_audio_segment_upload_path(session_id, segment_id))
+        except FileNotFoundError:
+            return 0
+
+    def open_audio_segment_upload(self, session_id: str, segment_id: int, offset: int) -> BinaryIO:
+        # Resumes the upload at the offset - anything received past it is replaced
+        upload_path = self._get_audio_segment_upload_path(session_id, segment_id)
+        upload_path.parent.mkdir(parents=True, exist_ok=True)
+        upload_file = open(upload_path, "r+b" if upload_path.exists() else "wb")
+        upload_file.seek(offset)
+        upload_file.truncate()
+        return upload_file
+
+    def commit_audio_segment_upload(self, session_id: str, segment_id: int, mime_type: str, size: int) -> Optional[str]:
+        # Returns the stored segment filename - None while not all of its bytes arrived.
+        # Safe to repeat - a segment already moved in place with the expected size is committed
+        upload_path = self._get_audio_segment_upload_path(session_id, segment_id)
+        if self.stream_segments_to_storage:
+            storage_key = self.get_audio_segment_storage_key(session_id, segment_id, mime_type)
+            try:
+                if os.path.getsize(upload_path) != size:
+                    return None
+            except FileNotFoundError:
+                # Uploaded directly (or moved already) - committed once stored whole
+                return storage_key if self.get_storage_object_size(storage_key) == size else None
+            if not self.upload_to_storage(str(upload_path), storage_key, metadata={"session": session_id}):
+                raise Exception("Error uploading the audio segment to storage")
+            upload_path.unlink(missing_ok=True)
+            return storage_key
+
+        filename = self.get_audio_segment_filename(session_id, segment_id, mime_type)
+        segment_path = Path(self.data_folder, filename)
+        try:
+            if os.path.getsize(upload_path) != size:
+                return None
+            os.replace(upload_path, segment_path)
+            return filename
+        except FileNotFoundError:
+            return filename if segment_path.exists() and os.path.getsize(segment_path) == size else None
+
+    def store_audio_segment(self, session_id: str, segment_id: int, mime_type: str, audio_data: bytes) -> str:
+        # A whole segment upload - a single chunk upload and commit
+        if self.stream_segments_to_storage:
+            storage_key = self.get_audio_segment_storage_key(session_id, segment_id, mime_type)
+            if not self.put_to_storage(
+                audio_data, storage_key, metadata={"session": session_id}, content_type=mime_type
+            ):
+                raise Exception("Error uploading the audio segment to storage")
+            return storage_key
+
+        with self.open_audio_segment_upload(session_id, segment_id, 0) as buffer:
+            buffer.write(audio_data)
+        filename = self.commit_audio_segment_upload(session_id, segment_id, mime_type, len(audio_data))
+        if not filename:
+            # A concurrent upload of the same segment changed the written bytes
+            raise Exception("Error committing the audio segment - not all of its bytes were stored")
+        return filename
+
     def upload_to_storage(self, source: str, target: str, metadata: dict[str, str], content_type: str = None) -> bool:
         if not self._storage_s3_configured():
             return False
@@ -45,71 +153,316 @@ class RecitalsContentRA:
             if content_type:
                 extra_args["ContentType"] = content_type
 
-            s3.upload_file(source, self.content_s3_bucket, target, ExtraArgs=extra_args)
+            with STORAGE_REQUEST_DURATION.labels("upload_file").time():
+                s3.upload_file(
+                    source,
+                    self.content_s3_bucket,
+                    target,
+                    ExtraArgs=extra_args,
+                    Callback=STORAGE_UPLOAD_BYTES.labels("upload_file").inc,
+                )
         except ClientError as e:
             print(e)
             return False
+        set_span_attributes(storage_key=target, storage_bytes=os.path.getsize(source))
         return True
 
-    def delete_from_storage(self, targets: list[str]) -> bool:
+    def put_to_storage(self, data: bytes, target: str, metadata: dict[str, str], content_type: str = None) -> bool:
+        if not self._storage_s3_configured():
+            return False
+
+        s3 = boto3.client("s3")
+        try:
+            extra_args = {"Metadata": metadata}
+            if content_type:
+                extra_args["ContentType"] = content_type
+
+            with STORAGE_REQUEST_DURATION.labels("put").time():
+                s3.put_object(Bucket=self.content_s3_bucket, Key=target, Body=data, **extra_args)
+            STORAGE_UPLOAD_BYTES.labels("put").inc(len(data))
+        except ClientError as e:
+            print(e)
+            return False
+        set_span_attributes(storage_key=target, storage_bytes=len(data))
+        return True
+
+    def upload_stream_to_storage(
+        self, source: BinaryIO, target: str, metadata: dict[str, str], content_type: str = None
+    ) -> bool:
+        # The source may be a pipe - it is read through once, in multipart chunks
         if not self._storage_s3_configured():
             return False
 
-        # remove from S3
         s3 = boto3.client("s3")
+        uploaded_chunks = []  # Reported from the transfer threads
+
+        def record_upload_progress(chunk_size: int) -> None:
+            STORAGE_UPLOAD_BYTES.labels("upload_stream").inc(chunk_size)
+            uploaded_chunks.append(chunk_size)
 
         try:
-            s3.delete_object(
-                Bucket=self.content_s3_bucket,
-                Delete={
-                    "Objects": [
-                        {"Key": target for target in targets},
-                    ],
-                    "Quiet": True,
-                },
-            )
+            extra_args = {"Metadata": metadata}
+            if content_type:
+                extra_args["ContentType"] = content_type
+
+            with STORAGE_REQUEST_DURATION.labels("upload_stream").time():
+                s3.upload_fileobj(
+                    source, self.content_s3_bucket, target, ExtraArgs=extra_args, Callback=record_upload_progress
+                )
         except ClientError as e:
             print(e)
             return False
+        set_span_attributes(storage_key=target, storage_bytes=sum(uploaded_chunks))
         return True
 
-    def delete_from_storage_prefix(self, prefix: str) -> bool:
+    def download_stream_from_storage(self, source: str, target: BinaryIO) -> bool:
+        # The target may be a pipe - it is written in order
         if not self._storage_s3_configured():
             return False
 
-        if not prefix:
-            print("Warning prefix is not provided. Not deleting anything.")
+        s3 = boto3.client("s3")
+        try:
+            with STORAGE_REQUEST_DURATION.labels("download_stream").time():
+                s3.download_fileobj(self.content_s3_bucket, source, target)
+        except ClientError as e:
+            print(e)
             return False
+        return True
+
+    def read_from_storage(self, source: str, max_bytes: int) -> Optional[bytes]:
+        if not self._storage_s3_configured():
+            return None
+
+        s3 = boto3.client("s3")
+        try:
+            response = s3.get_object(Bucket=self.content_s3_bucket, Key=source, Range=f"bytes=0-{max_bytes - 1}")
+            return response["Body"].read()
+        except ClientError as e:
+            print(e)
+            return None
 
-        s3 = boto3.resource("s3")
+    def get_storage_object_size(self, target: str) -> Optional[int]:
+        if not self._storage_s3_configured():
+            return None
 
+        s3 = boto3.client("s3")
         try:
-            # remove from S3 by the object prefix
-            bucket = s3.Bucket(self.content_s3_bucket)
-            bucket.objects.filter(Prefix=prefix).delete()
+            return s3.head_object(Bucket=self.content_s3_bucket, Key=target)["ContentLength"]
+        except ClientError:
+            return None  # Missing - or not accessible
+
+    def get_audio_segment_direct_upload(
+        self, session_id: str, segment_id: int, mime_type: str, max_size: int, expires_in: int = 300
+    ) -> Optional[dict]:
+        # A presigned POST form - unlike a presigned PUT it bounds the size and type of the upload
+        if not self._storage_s3_configured():
+            return None
 
-        except Exception as e:
+        storage_key = self.get_audio_segment_storage_key(session_id, segment_id, mime_type)
+        s3 = boto3.client("s3")
+        try:
+            return s3.generate_presigned_post(
+                self.content_s3_bucket,
+                storage_key,
+                Fields={"Content-Type": mime_type, "x-amz-meta-session": session_id},
+                Conditions=[
+                    {"Content-Type": mime_type},
+                    {"x-amz-meta-session": session_id},
+                    ["content-length-range", 1, max_size],
+                ],
+                ExpiresIn=expires_in,
+            )
+        except ClientError as e:
             print(e)
+            return None
+
+    def list_storage_keys(self, prefix: str) -> set[str]:
+        if not self._storage_s3_configured():
+            return set()
+
+        s3 = boto3.client("s3")
+        pages = s3.get_paginator("list_objects_v2").paginate(Bucket=self.content_s3_bucket, Prefix=prefix)
+        return {stored_object["Key"] for page in pages for stored_object in page.get("Contents", [])}
+
+    def concat_in_storage(self, sources: list[str], target: str, metadata: dict[str, str]) -> bool:
+        # Streams the sources in order into a multipart upload of the target - the content
+        # never touches the local disk, and at most a single part is held in memory
+        if not self._storage_s3_configured():
+            return False
+
+        s3 = boto3.client("s3")
+        upload_id = s3.create_multipart_upload(Bucket=self.content_s3_bucket, Key=target, Metadata=metadata)["UploadId"]
+        parts = []
+        part_sizes = []
+
+        def upload_part(data: bytes) -> None:
+            part_number = len(parts) + 1
+            response = s3.upload_part(
+                Bucket=self.content_s3_bucket, Key=target, UploadId=upload_id, PartNumber=part_number, Body=data
+            )
+            parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+            STORAGE_UPLOAD_BYTES.labels("concat").inc(len(data))
+            part_sizes.append(len(data))
+
+        def abort_upload() -> None:
+            # Uploaded parts are kept (and billed) until the upload is aborted
+            try:
+                s3.abort_multipart_upload(Bucket=self.content_s3_bucket, Key=target, UploadId=upload_id)
+            except Exception as e:
+                print(f"Error aborting the multipart upload of {target}: {e}")
+
+        started = time.perf_counter()
+        try:
+            part_data = bytearray()
+            for source in sources:
+                source_body = s3.get_object(Bucket=self.content_s3_bucket, Key=source)["Body"]
+                for chunk in source_body.iter_chunks(STORAGE_READ_CHUNK_SIZE):
+                    part_data += chunk
+                    if len(part_data) >= STORAGE_MULTIPART_PART_SIZE:
+                        upload_part(bytes(part_data))
+                        part_data.clear()
+            # The last part may be of any size
+            if part_data or not parts:
+                upload_part(bytes(part_data))
+
+            s3.complete_multipart_upload(
+                Bucket=self.content_s3_bucket, Key=target, UploadId=upload_id, MultipartUpload={"Parts": parts}
+            )
+        except ClientError as e:
+            print(e)
+            abort_upload()
             return False
+        except Exception:
+            # Connection errors or timeouts - the parts are not left behind either
+            abort_upload()
+            raise
+        finally:
+            STORAGE_REQUEST_DURATION.labels("concat").observe(time.perf_counter() - started)
+        set_span_attributes(storage_key=target, storage_bytes=sum(part_sizes))
         return True
 
+    # Returns the keys which failed to delete, with the reason - empty when all were deleted
+    def delete_from_storage(self, targets: list[str]) -> dict[str, str]:
+        if not targets:
+            return {}
+
+        if not self._storage_s3_configured():
+            return {target: "S3 target bucket is not configured" for target in targets}
+
+        # remove from S3
+        try:
+            s3 = boto3.client("s3")
+        except BotoCoreError as e:  # e.g. no region configured
+            print(e)
+            return {target: str(e) for target in targets}
+
+        failures = {}
+        for batch_start in range(0, len(targets), MAX_DELETE_OBJECTS_KEYS):
+            batch = targets[batch_start : batch_start + MAX_DELETE_OBJECTS_KEYS]
+            try:
+                # Quiet - only the keys which failed are reported back
+                with STORAGE_REQUEST_DURATION.labels("delete").time():
+                    response = s3.delete_objects(
+                        Bucket=self.content_s3_bucket,
+                        Delete={
+                            "Objects": [{"Key": target} for target in batch],
+                            "Quiet": True,
+                        },
+                    )
+            except (ClientError, BotoCoreError) as e:
+                # Connection errors, timeouts and missing credentials fail the batch as well
+                print(e)
+                failures.update({target: str(e) for target in batch})
+                continue
+
+            for error in response.get("Errors", []):
+                failures[error["Key"]] = f"{error.get('Code')}: {error.get('Message')}"
+
+        return failures
+
+    # Session content is stored under "<session_id>/" - keys are derived from the session alone
+    # (and the extension of the local audio files) so they are known without listing the bucket.
+    def is_storage_key(self, session_id: str, filename: str | None) -> bool:
+        # Content finalized in the storage is recorded by its key - local data files are never named so
+        return bool(filename) and filename.startswith(f"{session_id}/")
+
+    def get_audio_segment_storage_key(self, session_id: str, segment_id: int, mime_type: str) -> str:
+        file_extension = guess_extension(mime_type.split(";")[0]) or ".bin"
+        return f"{session_id}/segments/{segment_id}{file_extension}"
+
+    def _get_text_storage_key(self, session_id: str) -> str:
+        return f"{session_id}/transcript.vtt"
+
+    def get_audio_storage_key(self, session_id: str, filename: str, target_filename_prefix: str) -> str:
+        extension_of_file = os.path.splitext(filename)[1]
+        return f"{session_id}/{target_filename_prefix}{extension_of_file}"
+
+    def get_session_storage_keys(
+        self,
+        session_id: str,
+        text_filename: str | None,
+        main_audio_filename: str | None,
+        source_audio_filename: str | None,
+        light_audio_filename: str | None,
+    ) -> list[str]:
+        storage_keys = [self._get_text_storage_key(session_id)] if text_filename else []
+        for filename, target_filename_prefix in [
+            (main_audio_filename, "main.audio"),
+            (source_audio_filename, "source.audio"),
+            (light_audio_filename, "light.audio"),
+        ]:
+            if self.is_storage_key(session_id, filename):
+                storage_keys.append(filename)  # Content finalized in the storage, or pointing at another object
+            elif filename:
+                storage_keys.append(self.get_audio_storage_key(session_id, filename, target_filename_prefix))
+        # A source stored once with the main audio shares its key
+        return list(dict.fromkeys(storage_keys))
+
+    def store_text_in_storage(self, session_id: str, text_content: Iterable[str]) -> Optional[str]:
+        # Returns the storage key - None if there was no content
+        with tempfile.SpooledTemporaryFile(max_size=STORAGE_MULTIPART_PART_SIZE) as text_file:
+            for chunk in text_content:
+                text_file.write(chunk.encode("utf-8"))
+            if text_file.tell() == 0:
+                return None
+
+            text_file.seek(0)
+            target_object_name = self._get_text_storage_key(session_id)
+            metadata = self.get_session_object_metadata(session_id)
+            if not self.upload_stream_to_storage(text_file, target_object_name, metadata=metadata):
+                raise Exception("Error uploading session text to storage")
+        return target_object_name
+
     def upload_text_to_storage(self, session_id: str, filename: str) -> bool:
         filename_in_data_folder = os.path.join(self.data_folder, filename)
-        target_object_name = f"{session_id}/transcript.vtt"
-        return self.upload_to_storage(filename_in_data_folder, target_object_name, metadata={"session": session_id})
+        target_object_name = self._get_text_storage_key(session_id)
+        return self.upload_to_storage(
+            filename_in_data_folder, target_object_name, metadata=self.get_session_object_metadata(session_id)
+        )
 
     def _upload_audio_to_storage(
-        self, session_id: str, filename: str, target_filename_prefix: str, content_type: str = None
+        self,
+        session_id: str,
+        filename: str,
+        target_filename_prefix: str,
+        content_type: str = None,
+        metadata: dict[str, str] = None,
     ) -> bool:
         filename_in_data_folder = Path(self.data_folder, filename)
-        extension_of_file = os.path.splitext(filename)[1]
-        target_object_name = f"{session_id}/{target_filename_prefix}{extension_of_file}"
+        target_object_name = self.get_audio_storage_key(session_id, filename, target_filename_prefix)
         return self.upload_to_storage(
-            filename_in_data_folder, target_object_name, metadata={"session": session_id}, content_type=content_type
+            filename_in_data_folder,
+            target_object_name,
+            metadata=metadata or self.get_session_object_metadata(session_id),
+            content_type=content_type,
         )
 
-    def upload_main_audio_to_storage(self, session_id: str, filename: str) -> bool:
-        return self._upload_audio_to_storage(session_id, filename, "main.audio", {})
+    def upload_main_audio_to_storage(self, session_id: str, filename: str, is_source_audio: bool = False) -> bool:
+        # The main audio stored as the source audio too says so - there is no source.audio object then
+        metadata = self.get_session_object_metadata(session_id)
+        if is_source_audio:
+            metadata["source-audio"] = "main.audio"
+        return self._upload_audio_to_storage(session_id, filename, "main.audio", {}, metadata=metadata)
 
     def upload_source_audio_to_storage(self, session_id: str, filename: str) -> bool:
         return self._upload_audio_to_storage(session_id, filename, "source.audio", {})
@@ -117,14 +470,113 @@ class RecitalsContentRA:
     def upload_light_audio_to_storage(self, session_id: str, filename: str) -> bool:
         return self._upload_audio_to_storage(session_id, filename, "light.audio", content_type="audio/mp3")
 
+    def are_identical_data_files(self, filename: str | None, other_filename: str | None) -> bool:
+        if not filename or not other_filename:
+            return False
+        path = Path(self.data_folder, filename)
+        other_path = Path(self.data_folder, other_filename)
+        if not path.is_file() or not other_path.is_file():
+            return False
+        # The same file (or hardlinks of it) - otherwise compared byte by byte, only when the sizes match
+        if os.path.samefile(path, other_path):
+            return True
+        return filecmp.cmp(path, other_path, shallow=False)
+
     def remove_local_data_file(self, filename: str) -> None:
         filename_in_data_folder = Path(self.data_folder, filename)
         if filename_in_data_folder.exists():
             filename_in_data_folder.unlink()
 
-    def delete_session_content_from_storage(self, session_id: str) -> bool:
-        session_content_folder_name = session_id
-        return self.delete_from_storage_prefix(prefix=session_content_folder_name)
+    def remove_session_local_data(self, session_id: str) -> None:
+        # Everything the session stored locally is in its own folder
+        shutil.rmtree(Path(self.data_folder, get_session_folder(session_id)), ignore_errors=True)
+
+    def get_data_folder_free_bytes(self) -> int:
+        return shutil.disk_usage(self.data_folder).free
+
+    def iter_session_folder_batches(self) -> Iterator[list[tuple[str, list[LocalDataFile]]]]:
+        # The folder layout is the index of local session data - yields the session folders
+        # of one bucket at a time, with the files each holds
+        sessions_folder = Path(self.data_folder, SESSIONS_FOLDER)
+        if not sessions_folder.is_dir():
+            return
+
+        with os.scandir(sessions_folder) as buckets:
+            for bucket in buckets:
+                if not bucket.is_dir(follow_symlinks=False):
+                    continue
+
+                batch = []
+                with os.scandir(bucket.path) as session_folders:
+                    for session_folder in session_folders:
+                        if not session_folder.is_dir(follow_symlinks=False):
+                            continue
+
+                        session_id = session_folder.name
+                        data_files = []
+                        with os.scandir(session_folder.path) as entries:
+                            for entry in entries:
+                                if not entry.is_file(follow_symlinks=False):
+                                    continue
+                                stat_result = entry.stat(follow_symlinks=False)
+                                data_files.append(
+                                    LocalDataFile(
+                                        filename=get_session_file(session_id, entry.name),
+                                        size=stat_result.st_size,
+                                        modified_at=stat_result.st_mtime,
+                                    )
+                                )
+                        batch.append((session_id, data_files))
+
+                if batch:
+                    yield batch
+
+    def remove_local_data_file_if_unmodified(self, data_file: LocalDataFile) -> bool:
+        # A file written to since it was listed is left alone
+        filename_in_data_folder = Path(self.data_folder, data_file.filename)
+        try:
+            if os.stat(filename_in_data_folder).st_mtime != data_file.modified_at:
+                return False
+            filename_in_data_folder.unlink()
+        except FileNotFoundError:
+            return False
+        return True
+
+    def remove_empty_session_folder(self, session_id: str) -> None:
+        try:
+            os.rmdir(Path(self.data_folder, get_session_folder(session_id)))
+        except OSError:
+            pass  # Not empty (or already gone)
+
+    def _iter_flat_layout_files(self) -> Iterator[tuple[os.DirEntry, str]]:
+        # Files which are not session files (by their name) are skipped
+        with os.scandir(self.data_folder) as entries:
+            for entry in entries:
+                if entry.name == SESSIONS_FOLDER or not entry.is_file(follow_symlinks=False):
+                    continue
+                session_id = get_flat_layout_file_session_id(entry.name)
+                if session_id:
+                    yield entry, session_id
+
+    def has_flat_layout_files(self) -> bool:
+        # Checked once per process - new files always go to session folders,
+        # and the data layout is migrated while the server is stopped
+        if self.flat_layout_files_found is None:
+            self.flat_layout_files_found = next(self._iter_flat_layout_files(), None) is not None
+        return self.flat_layout_files_found
+
+    def migrate_flat_layout_files(self) -> int:
+        # Moves files of the flat legacy layout into their session folders - safe to repeat.
+        # Returns the number of files moved.
+        moved_count = 0
+        for entry, session_id in self._iter_flat_layout_files():
+            target_path = Path(self.data_folder, get_session_file(session_id, entry.name))
+            target_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(entry.path, target_path)
+            moved_count += 1
+
+        self.flat_layout_files_found = False
+        return moved_count
 
     def get_url_to_storage_object(self, target: str, expires_in: int = 1200) -> str:
         if not self._storage_s3_configured():
@@ -149,5 +601,5 @@ class RecitalsContentRA:
         return self.get_url_to_storage_object(target_object_name, **kwargs)
 
     def get_url_to_transcript(self, session_id: str, **kwargs) -> str:
-        target_object_name = f"{session_id}/transcript.vtt"
+        target_object_name = self._get_text_storage_key(session_id)
         return self.get_url_to_storage_object(target_object_name, **kwargs)
@@ -1,12 +1,50 @@
+import os
+import uuid
+from concurrent.futures import Future
 from contextlib import AbstractContextManager
 from datetime import datetime, timedelta, timezone
-from typing import Callable, Iterator
+from typing import Callable, Iterable, Iterator
 
-from sqlmodel import Session, and_, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, and_, delete, func, insert, not_, or_, select, update
 
 from models.recital_audio_segment import RecitalAudioSegment
 from models.recital_session import RecitalSession, SessionStatus
+from models.recital_session_span import RecitalSessionSpan
 from models.recital_text_segment import RecitalTextSegment
+from resource_access.group_commit_writer import GroupCommitWriter
+from utility.cache.sessions import SessionAccess, invalidate_session, session_access
+from utility.tracing import set_span_attributes
+
+
+def _finalization_eligible(now: datetime):
+    # Quarantined sessions wait for an admin, failed ones wait out their backoff
+    return and_(
+        RecitalSession.quarantined != True,
+        or_(
+            RecitalSession.finalization_next_attempt_at == None,
+            RecitalSession.finalization_next_attempt_at <= now,
+        ),
+    )
+
+
+# Sessions which failed less are served first, oldest first among equals -
+# so a pile of repeatedly failing sessions cannot starve the healthy ones.
+_finalization_order = (RecitalSession.finalization_attempts, RecitalSession.created_at)
+
+
+_text_segments_insert = insert(RecitalTextSegment)
+
+# Retried segment commits replace the stored segment instead of duplicating it
+_audio_segment_upsert = pg_insert(RecitalAudioSegment)
+_audio_segment_upsert = _audio_segment_upsert.on_conflict_do_update(
+    index_elements=[RecitalAudioSegment.recital_session_id, RecitalAudioSegment.sequential],
+    set_={
+        "filename": _audio_segment_upsert.excluded.filename,
+        "size": _audio_segment_upsert.excluded.size,
+        "updated_at": _audio_segment_upsert.excluded.updated_at,
+    },
+)
 
 
 class RecitalsRA:
@@ -15,9 +53,11 @@ class RecitalsRA:
         self,
         session_factory: Callable[..., AbstractContextManager[Session]],
         data_folder: str,
+        segment_writer: GroupCommitWriter,
     ) -> None:
         self.session_factory = session_factory
         self.data_folder = data_folder
+        self.segment_writer = segment_writer
 
     def get_by_id(self, recital_session_id: str) -> RecitalSession | None:
         with self.session_factory() as session:
@@ -34,11 +74,33 @@ class RecitalsRA:
             )
             return results.first()
 
+    def get_by_ids(self, recital_session_ids: list[str]) -> list[RecitalSession]:
+        with self.session_factory() as session:
+            results = session.exec(select(RecitalSession).filter(RecitalSession.id.in_(recital_session_ids)))
+            return results.all()
+
+    # Ownership and status only - served from the in-process cache on the hot upload paths
+    def get_access_by_id_and_user_id(self, recital_session_id: str, user_id: str) -> SessionAccess | None:
+        access = session_access.get(recital_session_id)
+        if access is None:
+            load_token = session_access.begin_load()
+            with self.session_factory() as session:
+                result = session.exec(
+                    select(
+                        RecitalSession.id, RecitalSession.user_id, RecitalSession.status, RecitalSession.disavowed
+                    ).filter(RecitalSession.id == recital_session_id)
+                ).first()
+            if result is None:
+                return None
+            access = SessionAccess(*result)
+            session_access.set(access, load_token)
+
+        return access if str(access.user_id) == str(user_id) else None
+
     def get_ended_sessions(self, limit: int = 100, consider_abandoned_after_hours: int = 2) -> Iterator[RecitalSession]:
         with self.session_factory() as session:
-            cutoff_consider_active_as_ended = datetime.now(timezone.utc) - timedelta(
-                hours=consider_abandoned_after_hours
-            )
+            now = datetime.now(timezone.utc)
+            cutoff_consider_active_as_ended = now - timedelta(hours=consider_abandoned_after_hours)
             results = session.exec(
                 select(RecitalSession)
                 .filter(
@@ -53,8 +115,10 @@ class RecitalsRA:
                             ),
                         ),
                         RecitalSession.disavowed != True,
+                        _finalization_eligible(now),
                     )
                 )
+                .order_by(*_finalization_order)
                 .limit(limit)
             )
             return results.all()
@@ -67,8 +131,10 @@ class RecitalsRA:
                     and_(
                         RecitalSession.status == SessionStatus.AGGREGATED,
                         RecitalSession.disavowed != True,
+                        _finalization_eligible(datetime.now(timezone.utc)),
                     )
                 )
+                .order_by(*_finalization_order)
                 .limit(limit)
             )
             return results.all()
@@ -87,11 +153,30 @@ class RecitalsRA:
             )
             return results.all()
 
-    def add_text_segment(self, recital_text_segment: RecitalTextSegment):
+    def get_finalization_backlog(self) -> list[tuple[str, bool, bool, int]]:
+        # (status, disavowed, quarantined, count) of the sessions finalization did not complete yet
         with self.session_factory() as session:
-            session.add(recital_text_segment)
-            session.commit()
-            session.refresh(recital_text_segment)
+            results = session.exec(
+                select(RecitalSession.status, RecitalSession.disavowed, RecitalSession.quarantined, func.count())
+                .filter(
+                    or_(
+                        RecitalSession.status.in_(
+                            [SessionStatus.ACTIVE, SessionStatus.ENDED, SessionStatus.AGGREGATED]
+                        ),
+                        and_(RecitalSession.status != SessionStatus.DISCARDED, RecitalSession.disavowed == True),
+                    )
+                )
+                .group_by(RecitalSession.status, RecitalSession.disavowed, RecitalSession.quarantined)
+            )
+            return [(status.value, disavowed, quarantined, count) for status, disavowed, quarantined, count in results]
+
+    # Segment writes go through the shared group commit writer - the returned future
+    # resolves with the number of rows once they are committed.
+    def add_text_segments(self, recital_session_id: str, segments: Iterable[tuple[float, str]]) -> Future:
+        rows = [
+            dict(recital_session_id=recital_session_id, seek_end=seek_end, text=text) for seek_end, text in segments
+        ]
+        return self.segment_writer.submit(_text_segments_insert, rows)
 
     def get_session_text_segments(self, recital_session_id: str) -> Iterator[RecitalTextSegment]:
         with self.session_factory() as session:
@@ -102,11 +187,42 @@ class RecitalsRA:
             )
             return results.all()
 
-    def add_audio_segment(self, recital_audio_segment: RecitalAudioSegment):
+    def iter_session_text_segments(
+        self, recital_session_id: str, batch_size: int = 1000
+    ) -> Iterator[tuple[float, str]]:
+        # Streams (seek_end, text) rows through a server side cursor - no ORM objects
         with self.session_factory() as session:
-            session.add(recital_audio_segment)
-            session.commit()
-            session.refresh(recital_audio_segment)
+            results = session.exec(
+                select(RecitalTextSegment.seek_end, RecitalTextSegment.text)
+                .filter(RecitalTextSegment.recital_session_id == recital_session_id)
+                .order_by(RecitalTextSegment.seek_end)
+                .execution_options(yield_per=batch_size)
+            )
+            for seek_end, text in results:
+                yield seek_end, text
+
+    def add_audio_segment(self, recital_session_id: str, sequential: int, filename: str, size: int) -> Future:
+        rows = [dict(recital_session_id=recital_session_id, sequential=sequential, filename=filename, size=size)]
+        return self.segment_writer.submit(_audio_segment_upsert, rows)
+
+    def get_audio_segment(self, recital_session_id: str, sequential: int) -> RecitalAudioSegment | None:
+        with self.session_factory() as session:
+            results = session.exec(
+                select(RecitalAudioSegment).filter(
+                    RecitalAudioSegment.recital_session_id == recital_session_id,
+                    RecitalAudioSegment.sequential == sequential,
+                )
+            )
+            return results.first()
+
+    def get_audio_segment_filenames(self, recital_session_ids: list[str]) -> set[str]:
+        with self.session_factory() as session:
+            results = session.exec(
+                select(RecitalAudioSegment.filename).filter(
+                    RecitalAudioSegment.recital_session_id.in_(recital_session_ids)
+                )
+            )
+            return set(results.all())
 
     def get_audio_segments(self, recital_session_id: str) -> Iterator[RecitalAudioSegment]:
         with self.session_factory() as session:
@@ -117,12 +233,99 @@ class RecitalsRA:
             )
             return results.all()
 
+    def add_session_spans(self, spans: list[RecitalSessionSpan]) -> None:
+        if not spans:
+            return
+
+        with self.session_factory() as session:
+            session.add_all(spans)
+            session.commit()
+
+    def get_session_spans(self, recital_session_id: str) -> list[RecitalSessionSpan]:
+        with self.session_factory() as session:
+            results = session.exec(
+                select(RecitalSessionSpan)
+                .filter(RecitalSessionSpan.recital_session_id == recital_session_id)
+                .order_by(RecitalSessionSpan.started_at)
+            )
+            return results.all()
+
+    def delete_session_spans(self, statuses: list[SessionStatus], started_before: datetime) -> int:
+        # Returns the number of deleted spans
+        with self.session_factory() as session:
+            result = session.execute(
+                delete(RecitalSessionSpan).where(
+                    RecitalSessionSpan.started_at < started_before,
+                    RecitalSessionSpan.recital_session_id.in_(
+                        select(RecitalSession.id).where(RecitalSession.status.in_(statuses))
+                    ),
+                )
+            )
+            session.commit()
+            return result.rowcount
+
+    def get_sessions_with_flat_layout_files(self) -> list[RecitalSession]:
+        filename_columns = [
+            RecitalSession.text_filename,
+            RecitalSession.source_audio_filename,
+            RecitalSession.main_audio_filename,
+            RecitalSession.light_audio_filename,
+        ]
+        with self.session_factory() as session:
+            results = session.exec(
+                select(RecitalSession).filter(
+                    or_(*[and_(column != None, not_(column.contains("/"))) for column in filename_columns])
+                )
+            )
+            return results.all()
+
+    def get_audio_segments_with_flat_layout_files(self, limit: int = 1000) -> list[RecitalAudioSegment]:
+        with self.session_factory() as session:
+            results = session.exec(
+                select(RecitalAudioSegment).filter(not_(RecitalAudioSegment.filename.contains("/"))).limit(limit)
+            )
+            return results.all()
+
+    def update_audio_segment_filenames(self, filenames: dict[uuid.UUID, str]) -> None:
+        with self.session_factory() as session:
+            session.execute(
+                update(RecitalAudioSegment),
+                [{"id": segment_id, "filename": filename} for segment_id, filename in filenames.items()],
+            )
+            session.commit()
+
     def upsert(self, recital_session: RecitalSession) -> None:
         with self.session_factory() as session:
             session.merge(recital_session)
             session.commit()
+            # All session writes (end, disavow, finalization) go through here
+            invalidate_session(recital_session.id)
             return recital_session
 
-    def store_session_text(self, text_content: str, filename: str) -> str:
-        with open(f"{self.data_folder}/{filename}", "w") as f:
-            f.write(text_content)
+    def store_session_text(self, text_content: str | Iterable[str], filename: str) -> int:
+        # Accepts the content or a stream of content chunks.
+        # Returns the number of characters written - nothing is stored if there was no content.
+        if isinstance(text_content, str):
+            text_content = [text_content]
+
+        target_filename = f"{self.data_folder}/{filename}"
+        os.makedirs(os.path.dirname(target_filename), exist_ok=True)
+        # Write aside and move into place - a partial file is never left under the target name
+        temp_filename = f"{target_filename}.tmp"
+        written_length = 0
+        try:
+            with open(temp_filename, "w") as f:
+                for chunk in text_content:
+                    f.write(chunk)
+                    written_length += len(chunk)
+        except BaseException:
+            os.remove(temp_filename)
+            raise
+
+        if written_length == 0:
+            os.remove(temp_filename)
+            return 0
+
+        os.replace(temp_filename, target_filename)
+        set_span_attributes(bytes=os.path.getsize(target_filename))
+        return written_length
@@ -8,7 +8,7 @@ from sqlmodel import Numeric, Session, cast, desc, func, select
 
 from models.recital_session import RecitalSession, SessionStatus
 from models.user import User
-from utility.cache.stats import CacheKeys, region
+from utility.cache.stats import CacheKeys, cache_on_arguments
 
 
 class UserLeaderBoard(BaseModel):
@@ -36,7 +36,7 @@ class StatsRA:
     ) -> None:
         self.session_factory = session_factory
 
-    @region.cache_on_arguments(namespace={"key_range": CacheKeys.user_stats}, expiration_time=60 * 1)
+    @cache_on_arguments(namespace={"key_range": CacheKeys.user_stats}, expiration_time=60 * 1)
     def user_stats(self, user_id: str):
         with self.session_factory() as session:
 
@@ -80,7 +80,7 @@ class StatsRA:
                 total_recordings=user_stats.total_recordings,
             )
 
-    @region.cache_on_arguments(namespace={"fixed_key": CacheKeys.leaderboard}, expiration_time=60 * 1)
+    @cache_on_arguments(namespace={"fixed_key": CacheKeys.leaderboard}, expiration_time=60 * 1)
     def leader_board(self, top: int = 10) -> list[UserLeaderBoard]:
         with self.session_factory() as session:
 
@@ -110,7 +110,7 @@ class StatsRA:
 
             return results.all()
 
-    @region.cache_on_arguments(namespace={"fixed_key": CacheKeys.totals}, expiration_time=60 * 10)
+    @cache_on_arguments(namespace={"fixed_key": CacheKeys.totals}, expiration_time=60 * 10)
     def totals(self) -> TotalStats:
         with self.session_factory() as session:
 
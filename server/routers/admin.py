@@ -2,16 +2,23 @@ from typing import Container
 
 from anyio import Path
 from dependency_injector.wiring import Provide, inject
-from fastapi import APIRouter, Depends, HTTPException, Path
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from fastapi.responses import PlainTextResponse
 from fastcrud import FilterConfig, crud_router
 from pydantic import BaseModel
 
 from containers import Container
+from errors import MissingSessionError
+from managers.data_folder_manager import DataFolderCollectionReport, DataFolderManager
 from managers.recital_manager import RecitalManager
 from models.database import get_async_session
+from models.recital_session_span import RecitalSessionSpan
 from models.user import User, UserCreate, UserUpdate
 from resource_access.recitals_content_ra import RecitalsContentRA
 from resource_access.recitals_ra import RecitalsRA
+from utility.profiling import ProfileStore
+from utility.query_stats import QueryStatsEntry, QueryStatsGroupBy, QueryStatsOrderBy, query_stats
+from utility.transcode_scheduler import TranscodeScheduler, TranscodeSchedulerStatus
 
 from .dependencies.analytics import Tracker
 from .dependencies.users import get_admin_user
@@ -69,6 +76,34 @@ def get_session_preview(
     )
 
 
+@sessions_router.get("/{session_id}/timeline")
+@inject
+def get_session_timeline(
+    session_id: str = Path(...),
+    recital_manager: RecitalManager = Depends(Provide[Container.recital_manager]),
+) -> list[RecitalSessionSpan]:
+    # The traced finalization stages of the session - every attempt, in order
+    try:
+        return recital_manager.get_session_timeline(session_id)
+    except MissingSessionError:
+        raise HTTPException(status_code=404, detail="Recital session not found")
+
+
+@sessions_router.post("/{session_id}/release")
+@inject
+def release_quarantined_session(
+    track_event: Tracker,
+    session_id: str = Path(...),
+    recital_manager: RecitalManager = Depends(Provide[Container.recital_manager]),
+) -> None:
+    try:
+        recital_manager.release_quarantined_session(session_id)
+    except MissingSessionError:
+        raise HTTPException(status_code=404, detail="Recital session not found")
+
+    track_event("Session Quarantine Released", {"session_id": session_id})
+
+
 @sessions_router.post("/aggregate")
 @inject
 def aggregate_sessions(
@@ -111,5 +146,85 @@ def aggregate_and_upload_sessions(
     recital_manager.discard_disavowed_sessions()
 
 
+## Data Folder
+
+data_folder_router = APIRouter(prefix="/data-folder")
+
+
+@data_folder_router.get("/gc")
+@inject
+def get_data_folder_collection_report(
+    data_folder_manager: DataFolderManager = Depends(Provide[Container.data_folder_manager]),
+) -> DataFolderCollectionReport:
+    # Dry run - what a collection would reclaim now
+    return data_folder_manager.collect_garbage(dry_run=True)
+
+
+@data_folder_router.post("/gc")
+@inject
+def collect_data_folder_garbage(
+    track_event: Tracker,
+    data_folder_manager: DataFolderManager = Depends(Provide[Container.data_folder_manager]),
+) -> DataFolderCollectionReport:
+    track_event("Data Folder Collection Invoked")
+    return data_folder_manager.collect_garbage()
+
+
+## Transcodes
+
+transcodes_router = APIRouter(prefix="/transcodes")
+
+
+@transcodes_router.get("")
+@inject
+def get_transcodes_status(
+    transcode_scheduler: TranscodeScheduler = Depends(Provide[Container.transcode_scheduler]),
+) -> TranscodeSchedulerStatus:
+    # Running transcodes are box wide - queued ones are of this worker process
+    return transcode_scheduler.get_status()
+
+
+## Database
+
+db_router = APIRouter(prefix="/db")
+
+
+@db_router.get("/queries")
+def get_top_queries(
+    limit: int = Query(20, ge=1, le=500),
+    group_by: QueryStatsGroupBy = "fingerprint",
+    order_by: QueryStatsOrderBy = "total",
+) -> list[QueryStatsEntry]:
+    # Of this worker process - since it started or the stats were reset
+    return query_stats.get_top(limit, group_by=group_by, order_by=order_by)
+
+
+@db_router.delete("/queries")
+def reset_query_stats() -> None:
+    query_stats.reset()
+
+
+## Profiles
+
+profiles_router = APIRouter(prefix="/profiles")
+
+
+@profiles_router.get("/{profile_id}", response_class=PlainTextResponse)
+@inject
+def get_request_profile(
+    profile_id: str = Path(...),
+    profile_store: ProfileStore = Depends(Provide[Container.profile_store]),
+) -> str:
+    # Folded stacks - e.g. "flamegraph.pl profile.folded > profile.svg" or drop into speedscope
+    folded_stacks = profile_store.load(profile_id)
+    if folded_stacks is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return folded_stacks
+
+
 router.include_router(user_router)
 router.include_router(sessions_router)
+router.include_router(data_folder_router)
+router.include_router(transcodes_router)
+router.include_router(db_router)
+router.include_router(profiles_router)
@@ -1,8 +1,15 @@
 from dependency_injector.wiring import inject
 from fastapi import APIRouter, FastAPI
 
-from . import admin, documents, sessions, users, stats
+from utility.http.metrics import RequestMetricsMiddleware
+from utility.http.profiling import RequestProfilerMiddleware
+from utility.http.query_stats import QuerySourceMiddleware
+from utility.http.server_timing import ServerTimingMiddleware
+
+from . import admin, documents, metrics, sessions, users, stats
 from .dependencies.analytics import AnonTracker
+from .dependencies.profiling import store_profile
+from .dependencies.users import is_admin_connection
 
 router = APIRouter()
 
@@ -19,6 +26,11 @@ router.include_router(sessions.router, prefix="/sessions")
 router.include_router(admin.router, prefix="/admin")
 router.include_router(documents.router, prefix="/documents")
 router.include_router(stats.router, prefix="/stats")
+router.include_router(metrics.router)
 
 api_app = FastAPI()
 api_app.include_router(router, prefix="")
+api_app.add_middleware(ServerTimingMiddleware)
+api_app.add_middleware(QuerySourceMiddleware)
+api_app.add_middleware(RequestProfilerMiddleware, is_profiling_allowed=is_admin_connection, store_profile=store_profile)
+api_app.add_middleware(RequestMetricsMiddleware)
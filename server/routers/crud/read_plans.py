@@ -0,0 +1,40 @@
+from functools import lru_cache
+
+from pydantic import create_model
+
+# Bound on the number of distinct (model, schema, extra columns) select schemas kept
+READ_PLAN_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=READ_PLAN_CACHE_SIZE)
+def _build_schema_to_select(model, schema_to_select, extra_columns: tuple[str, ...]):
+    columns_to_select = {field: (model.model_fields[field].annotation, ...) for field in extra_columns}
+    return create_model("ActualSelect", __base__=schema_to_select, **columns_to_select)
+
+
+def extend_schema_to_select(model, schema_to_select, extra_columns):
+    """Get the schema to select, extended with extra model columns requested by the client.
+
+    Generated schemas are memoized - creating a pydantic model per request is slow and
+    every created class stays alive. The extra columns are normalized into the model field
+    order (unknown names dropped) so equivalent requests share a single cache entry.
+
+    Args:
+        model: The model being read.
+        schema_to_select: The base schema of the endpoint.
+        extra_columns: Names of model columns to add to the schema.
+
+    Returns:
+        The schema to pass on to FastCRUD.
+    """
+    if extra_columns and schema_to_select:
+        requested_columns = set(extra_columns)
+        normalized_columns = tuple(field for field in model.model_fields.keys() if field in requested_columns)
+        if normalized_columns:
+            return _build_schema_to_select(model, schema_to_select, normalized_columns)
+
+    return schema_to_select
+
+
+def read_plan_cache_info():
+    return _build_schema_to_select.cache_info()
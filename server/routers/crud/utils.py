@@ -1,21 +1,39 @@
+import base64
+import binascii
 import inspect
-from typing import Annotated, Any, Callable, Optional, Union
+import json
+from typing import Annotated, Any, Callable, Literal, Optional, Union
 
 from sqlalchemy import (
+    and_,
+    false,
     or_,
+    select,
+    text,
 )
 from sqlalchemy.orm.util import AliasedClass
 from sqlalchemy.sql.elements import ColumnElement
-from fastapi import Depends, Query
+from fastapi import Depends, HTTPException, Query, Request
 from fastcrud import FastCRUD, FilterConfig
 from fastcrud.types import (
     ModelType,
 )
-from pydantic import create_model
+from pydantic import TypeAdapter, ValidationError
+from pydantic_core import to_jsonable_python
 
 from models.user import User
 from routers.dependencies.analytics import Tracker
 from routers.dependencies.users import get_speaker_user
+from utility.cache.documents import BodyCache
+from utility.http.conditional import (
+    compute_etag,
+    conditional_json_response,
+    conditional_response,
+    encode_body_variants,
+    serialize_json,
+)
+
+from .read_plans import extend_schema_to_select
 
 
 class FastCrudWithOrFilters(FastCRUD):
@@ -25,14 +43,18 @@ class FastCrudWithOrFilters(FastCRUD):
         model = model or self.model
         kwargs_rest = {}
         or_filters = []
+        expression_filters = []
         for key, value in kwargs.items():
             if key.startswith("__or"):
                 or_filters_parsed = super()._parse_filters(model, **value)
                 or_filters.append(or_(*or_filters_parsed))
+            elif key.startswith("__expr"):
+                # Prebuilt SQL expressions (e.g. keyset pagination) apply as is
+                expression_filters.append(value)
             else:
                 kwargs_rest[key] = value
 
-        return super()._parse_filters(model, **kwargs_rest) + or_filters
+        return super()._parse_filters(model, **kwargs_rest) + or_filters + expression_filters
 
 
 def compute_offset(page: int, items_per_page: int) -> int:
@@ -81,6 +103,137 @@ def paginated_response(crud_data: dict, page: int, items_per_page: int) -> dict[
     }
 
 
+def encode_cursor(sort_columns: list[str], sort_orders: list[str], values: list[Any]) -> str:
+    """Encode the position after a row as an opaque cursor.
+
+    The cursor carries the sort specification it was produced under, so it cannot
+    be replayed against a different ordering.
+
+    Args:
+        sort_columns: The sort columns, including the trailing `id` tie breaker.
+        sort_orders: The sort order ("asc" / "desc") of each sort column.
+        values: The values of the sort columns on the last row of the page.
+
+    Returns:
+        A url-safe string cursor.
+    """
+    payload = {"c": sort_columns, "o": sort_orders, "v": to_jsonable_python(values)}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(model, cursor: str, sort_columns: list[str], sort_orders: list[str]) -> list[Any]:
+    """Decode a cursor produced by `encode_cursor` back into typed sort column values.
+
+    Args:
+        model: The model the sort columns belong to - used to coerce the values.
+        cursor: The cursor as received from the client.
+        sort_columns: The sort columns of the current request.
+        sort_orders: The sort orders of the current request.
+
+    Raises:
+        HTTPException: 400 if the cursor is malformed or was created for another ordering.
+
+    Returns:
+        The sort column values, typed as the model fields.
+    """
+    invalid_cursor_error = HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        padded_cursor = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded_cursor.encode()))
+        if payload["c"] != sort_columns or payload["o"] != sort_orders or len(payload["v"]) != len(sort_columns):
+            raise invalid_cursor_error
+        return [
+            TypeAdapter(model.model_fields[column].annotation).validate_python(value)
+            for column, value in zip(sort_columns, payload["v"])
+        ]
+    except (binascii.Error, ValueError, KeyError, TypeError, ValidationError):
+        raise invalid_cursor_error
+
+
+def keyset_filter(model, sort_columns: list[str], sort_orders: list[str], values: list[Any]) -> ColumnElement:
+    """Build a filter which matches only the rows that come after the given position.
+
+    Expands into "(a > x) OR (a = x AND b > y) OR ..." which supports mixed sort
+    directions and follows the Postgres null ordering (nulls last on asc, first on desc).
+
+    Args:
+        model: The model to filter.
+        sort_columns: The sort columns, the last of which must be unique.
+        sort_orders: The sort order ("asc" / "desc") of each sort column.
+        values: The values of the sort columns on the last row seen.
+
+    Returns:
+        A SQL expression to filter the next page with.
+    """
+
+    def after(column, value, is_desc: bool):
+        if value is None:
+            return column.is_not(None) if is_desc else false()
+        if is_desc:
+            return column < value
+        return or_(column > value, column.is_(None))
+
+    def equal(column, value):
+        return column.is_(None) if value is None else column == value
+
+    columns = [getattr(model, column) for column in sort_columns]
+    branches = []
+    for i, (column, order, value) in enumerate(zip(columns, sort_orders, values)):
+        preceding_equal = [equal(c, v) for c, v in zip(columns[:i], values[:i])]
+        branches.append(and_(*preceding_equal, after(column, value, order == "desc")))
+
+    return or_(*branches)
+
+
+async def estimate_count(crud: FastCRUD, db, filters: dict) -> Optional[int]:
+    """Estimate the number of rows matching the filters using the planner statistics.
+
+    Much cheaper than an exact `count(*)` over large tables - the query is planned, never executed.
+
+    Args:
+        crud: The FastCRUD instance of the counted model.
+        db: The async DB session.
+        filters: The filters as passed to FastCRUD.
+
+    Returns:
+        The estimated row count, or None if no estimation could be made.
+    """
+    try:
+        statement = select(crud.model).filter(*crud._parse_filters(**filters))
+        compiled_statement = statement.compile(dialect=db.bind.dialect, compile_kwargs={"literal_binds": True})
+        plan = await db.scalar(text(f"EXPLAIN (FORMAT JSON) {compiled_statement}"))
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+    except Exception as e:
+        print("Warning - Unable to estimate the row count")
+        print(e)
+        return None
+
+
+def cursor_paginated_response(
+    data: list, next_cursor: Optional[str], items_per_page: int, total_count: Optional[int] = None
+) -> dict[str, Any]:
+    """Create a cursor paginated response.
+
+    Args:
+        data: The items of this page.
+        next_cursor: The cursor to fetch the next page with, None when this is the last page.
+        items_per_page: Number of items per page.
+        total_count: Exact or estimated count of all matching items - if requested.
+
+    Returns:
+        A structured paginated response dict containing the list of items and the cursor of the next page.
+    """
+    return {
+        "data": data,
+        "total_count": total_count,
+        "has_more": next_cursor is not None,
+        "next_cursor": next_cursor,
+        "items_per_page": items_per_page,
+    }
+
+
 def create_dynamic_filters_dep(
     filter_config: Optional[FilterConfig],
     inject_current_user: bool = False,
@@ -148,18 +301,6 @@ def _apply_model_pk(**pkeys: dict[str, type]):
     return wrapper
 
 
-def _extend_schema_to_select(model, schema_to_select, extra_columns):
-    if extra_columns and schema_to_select:
-        columns_to_select = {}
-        for field in model.model_fields.keys():
-            if field in extra_columns:
-                columns_to_select[field] = (model.model_fields[field].annotation, ...)
-
-        return create_model("ActualSelect", __base__=schema_to_select, **columns_to_select)
-
-    return schema_to_select
-
-
 def gen_get_single(
     crud: FastCRUD,
     get_async_session,
@@ -168,18 +309,33 @@ def gen_get_single(
     item_id_field_name: str = "id",
     user_id_field_name: str = "user_id",
     only_admins_see_others: bool = True,
+    # Encoded bodies of items which do not change after creation - hits skip the DB read.
+    # Whoever mutates the items must invalidate it.
+    body_cache: Optional[BodyCache] = None,
 ):
     @_apply_model_pk(**{item_id_field_name: str})
     async def endpoint(
+        request: Request,
         track_event: Tracker,
         calling_user: Annotated[User, Depends(get_speaker_user)],
         extra_columns: Annotated[list[str] | None, Query(alias="extraColumns")] = None,
         db: any = Depends(get_async_session),
         **pkeys,
     ):
+        track_event(f"Get {crud.model.__name__} Item")
+
+        # The cached body is the same for all callers - only when ownership is not enforced
+        cache_key = None
+        if body_cache is not None and not (user_id_field_name and only_admins_see_others):
+            cache_key = (str(pkeys[item_id_field_name]), tuple(sorted(set(extra_columns or []))))
+            cached_body = body_cache.get(cache_key)
+            if cached_body is not None:
+                etag, variants = cached_body
+                return conditional_response(request, etag, variants)
+
         common_read_params = dict(
             db=db,
-            schema_to_select=_extend_schema_to_select(crud.model, schema_to_select, extra_columns),
+            schema_to_select=extend_schema_to_select(crud.model, schema_to_select, extra_columns),
             one_or_none=False,
         )
 
@@ -194,12 +350,84 @@ def gen_get_single(
             common_read_params["joins_config"] = join_configs
             common_read_params["nest_joins"] = True
 
-        track_event(f"Get {crud.model.__name__} Item")
-        return await getter(**common_read_params, **user_filter, **pkeys)
+        item = await getter(**common_read_params, **user_filter, **pkeys)
+
+        if cache_key is not None and item is not None:
+            body = serialize_json(item)
+            etag = compute_etag(body)
+            variants = encode_body_variants(body)
+            body_cache.set(cache_key, etag, variants)
+            return conditional_response(request, etag, variants)
+
+        return conditional_json_response(request, item)
 
     return endpoint
 
 
+async def _get_multi_by_cursor(
+    crud: FastCrudWithOrFilters,
+    getter: Callable,
+    common_read_params: dict,
+    db,
+    cursor: Optional[str],
+    items_per_page: int,
+    total_count_mode: Optional[str],
+    filters: dict,
+):
+    sort_columns = list(common_read_params.pop("sort_columns") or [])
+    sort_orders = list(common_read_params.pop("sort_orders") or ["asc"] * len(sort_columns))
+    if len(sort_orders) != len(sort_columns):
+        raise HTTPException(status_code=400, detail="sortOrders must match sortColumns")
+    if any(column not in crud.model.model_fields for column in sort_columns):
+        raise HTTPException(status_code=400, detail="Invalid sort column")
+
+    # The id is unique - it makes the ordering total and thus stable across pages
+    if "id" not in sort_columns:
+        sort_columns.append("id")
+        sort_orders.append("asc")
+    sort_columns = sort_columns[: sort_columns.index("id") + 1]
+    sort_orders = sort_orders[: len(sort_columns)]
+
+    cursor_filters = {}
+    if cursor:
+        cursor_values = decode_cursor(crud.model, cursor, sort_columns, sort_orders)
+        cursor_filters["__expr_keyset"] = keyset_filter(crud.model, sort_columns, sort_orders, cursor_values)
+
+    # The cursor is built from the last row - the sort columns must be part of it
+    schema_to_select = common_read_params["schema_to_select"]
+    if schema_to_select:
+        common_read_params["schema_to_select"] = extend_schema_to_select(crud.model, schema_to_select, sort_columns)
+
+    # Read one extra row to learn if there is a next page without counting
+    crud_data = await getter(
+        **common_read_params,
+        sort_columns=sort_columns,
+        sort_orders=sort_orders,
+        offset=0,
+        limit=items_per_page + 1,
+        return_total_count=False,
+        **filters,
+        **cursor_filters,
+    )
+
+    rows = crud_data["data"]
+    next_cursor = None
+    if len(rows) > items_per_page:
+        rows = rows[:items_per_page]
+        next_cursor = encode_cursor(sort_columns, sort_orders, [rows[-1][column] for column in sort_columns])
+
+    # Counted without the cursor - every page reports the total of all matching rows
+    total_count = None
+    if total_count_mode == "exact":
+        total_count = await crud.count(db, joins_config=common_read_params.get("joins_config"), **filters)
+    elif total_count_mode == "estimate":
+        total_count = await estimate_count(crud, db, filters)
+
+    return cursor_paginated_response(
+        data=rows, next_cursor=next_cursor, items_per_page=items_per_page, total_count=total_count
+    )
+
+
 def gen_get_multi(
     crud: FastCrudWithOrFilters,
     get_async_session,
@@ -208,10 +436,20 @@ def gen_get_multi(
     join_configs=[],
 ):
     async def endpoint(
+        request: Request,
         track_event: Tracker,
         db: any = Depends(get_async_session),
         page: Optional[int] = Query(None, alias="page", description="Page number"),
         items_per_page: Optional[int] = Query(None, alias="itemsPerPage", description="Number of items per page"),
+        cursor: Optional[str] = Query(
+            None, alias="cursor", description="Cursor of the page to fetch (enables cursor pagination)"
+        ),
+        pagination_mode: Literal["offset", "cursor"] = Query(
+            "offset", alias="paginationMode", description="Paginate by page number (offset) or by cursor"
+        ),
+        total_count_mode: Optional[Literal["exact", "estimate", "none"]] = Query(
+            None, alias="totalCount", description="How to count the total items in cursor mode (defaults to none)"
+        ),
         sort_columns: Annotated[list[str] | None, Query(alias="sortColumns")] = None,
         sort_orders: Annotated[list[str] | None, Query(alias="sortOrders")] = None,
         extra_columns: Annotated[list[str] | None, Query(alias="extraColumns")] = None,
@@ -219,7 +457,7 @@ def gen_get_multi(
     ):
         common_read_params = dict(
             db=db,
-            schema_to_select=_extend_schema_to_select(crud.model, schema_to_select, extra_columns),
+            schema_to_select=extend_schema_to_select(crud.model, schema_to_select, extra_columns),
             sort_columns=sort_columns,
             sort_orders=sort_orders,
         )
@@ -232,17 +470,29 @@ def gen_get_multi(
             common_read_params["joins_config"] = join_configs
             common_read_params["nest_joins"] = True
 
-        if not (page and items_per_page):
-            return await getter(
+        if cursor or pagination_mode == "cursor":
+            response_content = await _get_multi_by_cursor(
+                crud,
+                getter,
+                common_read_params,
+                db=db,
+                cursor=cursor,
+                items_per_page=items_per_page or 100,
+                total_count_mode=total_count_mode,
+                filters=filters,
+            )
+        elif not (page and items_per_page):
+            response_content = await getter(
                 **common_read_params,
                 offset=0,
                 limit=100,
                 **filters,
             )
+        else:
+            offset = compute_offset(page=page, items_per_page=items_per_page)
+            crud_data = await getter(**common_read_params, offset=offset, limit=items_per_page, **filters)
+            response_content = paginated_response(crud_data=crud_data, page=page, items_per_page=items_per_page)
 
-        offset = compute_offset(page=page, items_per_page=items_per_page)
-        crud_data = await getter(**common_read_params, offset=offset, limit=items_per_page, **filters)
-
-        return paginated_response(crud_data=crud_data, page=page, items_per_page=items_per_page)  # pragma: no cover
+        return conditional_json_response(request, response_content)
 
     return endpoint
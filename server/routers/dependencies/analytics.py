@@ -8,13 +8,18 @@ from posthog import Posthog
 
 from containers import Container
 from models.user import User
+from utility.http.server_timing import timed
 
 from .users import get_valid_user
 
 
 @inject
 def get_raw_tracker(posthog: Posthog = Depends(Provide[Container.posthog])):
-    return posthog.capture
+    def capture(*args, **kwargs):
+        with timed("analytics"):
+            posthog.capture(*args, **kwargs)
+
+    return capture
 
 
 @inject
@@ -25,7 +30,8 @@ def get_tracker(
 
     def track_event(event, *args, **kwargs):
         capture_args = capture_sig.bind(valid_user.id, event, *args, **kwargs)
-        posthog.capture(*capture_args.args, **capture_args.kwargs)
+        with timed("analytics"):
+            posthog.capture(*capture_args.args, **capture_args.kwargs)
 
     return track_event
 
@@ -40,7 +46,8 @@ def get_anon_tracker(posthog: Posthog = Depends(Provide[Container.posthog])):
             capture_args.arguments["properties"] = {}
 
         capture_args.arguments["properties"]["$process_person_profile"] = False
-        posthog.capture(*capture_args.args, **capture_args.kwargs)
+        with timed("analytics"):
+            posthog.capture(*capture_args.args, **capture_args.kwargs)
 
     return track_event
 
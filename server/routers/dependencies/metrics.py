@@ -0,0 +1,30 @@
+import hmac
+from typing import Annotated
+
+from dependency_injector.wiring import Provide, inject
+from fastapi import Depends, HTTPException, status
+
+from containers import Container
+from resource_access.users_ra import UsersRA
+
+from .users import CredentialsBearer, get_authenticated_user_id, has_admin_permission
+
+
+@inject
+def ensure_metrics_access(
+    credentials_bearer: CredentialsBearer,
+    authenticated_user_id: Annotated[str, Depends(get_authenticated_user_id)],
+    access_token: str = Provide[Container.config.metrics.access_token],
+    users_ra: UsersRA = Depends(Provide[Container.users_ra]),
+) -> None:
+    # Scrapers use the configured token - admins can look with their own session
+    if access_token and credentials_bearer:
+        if hmac.compare_digest(credentials_bearer.credentials.encode(), access_token.encode()):
+            return
+
+    if not authenticated_user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+
+    user = users_ra.get_by_id(authenticated_user_id)
+    if not user or not has_admin_permission(user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to read metrics")
@@ -0,0 +1,9 @@
+from dependency_injector.wiring import Provide, inject
+
+from containers import Container
+from utility.profiling import ProfileStore
+
+
+@inject
+def store_profile(profile_id: str, folded_stacks: str, profile_store: ProfileStore = Provide[Container.profile_store]):
+    profile_store.save(profile_id, folded_stacks)
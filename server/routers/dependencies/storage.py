@@ -0,0 +1,21 @@
+from dependency_injector.wiring import Provide, inject
+from fastapi import Depends, HTTPException, status
+
+from containers import Container
+from managers.data_folder_manager import DataFolderManager
+
+# Suggested wait before an upload refused for lack of space is retried
+UPLOAD_CAPACITY_RETRY_AFTER_SEC = 60
+
+
+@inject
+def ensure_upload_capacity(
+    data_folder_manager: DataFolderManager = Depends(Provide[Container.data_folder_manager]),
+) -> None:
+    # Refuse uploads before the data folder volume fills up
+    if not data_folder_manager.has_upload_capacity():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server storage is full - try again later",
+            headers={"Retry-After": str(UPLOAD_CAPACITY_RETRY_AFTER_SEC)},
+        )
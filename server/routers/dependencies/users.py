@@ -2,7 +2,8 @@ from typing import Annotated
 from uuid import UUID
 
 from dependency_injector.wiring import Provide, inject
-from fastapi import Cookie, Depends, HTTPException, Header, Response, status
+from fastapi import Cookie, Depends, HTTPException, Header, Response, WebSocket, status
+from fastapi.requests import HTTPConnection
 from fastapi.security import APIKeyCookie, HTTPAuthorizationCredentials, HTTPBearer, APIKeyHeader
 from jwt.exceptions import InvalidTokenError
 from nanoid import generate
@@ -11,6 +12,7 @@ from pydantic import BaseModel
 from containers import Container
 from models.user import User, UserGroups
 from resource_access.users_ra import UsersRA
+from utility.http.server_timing import timed
 from utility.authentication.users import (
     decode_access_token,
     get_access_token_expire_minutes,
@@ -95,28 +97,31 @@ async def get_valid_user(
     google_client_id: str = Provide[Container.config.auth.google.client_id],
     users_ra: UsersRA = Depends(Provide[Container.users_ra]),
 ):
-    user: User = None
-    if authenticated_user_id:
-        user = users_ra.get_by_id(authenticated_user_id)
-    elif delegated_user_email:
-        user = users_ra.get_by_email(delegated_user_email)
-    else:  # Not authenticated
-        auth_error_details = AuthenticationErrorDetails(
-            google_client_id=google_client_id, g_csrf_token=generate(size=16)
-        )
-        auth_error_details_dump = auth_error_details.model_dump()
-        response.set_cookie("g_csrf_token", value=auth_error_details.g_csrf_token)
-        headers = {
-            "set-cookie": response.headers["set-cookie"],
-            "Cache-Control": "no-store",
-            "x-g-csrf-token": auth_error_details.g_csrf_token,
-        }
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=auth_error_details_dump, headers=headers)
-
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-
-    return user
+    with timed("auth"):
+        user: User = None
+        if authenticated_user_id:
+            user = users_ra.get_by_id(authenticated_user_id)
+        elif delegated_user_email:
+            user = users_ra.get_by_email(delegated_user_email)
+        else:  # Not authenticated
+            auth_error_details = AuthenticationErrorDetails(
+                google_client_id=google_client_id, g_csrf_token=generate(size=16)
+            )
+            auth_error_details_dump = auth_error_details.model_dump()
+            response.set_cookie("g_csrf_token", value=auth_error_details.g_csrf_token)
+            headers = {
+                "set-cookie": response.headers["set-cookie"],
+                "Cache-Control": "no-store",
+                "x-g-csrf-token": auth_error_details.g_csrf_token,
+            }
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED, detail=auth_error_details_dump, headers=headers
+            )
+
+        if not user:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+
+        return user
 
 
 def has_admin_permission(user: User):
@@ -133,6 +138,42 @@ async def get_speaker_user(user: Annotated[User, Depends(get_valid_user)]):
     return user
 
 
+def get_connection_user(connection: HTTPConnection, users_ra: UsersRA) -> User | None:
+    # For connections handled outside of the HTTP dependencies - the bearer token or the cookie
+    credentials = connection.cookies.get(AUTH_COOKIE_NAME)
+    authorization = connection.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        credentials = authorization[len("bearer ") :]
+    if not credentials:
+        return None
+
+    try:
+        user_id = decode_access_token(credentials).get("sub")
+    except InvalidTokenError:
+        return None
+
+    return users_ra.get_by_id(user_id) if user_id else None
+
+
+@inject
+async def get_websocket_speaker_user(
+    websocket: WebSocket,
+    users_ra: UsersRA = Depends(Provide[Container.users_ra]),
+) -> User | None:
+    # Resolved once per connection - browsers cannot set headers on the handshake, so they send the cookie
+    user = get_connection_user(websocket, users_ra)
+    if not user or not has_speaker_permission(user):
+        return None
+
+    return user
+
+
+@inject
+def is_admin_connection(connection: HTTPConnection, users_ra: UsersRA = Provide[Container.users_ra]) -> bool:
+    user = get_connection_user(connection, users_ra)
+    return user is not None and has_admin_permission(user)
+
+
 async def get_admin_user(user: Annotated[User, Depends(get_valid_user)]):
     if not has_admin_permission(user):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not an authorized admin")
@@ -1,7 +1,8 @@
 from typing import Annotated, Optional
+from uuid import UUID
 
 from dependency_injector.wiring import Provide, inject
-from fastapi import APIRouter, Depends, File, Form, UploadFile
+from fastapi import APIRouter, Depends, File, Form, Path, Query, UploadFile
 from fastapi.exceptions import HTTPException
 from fastcrud import FilterConfig, JoinConfig
 from pydantic import BaseModel
@@ -13,9 +14,11 @@ from models.text_document import (
     TextDocument,
     TextDocumentListRead,
     TextDocumentOwner,
+    TextDocumentParagraphsRead,
     TextDocumentRead,
 )
 from models.user import User
+from utility.cache.documents import document_bodies
 
 from .crud.utils import FastCrudWithOrFilters, create_dynamic_filters_dep, gen_get_multi, gen_get_single
 from .dependencies.analytics import Tracker
@@ -93,6 +96,35 @@ async def create_document_from_source(
     return {"document_id": document.id, "title": document.title}
 
 
+max_paragraphs_page_size = 200
+
+
+@router.get("/{document_id}/paragraphs", response_model=TextDocumentParagraphsRead)
+@inject
+def get_document_paragraphs(
+    track_event: Tracker,
+    speaker_user: Annotated[User, Depends(get_speaker_user)],
+    document_id: Annotated[UUID, Path(title="Id of the document")],
+    start: Annotated[int, Query(alias="from", ge=0, description="Index of the first paragraph")] = 0,
+    count: Annotated[int, Query(ge=1, le=max_paragraphs_page_size, description="Number of paragraphs")] = 20,
+    document_manager: DocumentManager = Depends(Provide[Container.document_manager]),
+):
+    document_paragraphs = document_manager.load_document_paragraphs(document_id, start, count, speaker_user)
+    if document_paragraphs is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    document, total_paragraphs, paragraphs = document_paragraphs
+
+    track_event("Document Paragraphs Loaded", {"document_id": str(document_id), "from": start, "count": count})
+    return TextDocumentParagraphsRead(
+        document_id=document_id,
+        title=document.title,
+        public=document.public,
+        start=start,
+        total_paragraphs=total_paragraphs,
+        paragraphs=paragraphs,
+    )
+
+
 # Crud Generated API
 
 
@@ -130,7 +162,13 @@ def preprocess_filters(**kwargs) -> dict:
 
 router.add_api_route(
     "/{id}",
-    gen_get_single(document_crud, get_async_session, schema_to_select=TextDocumentRead, only_admins_see_others=False),
+    gen_get_single(
+        document_crud,
+        get_async_session,
+        schema_to_select=TextDocumentRead,
+        only_admins_see_others=False,
+        body_cache=document_bodies,
+    ),
     methods=["GET"],
 )
 router.add_api_route(
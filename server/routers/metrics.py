@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Depends, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from .dependencies.metrics import ensure_metrics_access
+
+router = APIRouter(dependencies=[Depends(ensure_metrics_access)])
+
+
+# Sync - collectors may query the DB and are run in the threadpool
+@router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
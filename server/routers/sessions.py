@@ -1,21 +1,34 @@
-import pathlib
+import asyncio
 import re
-from mimetypes import guess_extension
-from typing import Annotated, Optional
+from concurrent.futures import Future
+from typing import Annotated, Literal, Optional, Union
 from uuid import UUID
 
 from dependency_injector.wiring import Provide, inject
-from fastapi import APIRouter, Depends, File, Path, UploadFile
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    File,
+    Header,
+    Path,
+    Request,
+    UploadFile,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
 from fastapi.exceptions import HTTPException
-from fastcrud import FastCRUD, FilterConfig, JoinConfig
+from fastapi.responses import JSONResponse
+from fastcrud import FilterConfig, JoinConfig
 from nanoid import generate
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
 
 from containers import Container
 from errors import MissingSessionError
+from managers.data_folder_manager import DataFolderManager
 from managers.recital_manager import RecitalManager, TextSegmentRequestBody
 from models.database import get_async_session
-from models.recital_audio_segment import RecitalAudioSegment
 from models.recital_session import (
     RecitalSession,
     RecitalSessionRead,
@@ -25,10 +38,13 @@ from models.recital_session import (
 from models.text_document import TextDocument
 from resource_access.recitals_content_ra import RecitalsContentRA
 from resource_access.recitals_ra import RecitalsRA
+from utility.cache.sessions import SessionAccess
+from utility.http.server_timing import timed
 
-from .crud.utils import create_dynamic_filters_dep, gen_get_multi, gen_get_single
-from .dependencies.analytics import Tracker
-from .dependencies.users import User, get_speaker_user
+from .crud.utils import FastCrudWithOrFilters, create_dynamic_filters_dep, gen_get_multi, gen_get_single
+from .dependencies.analytics import RawTracker, Tracker
+from .dependencies.storage import ensure_upload_capacity
+from .dependencies.users import User, get_speaker_user, get_websocket_speaker_user
 from .types import SessionPreview
 
 router = APIRouter()
@@ -126,7 +142,7 @@ async def upload_text_segment(
     recital_manager: RecitalManager = Depends(Provide[Container.recital_manager]),
 ):
     try:
-        recital_manager.add_text_segment(session_id, speaker_user, segment)
+        await recital_manager.add_text_segment(session_id, speaker_user, segment)
     except MissingSessionError:
         raise HTTPException(status_code=404, detail="Recital session not found")
 
@@ -141,6 +157,34 @@ async def upload_text_segment(
     return {"message": "Text segment uploaded successfully"}
 
 
+MAX_TEXT_SEGMENTS_PER_UPLOAD = 500
+
+
+@router.post("/{session_id}/upload-text-segments")
+@inject
+async def upload_text_segments(
+    track_event: Tracker,
+    session_id: Annotated[str, Path(title="Session id of the transcript")],
+    segments: Annotated[list[TextSegmentRequestBody], Body(max_length=MAX_TEXT_SEGMENTS_PER_UPLOAD)],
+    speaker_user: Annotated[User, Depends(get_speaker_user)],
+    recital_manager: RecitalManager = Depends(Provide[Container.recital_manager]),
+):
+    try:
+        await recital_manager.add_text_segments(session_id, speaker_user, segments)
+    except MissingSessionError:
+        raise HTTPException(status_code=404, detail="Recital session not found")
+
+    track_event(
+        "Text Segments Uploaded",
+        {
+            "session_id": session_id,
+            "segments_count": len(segments),
+            "text_length": sum(len(segment.text) for segment in segments),
+        },
+    )
+    return {"message": "Text segments uploaded successfully"}
+
+
 def parse_mime_type(mime_type: str):
     # Regular expression to extract key-value pairs from the mime type
     pattern = re.compile(r"(\w+)=([\w.]+)")
@@ -148,41 +192,46 @@ def parse_mime_type(mime_type: str):
     return params
 
 
-@router.post("/{session_id}/upload-audio-segment/{segment_id}")
+def get_speaker_session(recitals_ra: RecitalsRA, session_id: str, speaker_user: User) -> SessionAccess:
+    recital_session = recitals_ra.get_access_by_id_and_user_id(session_id, speaker_user.id)
+    if not recital_session or recital_session.disavowed:
+        raise HTTPException(status_code=404, detail="Recital session not found")
+    return recital_session
+
+
+@router.post("/{session_id}/upload-audio-segment/{segment_id}", dependencies=[Depends(ensure_upload_capacity)])
 @inject
 async def upload_audio_segment(
     track_event: Tracker,
     session_id: Annotated[str, Path(title="Session id of the audio segment")],
-    segment_id: Annotated[str, Path(title="Id of the audio segment")],
+    segment_id: Annotated[int, Path(title="Id of the audio segment")],
     speaker_user: Annotated[User, Depends(get_speaker_user)],
     audio_data: UploadFile = File(...),
     recitals_ra: RecitalsRA = Depends(Provide[Container.recitals_ra]),
     recitals_content_ra: RecitalsContentRA = Depends(Provide[Container.recitals_content_ra]),
 ):
-    recital_session = recitals_ra.get_by_id_and_user_id(session_id, speaker_user.id)
-    if not recital_session or recital_session.disavowed:
-        raise HTTPException(status_code=404, detail="Recital session not found")
+    get_speaker_session(recitals_ra, session_id, speaker_user)
 
     # Read the MIME type
     mime_type = audio_data.content_type
 
-    # write the file to disk
-    file_extension = guess_extension(mime_type.split(";")[0]) or ".bin"
-    file_name = f"{session_id}{file_extension}.seg.{segment_id}"
-    with open(str(pathlib.Path(recitals_content_ra.get_data_folder(), file_name)), "wb") as buffer:
-        buffer.write(await audio_data.read())
+    # write the file to disk (or the content storage)
+    audio_data_content = await audio_data.read()
+    with timed("file"):
+        try:
+            file_name = await asyncio.to_thread(
+                recitals_content_ra.store_audio_segment, session_id, segment_id, mime_type, audio_data_content
+            )
+        except Exception as e:
+            print(e)
+            raise HTTPException(status_code=500, detail="Error storing audio data")
 
     # Byte Size of the uploaded audio file
     audio_data_length = audio_data.size
 
-    recitals_ra.add_audio_segment(
-        RecitalAudioSegment(
-            filename=file_name,
-            mime_type=mime_type,
-            recital_session=recital_session,
-            sequential=segment_id,
-        )
-    )
+    # Written by the group commit writer thread - timed here as the request waits for it
+    with timed("db"):
+        await asyncio.wrap_future(recitals_ra.add_audio_segment(session_id, segment_id, file_name, audio_data_length))
 
     track_event(
         "Audio Segment Uploaded",
@@ -196,6 +245,321 @@ async def upload_audio_segment(
     return {"message": "Audio uploaded successfully"}
 
 
+# Resumable audio segment uploads:
+# PATCH appends bytes at the "Upload-Offset" header, GET/HEAD report how much was received,
+# and commit stores the segment once all of its bytes arrived - retries only resend what is missing.
+MAX_AUDIO_SEGMENT_SIZE = 50 * 1024 * 1024
+
+
+class AudioSegmentUploadStatus(BaseModel):
+    offset: int
+    committed: bool
+
+
+class AudioSegmentCommitRequestBody(BaseModel):
+    size: int
+    mime_type: str
+
+
+def audio_segment_upload_status_response(status: AudioSegmentUploadStatus, status_code: int = 200) -> JSONResponse:
+    return JSONResponse(
+        status.model_dump(),
+        status_code=status_code,
+        headers={"Upload-Offset": str(status.offset), "Cache-Control": "no-store"},
+    )
+
+
+def get_audio_segment_upload_status(
+    recitals_ra: RecitalsRA, recitals_content_ra: RecitalsContentRA, session_id: str, segment_id: int
+) -> AudioSegmentUploadStatus:
+    audio_segment = recitals_ra.get_audio_segment(session_id, segment_id)
+    upload_offset = recitals_content_ra.get_audio_segment_upload_offset(session_id, segment_id)
+    if audio_segment and not upload_offset:
+        return AudioSegmentUploadStatus(offset=audio_segment.size or 0, committed=True)
+    return AudioSegmentUploadStatus(offset=upload_offset, committed=False)
+
+
+@router.api_route("/{session_id}/audio-segments/{segment_id}", methods=["GET", "HEAD"])
+@inject
+async def get_audio_segment_upload(
+    session_id: Annotated[str, Path(title="Session id of the audio segment")],
+    segment_id: Annotated[int, Path(title="Id of the audio segment")],
+    speaker_user: Annotated[User, Depends(get_speaker_user)],
+    recitals_ra: RecitalsRA = Depends(Provide[Container.recitals_ra]),
+    recitals_content_ra: RecitalsContentRA = Depends(Provide[Container.recitals_content_ra]),
+):
+    get_speaker_session(recitals_ra, session_id, speaker_user)
+    return audio_segment_upload_status_response(
+        get_audio_segment_upload_status(recitals_ra, recitals_content_ra, session_id, segment_id)
+    )
+
+
+@router.patch("/{session_id}/audio-segments/{segment_id}", dependencies=[Depends(ensure_upload_capacity)])
+@inject
+async def append_audio_segment_upload(
+    request: Request,
+    session_id: Annotated[str, Path(title="Session id of the audio segment")],
+    segment_id: Annotated[int, Path(title="Id of the audio segment")],
+    upload_offset: Annotated[int, Header(alias="Upload-Offset", ge=0)],
+    speaker_user: Annotated[User, Depends(get_speaker_user)],
+    recitals_ra: RecitalsRA = Depends(Provide[Container.recitals_ra]),
+    recitals_content_ra: RecitalsContentRA = Depends(Provide[Container.recitals_content_ra]),
+):
+    get_speaker_session(recitals_ra, session_id, speaker_user)
+
+    status = get_audio_segment_upload_status(recitals_ra, recitals_content_ra, session_id, segment_id)
+    if status.committed:
+        return audio_segment_upload_status_response(status)
+
+    # Bytes before the offset must have been received already
+    if upload_offset > status.offset:
+        return audio_segment_upload_status_response(status, status_code=409)
+
+    offset = upload_offset
+    with recitals_content_ra.open_audio_segment_upload(session_id, segment_id, offset) as buffer:
+        async for chunk in request.stream():
+            offset += len(chunk)
+            if offset > MAX_AUDIO_SEGMENT_SIZE:
+                raise HTTPException(status_code=413, detail="Audio segment too large")
+            with timed("file"):
+                buffer.write(chunk)
+
+    return audio_segment_upload_status_response(AudioSegmentUploadStatus(offset=offset, committed=False))
+
+
+@router.post("/{session_id}/audio-segments/{segment_id}/commit")
+@inject
+async def commit_audio_segment_upload(
+    track_event: Tracker,
+    session_id: Annotated[str, Path(title="Session id of the audio segment")],
+    segment_id: Annotated[int, Path(title="Id of the audio segment")],
+    segment: AudioSegmentCommitRequestBody,
+    speaker_user: Annotated[User, Depends(get_speaker_user)],
+    recitals_ra: RecitalsRA = Depends(Provide[Container.recitals_ra]),
+    recitals_content_ra: RecitalsContentRA = Depends(Provide[Container.recitals_content_ra]),
+):
+    get_speaker_session(recitals_ra, session_id, speaker_user)
+
+    # Repeated commits of a stored segment are acknowledged - its bytes may have left the node already
+    status = get_audio_segment_upload_status(recitals_ra, recitals_content_ra, session_id, segment_id)
+    if status.committed and status.offset == segment.size:
+        return audio_segment_upload_status_response(status)
+
+    with timed("file"):
+        file_name = await asyncio.to_thread(
+            recitals_content_ra.commit_audio_segment_upload, session_id, segment_id, segment.mime_type, segment.size
+        )
+    if not file_name:
+        # Not all bytes arrived - report where to resume from
+        return audio_segment_upload_status_response(
+            get_audio_segment_upload_status(recitals_ra, recitals_content_ra, session_id, segment_id),
+            status_code=409,
+        )
+
+    with timed("db"):
+        await asyncio.wrap_future(recitals_ra.add_audio_segment(session_id, segment_id, file_name, segment.size))
+
+    track_event(
+        "Audio Segment Uploaded",
+        {
+            "session_id": session_id,
+            "audio_segment_id": segment_id,
+            "mime_type": segment.mime_type,
+            "size_bytes": segment.size,
+        },
+    )
+    return audio_segment_upload_status_response(AudioSegmentUploadStatus(offset=segment.size, committed=True))
+
+
+# Direct audio segment uploads - the client posts the segment straight to the content storage
+# with a short lived presigned form, then commits it as any resumable upload.
+DIRECT_AUDIO_SEGMENT_UPLOAD_EXPIRES_SEC = 300
+
+
+class DirectAudioSegmentUploadRequestBody(BaseModel):
+    mime_type: str
+
+
+class DirectAudioSegmentUpload(BaseModel):
+    url: str
+    fields: dict[str, str]
+
+
+@router.post("/{session_id}/audio-segments/{segment_id}/direct-upload", response_model=DirectAudioSegmentUpload)
+@inject
+async def get_audio_segment_direct_upload(
+    session_id: Annotated[str, Path(title="Session id of the audio segment")],
+    segment_id: Annotated[int, Path(title="Id of the audio segment", ge=0)],
+    segment: DirectAudioSegmentUploadRequestBody,
+    speaker_user: Annotated[User, Depends(get_speaker_user)],
+    recitals_ra: RecitalsRA = Depends(Provide[Container.recitals_ra]),
+    recitals_content_ra: RecitalsContentRA = Depends(Provide[Container.recitals_content_ra]),
+):
+    if not recitals_content_ra.direct_segment_uploads:
+        raise HTTPException(status_code=404, detail="Direct audio uploads are not enabled")
+
+    get_speaker_session(recitals_ra, session_id, speaker_user)
+
+    if not segment.mime_type.startswith("audio/"):
+        raise HTTPException(status_code=400, detail="Unsupported audio mime type")
+
+    direct_upload = recitals_content_ra.get_audio_segment_direct_upload(
+        session_id,
+        segment_id,
+        segment.mime_type,
+        max_size=MAX_AUDIO_SEGMENT_SIZE,
+        expires_in=DIRECT_AUDIO_SEGMENT_UPLOAD_EXPIRES_SEC,
+    )
+    if not direct_upload:
+        raise HTTPException(status_code=503, detail="Direct audio uploads are not available")
+
+    return DirectAudioSegmentUpload(url=direct_upload["url"], fields=direct_upload["fields"])
+
+
+# Recording stream - one authenticated connection carrying both the audio and text segments of a session.
+# Client messages carry a "seq" number which is acked once the segment is stored:
+#   {"type": "text", "seq": n, "seek_end": float, "text": str}
+#   {"type": "audio", "seq": n, "segment_id": int, "mime_type": str} - followed by one binary frame of audio data
+# Server messages:
+#   {"type": "ack", "seq": n} or {"type": "error", "seq": n, "detail": str}
+class StreamTextSegmentMessage(BaseModel):
+    type: Literal["text"]
+    seq: int
+    seek_end: float
+    text: str
+
+
+class StreamAudioSegmentMessage(BaseModel):
+    type: Literal["audio"]
+    seq: int
+    segment_id: int = Field(ge=0)
+    mime_type: str
+
+
+stream_message_adapter = TypeAdapter(
+    Annotated[Union[StreamTextSegmentMessage, StreamAudioSegmentMessage], Field(discriminator="type")]
+)
+
+
+@router.websocket("/{session_id}/stream")
+@inject
+async def stream_recital_session(
+    websocket: WebSocket,
+    session_id: str,
+    speaker_user: Annotated[Optional[User], Depends(get_websocket_speaker_user)],
+    track_event: RawTracker,
+    recital_manager: RecitalManager = Depends(Provide[Container.recital_manager]),
+    data_folder_manager: DataFolderManager = Depends(Provide[Container.data_folder_manager]),
+    recitals_ra: RecitalsRA = Depends(Provide[Container.recitals_ra]),
+    recitals_content_ra: RecitalsContentRA = Depends(Provide[Container.recitals_content_ra]),
+):
+    # Authorized once for the whole connection
+    recital_session = recitals_ra.get_access_by_id_and_user_id(session_id, speaker_user.id) if speaker_user else None
+    if not recital_session or recital_session.disavowed:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Recital session not found")
+        return
+
+    await websocket.accept()
+
+    # Writes are not awaited by the receive loop - they are acked in order as they commit,
+    # so the connection keeps receiving while the group commit writer batches them.
+    pending_acks: asyncio.Queue[tuple[int, Future, float | None] | None] = asyncio.Queue()
+    stored_segments = {"text": 0, "audio": 0}
+
+    async def send_message(message: dict) -> None:
+        try:
+            await websocket.send_json(message)
+        except (WebSocketDisconnect, RuntimeError):
+            pass  # Stored anyway - the client resends whatever it did not see acked
+
+    async def ack_stored_segments() -> None:
+        stored_seek_end = scheduled_seek_end = None
+        while (pending_ack := await pending_acks.get()) is not None:
+            seq, future, seek_end = pending_ack
+            try:
+                await asyncio.wrap_future(future)
+            except Exception as e:
+                print(f"Error storing streamed segment {seq} of session {session_id}: {e}")
+                await send_message({"type": "error", "seq": seq, "detail": "Failed to store segment"})
+                continue
+
+            if seek_end is not None:
+                stored_seek_end = max(stored_seek_end or 0, seek_end)
+                stored_segments["text"] += 1
+            else:
+                stored_segments["audio"] += 1
+            await send_message({"type": "ack", "seq": seq})
+
+            # One duration update per burst of stored text segments
+            if pending_acks.empty() and stored_seek_end != scheduled_seek_end:
+                recital_manager.schedule_session_duration_update_job(session_id, stored_seek_end)
+                scheduled_seek_end = stored_seek_end
+
+    ack_task = asyncio.create_task(ack_stored_segments())
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+
+            try:
+                stream_message = stream_message_adapter.validate_json(message.get("text") or b"")
+            except ValidationError:
+                await send_message({"type": "error", "seq": None, "detail": "Invalid message"})
+                continue
+
+            if isinstance(stream_message, StreamTextSegmentMessage):
+                future = recitals_ra.add_text_segments(session_id, [(stream_message.seek_end, stream_message.text)])
+                await pending_acks.put((stream_message.seq, future, stream_message.seek_end))
+                continue
+
+            # The audio data follows its header
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            audio_data = message.get("bytes")
+            if audio_data is None:
+                await send_message({"type": "error", "seq": stream_message.seq, "detail": "Missing audio data"})
+                continue
+            if len(audio_data) > MAX_AUDIO_SEGMENT_SIZE:
+                await send_message({"type": "error", "seq": stream_message.seq, "detail": "Audio segment too large"})
+                continue
+            if not data_folder_manager.has_upload_capacity():
+                await send_message({"type": "error", "seq": stream_message.seq, "detail": "Server storage is full"})
+                continue
+
+            segment_id = stream_message.segment_id
+            try:
+                file_name = await asyncio.to_thread(
+                    recitals_content_ra.store_audio_segment,
+                    session_id,
+                    segment_id,
+                    stream_message.mime_type,
+                    audio_data,
+                )
+            except Exception as e:
+                print(e)
+                await send_message({"type": "error", "seq": stream_message.seq, "detail": "Error storing audio data"})
+                continue
+
+            future = recitals_ra.add_audio_segment(session_id, segment_id, file_name, len(audio_data))
+            await pending_acks.put((stream_message.seq, future, None))
+    finally:
+        # Let the pending writes complete before leaving
+        await pending_acks.put(None)
+        await ack_task
+
+    track_event(
+        speaker_user.id,
+        "Session Stream Closed",
+        {
+            "session_id": session_id,
+            "text_segments_count": stored_segments["text"],
+            "audio_segments_count": stored_segments["audio"],
+        },
+    )
+
+
 @router.get("/{session_id}/preview", response_model=SessionPreview)
 @inject
 async def get_session_preview(
@@ -205,7 +569,7 @@ async def get_session_preview(
     recitals_ra: RecitalsRA = Depends(Provide[Container.recitals_ra]),
     recitals_content_ra: RecitalsContentRA = Depends(Provide[Container.recitals_content_ra]),
 ) -> SessionPreview:
-    recital_session = recitals_ra.get_by_id_and_user_id(session_id, speaker_user.id)
+    recital_session = recitals_ra.get_access_by_id_and_user_id(session_id, speaker_user.id)
     if not recital_session:
         raise HTTPException(status_code=404, detail="Recital session not found")
 
@@ -226,7 +590,7 @@ async def get_session_preview(
 
 # Crud Generated API
 
-session_crud = FastCRUD(RecitalSession)
+session_crud = FastCrudWithOrFilters(RecitalSession)
 session_filter_config = FilterConfig(status=None, user_id=None)
 
 join_with_text_doc_config = JoinConfig(
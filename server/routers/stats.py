@@ -1,10 +1,11 @@
 from typing import Annotated
 
 from dependency_injector.wiring import Provide, inject
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 
 from containers import Container
 from resource_access.stats_ra import StatsRA, UserLeaderBoard, UserStats, TotalStats
+from utility.http.conditional import conditional_json_response
 
 from .dependencies.analytics import Tracker
 from .dependencies.users import User, get_speaker_user
@@ -15,25 +16,28 @@ router = APIRouter()
 @router.get("/me", response_model=UserStats)
 @inject
 async def get_user_totals(
+    request: Request,
     speaker_user: Annotated[User, Depends(get_speaker_user)],
     stats_ra: StatsRA = Depends(Provide[Container.stats_ra]),
 ):
-    return stats_ra.user_stats(speaker_user.id)
+    return conditional_json_response(request, stats_ra.user_stats(speaker_user.id), UserStats)
 
 
 @router.get("/leaderboard", response_model=list[UserLeaderBoard])
 @inject
 async def get_leaderboard(
+    request: Request,
     stats_ra: StatsRA = Depends(Provide[Container.stats_ra]),
 ):
 
-    return stats_ra.leader_board(10)
+    return conditional_json_response(request, stats_ra.leader_board(10), list[UserLeaderBoard])
 
 
 @router.get("/totals", response_model=TotalStats)
 @inject
 async def get_totals(
+    request: Request,
     stats_ra: StatsRA = Depends(Provide[Container.stats_ra]),
 ):
 
-    return stats_ra.totals()
+    return conditional_json_response(request, stats_ra.totals(), TotalStats)
@@ -1,18 +1,26 @@
+import hashlib
 import pathlib
+from typing import Optional
 
 from dependency_injector.wiring import Provide, inject
-from fastapi import FastAPI
-from fastapi.responses import PlainTextResponse, Response
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import Response
 from pydantic import BaseModel
 
 from containers import Container
+from utility.http.conditional import conditional_response, weak_etag
+from utility.http.static_files import WebClientStaticFiles
+
+ENV_CONFIG_SCRIPT_PATH = "/env/config.js"
+VERSIONED_ENV_CONFIG_CACHE_CONTROL = "public, max-age=31536000, immutable"
+UNVERSIONED_ENV_CONFIG_CACHE_CONTROL = "public, no-cache"
 
 env = FastAPI()
 
 
 @inject
 def get_web_client_env_app() -> FastAPI:
+    reload_env_config()
     return env
 
 
@@ -30,14 +38,23 @@ class ClientConfig(BaseModel):
 
     disable_soup: str = "0"
 
+    direct_audio_upload: str = "0"
+
 
 class ClientEnv(BaseModel):
     config: ClientConfig
 
 
-@env.get("/config.js", response_class=PlainTextResponse)
+class EnvConfigScript:
+    def __init__(self, content: str) -> None:
+        self.content = content.encode("utf-8")
+        # Changes whenever the exposed configuration changes
+        self.version = hashlib.blake2b(self.content, digest_size=8).hexdigest()
+        self.etag = weak_etag(self.version)
+
+
 @inject
-def get_env_config(
+def render_env_config(
     # For safety - we bother to list each configuration entry we want to expose,
     # and in multiple places - so exposing anything from the server env to the client
     # is (hopefully) a deliberate decision.
@@ -47,7 +64,9 @@ def get_env_config(
     posthog_host: str = Provide[Container.config.analytics.posthog.host],
     help_basic_guide_yt_video_id: str = Provide[Container.config.help.basic_guide_yt_video_id],
     disable_soup: str = Provide[Container.config.client.disable_soup],
-) -> str:
+    stream_segments_to_s3: bool = Provide[Container.config.data.content_s3_stream_segments],
+    direct_segment_uploads: bool = Provide[Container.config.data.content_s3_direct_segment_uploads],
+) -> EnvConfigScript:
     client_env = ClientEnv(
         config=ClientConfig(
             version=version,
@@ -57,12 +76,61 @@ def get_env_config(
             analytics_posthog_host=posthog_host,
             help_basic_guide_yt_video_id=help_basic_guide_yt_video_id,
             disable_soup="1" if disable_soup else "0",
+            direct_audio_upload="1" if stream_segments_to_s3 and direct_segment_uploads else "0",
         )
     )
-    config_script_content = f"window.__env__ = {client_env.model_dump_json()}"
-    return PlainTextResponse(content=config_script_content, headers={"Content-Type": "application/javascript"})
+    return EnvConfigScript(f"window.__env__ = {client_env.model_dump_json()}")
+
+
+# The configuration does not change while the process runs - render the script once
+env_config_script: EnvConfigScript = None
+# Its cached pages reference the versioned script
+web_client_app: WebClientStaticFiles = None
+
+
+def reload_env_config() -> EnvConfigScript:
+    global env_config_script
+    env_config_script = render_env_config()
+    if web_client_app:
+        web_client_app.clear_html_entries()
+    return env_config_script
+
+
+def get_env_config_script() -> EnvConfigScript:
+    return env_config_script or reload_env_config()
+
+
+@env.get("/config.js")
+async def get_env_config(
+    request: Request,
+    requested_version: Optional[str] = Query(None, alias="v", description="Version of the config script"),
+) -> Response:
+    config_script = get_env_config_script()
+
+    # A versioned url always maps to the same content - let clients keep it
+    cache_control = UNVERSIONED_ENV_CONFIG_CACHE_CONTROL
+    if requested_version == config_script.version:
+        cache_control = VERSIONED_ENV_CONFIG_CACHE_CONTROL
+
+    return conditional_response(
+        request,
+        config_script.etag,
+        {"identity": config_script.content},
+        cache_control=cache_control,
+        media_type="application/javascript",
+    )
+
+
+def version_env_config_script_reference(html: bytes) -> bytes:
+    # Pages reference the versioned script so it is cached across navigations
+    versioned_script_path = f"{ENV_CONFIG_SCRIPT_PATH}?v={get_env_config_script().version}"
+    return html.replace(f'"{ENV_CONFIG_SCRIPT_PATH}"'.encode(), f'"{versioned_script_path}"'.encode())
 
 
 @inject
 def get_web_client_app(dist_folder: str = Provide[Container.config.web_client_dist_folder]) -> FastAPI:
-    return StaticFiles(directory=pathlib.Path(dist_folder), html=True)
+    global web_client_app
+    web_client_app = WebClientStaticFiles(
+        directory=pathlib.Path(dist_folder), html=True, html_transform=version_env_config_script_reference
+    )
+    return web_client_app
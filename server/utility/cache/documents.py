@@ -0,0 +1,57 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Hashable, Optional
+
+# Upper bound on the memory held by cached document response bodies (all variants)
+DOCUMENT_BODY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+class BodyCache:
+    """
+    An LRU of encoded response bodies bounded by their total byte size.
+    Entries are (etag, {encoding: body}) - see utility.http.conditional.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries: OrderedDict[Hashable, tuple[str, dict[str, bytes], int]] = OrderedDict()
+        self.lock = Lock()  # Filled from the event loop, invalidated from sync worker threads
+
+    def get(self, key: Hashable) -> Optional[tuple[str, dict[str, bytes]]]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def set(self, key: Hashable, etag: str, variants: dict[str, bytes]) -> None:
+        size = sum(len(body) for body in variants.values())
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            self._pop(key)
+            self.entries[key] = (etag, variants, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                self._pop(next(iter(self.entries)))
+
+    def invalidate(self, item_key: Any) -> None:
+        # Cache keys start with the item key - drop all of its variants
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == item_key]:
+                self._pop(key)
+
+    def _pop(self, key: Hashable) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[2]
+
+
+document_bodies = BodyCache(DOCUMENT_BODY_CACHE_MAX_BYTES)
+
+
+def invalidate_document(document_id) -> None:
+    document_bodies.invalidate(str(document_id))
@@ -0,0 +1,72 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import NamedTuple, Optional
+from uuid import UUID
+
+from models.recital_session import SessionStatus
+from utility.metrics import CACHE_LOOKUPS, CACHE_MISSES
+
+# Kept short - writes from other processes are not seen until entries expire
+SESSION_ACCESS_CACHE_TTL_SEC = 15
+SESSION_ACCESS_CACHE_MAX_ENTRIES = 10_000
+
+
+class SessionAccess(NamedTuple):
+    id: str
+    user_id: UUID
+    status: SessionStatus
+    disavowed: bool
+
+
+class SessionAccessCache:
+    """
+    A TTL bounded LRU of the session fields authorizing segment uploads.
+    Loads are guarded by an invalidation counter - a row read before a concurrent
+    write is committed cannot be cached after that write invalidated the entry.
+    """
+
+    def __init__(self, ttl_sec: float, max_entries: int) -> None:
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, tuple[SessionAccess, float]] = OrderedDict()
+        self.invalidations = 0
+        self.lock = Lock()  # Read from the event loop, invalidated from scheduler worker threads
+
+    def get(self, session_id: str) -> Optional[SessionAccess]:
+        CACHE_LOOKUPS.labels("session_access").inc()
+        with self.lock:
+            entry = self.entries.get(session_id)
+            if entry is None:
+                CACHE_MISSES.labels("session_access").inc()
+                return None
+            if entry[1] < time.monotonic():
+                del self.entries[session_id]
+                CACHE_MISSES.labels("session_access").inc()
+                return None
+            self.entries.move_to_end(session_id)
+            return entry[0]
+
+    def begin_load(self) -> int:
+        return self.invalidations
+
+    def set(self, access: SessionAccess, load_token: int) -> None:
+        with self.lock:
+            if load_token != self.invalidations:
+                return
+            self.entries[access.id] = (access, time.monotonic() + self.ttl_sec)
+            self.entries.move_to_end(access.id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, session_id: str) -> None:
+        with self.lock:
+            self.invalidations += 1
+            self.entries.pop(session_id, None)
+
+
+session_access = SessionAccessCache(SESSION_ACCESS_CACHE_TTL_SEC, SESSION_ACCESS_CACHE_MAX_ENTRIES)
+
+
+def invalidate_session(session_id: str) -> None:
+    session_access.invalidate(session_id)
@@ -1,9 +1,12 @@
+import functools
 import inspect
 from enum import StrEnum
 from typing import Union
 
 from dogpile.cache import make_region
 
+from utility.metrics import CACHE_LOOKUPS, CACHE_MISSES
+
 
 class CacheKeys(StrEnum):
     user_stats = "user_stats"
@@ -46,6 +49,30 @@ region = make_region(function_key_generator=stats_key_gen).configure(
 )
 
 
+def cache_on_arguments(**kwargs):
+    # region.cache_on_arguments - counting lookups and misses (creations) per cached function
+    def decorator(fn):
+        lookups = CACHE_LOOKUPS.labels(fn.__name__)
+        misses = CACHE_MISSES.labels(fn.__name__)
+
+        # Wrapped - so the key generator still sees the signature and name of fn
+        @functools.wraps(fn)
+        def create(*args, **kw):
+            misses.inc()
+            return fn(*args, **kw)
+
+        cached = region.cache_on_arguments(**kwargs)(create)
+
+        @functools.wraps(cached)
+        def lookup(*args, **kw):
+            lookups.inc()
+            return cached(*args, **kw)
+
+        return lookup
+
+    return decorator
+
+
 def invalidate_stats_by_user_id(user_id):
     for key in user_stats_keys:
         region.delete(key % user_id)
@@ -0,0 +1,55 @@
+import hashlib
+import mimetypes
+import os
+import re
+
+# Session files are kept under "sessions/<bucket>/<session_id>/" in the data folder.
+# The 256 buckets keep every directory small however many sessions there are,
+# and a session is cleaned up by removing its own directory.
+# Stored filenames are paths relative to the data folder - files of the flat legacy
+# layout (directly in the data folder) keep resolving until they are migrated.
+SESSIONS_FOLDER = "sessions"
+# Request profiles recorded for admins - not session data
+PROFILES_FOLDER = "profiles"
+# Lock files of the transcode slots shared by all processes on the box
+TRANSCODE_SLOTS_FOLDER = "transcode-slots"
+
+
+def get_session_bucket(session_id: str) -> str:
+    return hashlib.blake2b(session_id.encode(), digest_size=1).hexdigest()
+
+
+def get_session_folder(session_id: str) -> str:
+    return os.path.join(SESSIONS_FOLDER, get_session_bucket(session_id), session_id)
+
+
+def get_session_file(session_id: str, filename: str) -> str:
+    return os.path.join(get_session_folder(session_id), filename)
+
+
+def is_flat_layout_file(filename: str) -> bool:
+    return os.path.dirname(filename) == ""
+
+
+# Flat layout files of a session - its audio segments "<session_id>[.<ext>].seg.<n>[.part]"
+# and its text and audio files "<session_id>.<ext>"
+FLAT_LAYOUT_SEGMENT_FILE_PATTERN = re.compile(r"^([0-9A-Za-z_-]+)(?:\.[0-9A-Za-z]+)?\.seg\.\d+(?:\.part)?$")
+FLAT_LAYOUT_SESSION_FILE_PATTERN = re.compile(r"^([0-9A-Za-z_-]+)(\.[0-9A-Za-z]+)$")
+# Segments of a mime type without a known extension are stored as .bin
+SESSION_FILE_EXTENSIONS = {".vtt", ".mka", ".webm", ".mp3", ".bin"}
+
+
+def is_session_file_extension(file_extension: str) -> bool:
+    if file_extension in SESSION_FILE_EXTENSIONS:
+        return True
+    mime_type, _ = mimetypes.guess_type(f"file{file_extension}")
+    return bool(mime_type) and mime_type.startswith(("audio/", "video/"))
+
+
+def get_flat_layout_file_session_id(filename: str) -> str | None:
+    # None for files in the data folder which are not session files
+    if match := FLAT_LAYOUT_SEGMENT_FILE_PATTERN.match(filename):
+        return match.group(1)
+    if (match := FLAT_LAYOUT_SESSION_FILE_PATTERN.match(filename)) and is_session_file_extension(match.group(2)):
+        return match.group(1)
+    return None
@@ -0,0 +1,122 @@
+import gzip
+import hashlib
+import json
+from typing import Any, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+try:
+    import brotli
+except ImportError:  # Optional - gzip is used alone without it
+    brotli = None
+
+# Bodies smaller than this are not worth the compression CPU
+COMPRESSION_MIN_SIZE = 1024
+
+# Revalidate every time - a matching ETag costs a 304 with no body
+DEFAULT_CACHE_CONTROL = "private, no-cache"
+
+
+def supported_encodings() -> list[str]:
+    # In order of preference
+    return ["br", "gzip"] if brotli else ["gzip"]
+
+
+def serialize_json(content: Any, response_model: Optional[Any] = None) -> bytes:
+    if response_model is not None:
+        adapter = TypeAdapter(response_model)
+        return adapter.dump_json(adapter.validate_python(content, from_attributes=True))
+
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def weak_etag(tag: str) -> str:
+    # Weak - the identity and the compressed bodies share it, while not being byte for byte the same
+    return f'W/"{tag}"'
+
+
+def compute_etag(body: bytes) -> str:
+    return weak_etag(hashlib.blake2b(body, digest_size=16).hexdigest())
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    # Weak comparison - as If-None-Match requires
+    return "*" in candidates or etag.removeprefix("W/") in [candidate.removeprefix("W/") for candidate in candidates]
+
+
+def select_encoding(request: Request, available_encodings: list[str]) -> Optional[str]:
+    accepted = {}
+    for accepted_entry in request.headers.get("accept-encoding", "").split(","):
+        encoding, _, params = accepted_entry.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[encoding.strip().lower()] = quality
+
+    for encoding in available_encodings:
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def encode_body_variants(body: bytes) -> dict[str, bytes]:
+    """Pre-compress a body in every supported encoding - for bodies that are served many times."""
+    variants = {"identity": body}
+    if len(body) >= COMPRESSION_MIN_SIZE:
+        for encoding in supported_encodings():
+            variants[encoding] = compress(body, encoding)
+    return variants
+
+
+def conditional_response(
+    request: Request,
+    etag: str,
+    variants: dict[str, bytes],
+    cache_control: str = DEFAULT_CACHE_CONTROL,
+    media_type: str = "application/json",
+) -> Response:
+    """Respond with a 304 if the client holds the current body, or with the best encoded variant of it.
+
+    Missing compressed variants are compressed on the fly when the body is large enough.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    body = variants["identity"]
+    if len(body) >= COMPRESSION_MIN_SIZE:
+        encoding = select_encoding(request, supported_encodings())
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            body = variants.get(encoding) or compress(body, encoding)
+
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def conditional_json_response(
+    request: Request,
+    content: Any,
+    response_model: Optional[Any] = None,
+    cache_control: str = DEFAULT_CACHE_CONTROL,
+) -> Response:
+    body = serialize_json(content, response_model)
+    return conditional_response(request, compute_etag(body), {"identity": body}, cache_control=cache_control)
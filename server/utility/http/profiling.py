@@ -0,0 +1,55 @@
+import asyncio
+from typing import Callable
+from uuid import uuid4
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from utility.profiling import SamplingProfiler
+
+# Sent by admins to profile a request - the response tells the id of the stored profile
+PROFILE_REQUEST_HEADER = b"x-recital-profile"
+PROFILE_ID_RESPONSE_HEADER = "X-Recital-Profile-Id"
+
+
+class RequestProfilerMiddleware:
+    # Requests without the header pass through - the profiler only runs when asked for
+    def __init__(
+        self,
+        app: ASGIApp,
+        is_profiling_allowed: Callable[[HTTPConnection], bool],
+        store_profile: Callable[[str, str], None],
+    ) -> None:
+        self.app = app
+        self.is_profiling_allowed = is_profiling_allowed
+        self.store_profile = store_profile
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not any(name == PROFILE_REQUEST_HEADER for name, _ in scope["headers"]):
+            await self.app(scope, receive, send)
+            return
+
+        # Looks up the user - off the event loop
+        if not await asyncio.to_thread(self.is_profiling_allowed, HTTPConnection(scope)):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid4().hex
+
+        async def send_with_profile_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append(PROFILE_ID_RESPONSE_HEADER, profile_id)
+            await send(message)
+
+        profiler = SamplingProfiler()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.stop()
+            try:
+                await asyncio.to_thread(self.store_profile, profile_id, profiler.get_folded_stacks())
+            except Exception as e:
+                print(f"Warning - Unable to store request profile {profile_id}")
+                print(e)
@@ -0,0 +1,24 @@
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from utility.query_stats import current_query_source
+
+
+class QuerySourceMiddleware:
+    # Attributes the statements of a request (or a websocket connection) to its route template
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        def get_route_source() -> str:
+            route_path = getattr(scope.get("route"), "path", None) or "unmatched"
+            return f"{scope.get('method', 'WS')} {route_path}"
+
+        token = current_query_source.set(get_route_source)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_query_source.reset(token)
@@ -0,0 +1,96 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Phases of a request reported in its "Server-Timing" header - in this order
+SERVER_TIMING_PHASES = {
+    "auth": "Authentication",
+    "db": "Database",
+    "file": "File I/O",
+    "analytics": "Analytics",
+}
+
+
+class RequestTimings:
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.durations: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+
+    def add(self, phase: str, duration: float) -> None:
+        self.durations[phase] = self.durations.get(phase, 0.0) + duration
+        self.counts[phase] = self.counts.get(phase, 0) + 1
+
+    def get_header_value(self) -> str:
+        # Phases may overlap (e.g. the DB queries of the authentication) - each is its own total
+        metrics = []
+        for phase, description in SERVER_TIMING_PHASES.items():
+            if phase in self.durations:
+                description = f"{description} ({self.counts[phase]})"
+                metrics.append(f'{phase};dur={self.durations[phase] * 1000:.1f};desc="{description}"')
+        metrics.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+# Set per request - worker threads the request runs code in get a copy of the context, and so the same timings
+current_request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("current_request_timings", default=None)
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    timings = current_request_timings.get()
+    if timings is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(phase, time.perf_counter() - started)
+
+
+def record_engine_timings(engine: Engine) -> None:
+    # Statements executed outside of a request (jobs, the group commit writer thread) are not counted
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if current_request_timings.get() is not None:
+            conn.info["server_timing_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        timings = current_request_timings.get()
+        started = conn.info.pop("server_timing_started", None)
+        if timings is not None and started is not None:
+            timings.add("db", time.perf_counter() - started)
+
+
+class ServerTimingMiddleware:
+    # Pure ASGI - the header is added as the response starts, streamed bodies are not held back
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+
+        async def send_with_server_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", timings.get_header_value())
+            await send(message)
+
+        token = current_request_timings.set(timings)
+        try:
+            await self.app(scope, receive, send_with_server_timing)
+        finally:
+            current_request_timings.reset(token)
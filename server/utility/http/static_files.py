@@ -0,0 +1,169 @@
+import os
+import re
+import stat
+from email.utils import formatdate
+from mimetypes import guess_type
+from typing import Callable, Optional
+
+import anyio
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+from fastapi.staticfiles import StaticFiles
+from starlette.types import Scope
+
+from .conditional import compute_etag, encode_body_variants, etag_matches, select_encoding, weak_etag
+
+# Vite emits bundle files as "assets/[name]-[hash].[ext]"
+HASHED_ASSET_PATTERN = re.compile(r"(^|/)assets/.+-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$")
+
+HASHED_ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# index.html points at the current hashed bundle - must be picked up soon after a deploy
+HTML_CACHE_CONTROL = "public, max-age=60"
+DEFAULT_CACHE_CONTROL = "public, max-age=3600"
+
+# Pre-built variants written next to the files by the web client build
+PRECOMPRESSED_FILE_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+MAX_IN_MEMORY_FILE_SIZE = 256 * 1024
+MAX_IN_MEMORY_TOTAL_SIZE = 32 * 1024 * 1024
+
+
+class StaticFileVariant:
+    def __init__(self, full_path: str, stat_result: os.stat_result, content: Optional[bytes]) -> None:
+        self.full_path = full_path
+        self.stat_result = stat_result
+        self.content = content
+
+
+class StaticFileEntry:
+    def __init__(
+        self, media_type: str, cache_control: str, etag: str, last_modified: str, variants: dict[str, StaticFileVariant]
+    ) -> None:
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.etag = etag
+        self.last_modified = last_modified
+        self.variants = variants
+
+
+class WebClientStaticFiles(StaticFiles):
+    """
+    Serves the built web client.
+    The dist folder does not change while the process runs - so files are looked up once,
+    small files are kept in memory and pre-compressed variants are picked by Accept-Encoding.
+    Anything which is not a plain file hit (redirects, 404s) is left to StaticFiles.
+
+    html_transform: Rewrites the content of html files once when they are loaded.
+    """
+
+    def __init__(self, *args, html_transform: Optional[Callable[[bytes], bytes]] = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.html_transform = html_transform
+        self.entries: dict[str, StaticFileEntry] = {}
+        self.in_memory_size = 0
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if scope["method"] in ("GET", "HEAD"):
+            entry = self.entries.get(path)
+            if entry is None:
+                entry = await anyio.to_thread.run_sync(self._lookup_entry, path)
+            if entry is not None:
+                self.entries[path] = entry
+                return self._entry_response(entry, scope)
+
+        return await super().get_response(path, scope)
+
+    def clear_html_entries(self) -> None:
+        # Transformed html is rendered again on its next request - after what the transform inserts changed
+        self.entries = {path: entry for path, entry in self.entries.items() if entry.media_type != "text/html"}
+
+    def _lookup_entry(self, path: str) -> Optional[StaticFileEntry]:
+        # The app root serves the index page
+        if path == "." and self.html:
+            path = "index.html"
+
+        try:
+            full_path, stat_result = self.lookup_path(path)
+        except (OSError, ValueError):
+            return None  # StaticFiles reports those
+
+        if not stat_result or not stat.S_ISREG(stat_result.st_mode):
+            return None
+
+        if HASHED_ASSET_PATTERN.search(path.replace(os.sep, "/")):
+            cache_control = HASHED_ASSET_CACHE_CONTROL
+        elif path.endswith(".html"):
+            cache_control = HTML_CACHE_CONTROL
+        else:
+            cache_control = DEFAULT_CACHE_CONTROL
+
+        media_type = guess_type(full_path)[0] or "text/plain"
+
+        if self.html_transform and path.endswith(".html"):
+            with open(full_path, "rb") as f:
+                content = self.html_transform(f.read())
+            # The pre-built variants hold the original content - encode the transformed one instead
+            return StaticFileEntry(
+                media_type=media_type,
+                cache_control=cache_control,
+                etag=compute_etag(content),
+                last_modified=formatdate(stat_result.st_mtime, usegmt=True),
+                variants={
+                    encoding: StaticFileVariant(full_path, stat_result, encoded_content)
+                    for encoding, encoded_content in encode_body_variants(content).items()
+                },
+            )
+
+        variants = {"identity": self._load_variant(full_path, stat_result)}
+        for encoding, suffix in PRECOMPRESSED_FILE_SUFFIXES.items():
+            try:
+                variant_stat_result = os.stat(full_path + suffix)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            variants[encoding] = self._load_variant(full_path + suffix, variant_stat_result)
+
+        return StaticFileEntry(
+            media_type=media_type,
+            cache_control=cache_control,
+            etag=weak_etag(f"{int(stat_result.st_mtime):x}-{stat_result.st_size:x}"),
+            last_modified=formatdate(stat_result.st_mtime, usegmt=True),
+            variants=variants,
+        )
+
+    def _load_variant(self, full_path: str, stat_result: os.stat_result) -> StaticFileVariant:
+        content = None
+        size = stat_result.st_size
+        if size <= MAX_IN_MEMORY_FILE_SIZE and self.in_memory_size + size <= MAX_IN_MEMORY_TOTAL_SIZE:
+            with open(full_path, "rb") as f:
+                content = f.read()
+            self.in_memory_size += len(content)
+        return StaticFileVariant(full_path, stat_result, content)
+
+    def _entry_response(self, entry: StaticFileEntry, scope: Scope) -> Response:
+        request = Request(scope)
+        headers = {
+            "Cache-Control": entry.cache_control,
+            "ETag": entry.etag,
+            "Last-Modified": entry.last_modified,
+        }
+        if len(entry.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+
+        if etag_matches(request, entry.etag):
+            return Response(status_code=304, headers=headers)
+
+        encoding = select_encoding(request, [e for e in PRECOMPRESSED_FILE_SUFFIXES if e in entry.variants])
+        variant = entry.variants[encoding or "identity"]
+        if encoding:
+            headers["Content-Encoding"] = encoding
+
+        if variant.content is None:
+            return FileResponse(
+                variant.full_path, stat_result=variant.stat_result, media_type=entry.media_type, headers=headers
+            )
+
+        if scope["method"] == "HEAD":
+            headers["Content-Length"] = str(len(variant.content))
+            return Response(media_type=entry.media_type, headers=headers)
+
+        return Response(content=variant.content, media_type=entry.media_type, headers=headers)
@@ -0,0 +1,159 @@
+import math
+import time
+from typing import Callable
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import REGISTRY, Collector
+from sqlalchemy.pool import Pool
+
+# Server metrics - exposed in the Prometheus text format at /api/metrics.
+# Labels are kept to bounded sets (route templates, job names, operations) - never ids.
+
+HTTP_REQUEST_DURATION = Histogram(
+    "recital_http_request_duration_seconds",
+    "Latency of API requests by route template",
+    ["method", "route", "status"],
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "recital_http_requests_in_progress",
+    "API requests being handled",
+    ["method"],
+)
+
+DB_POOL_CHECKOUT_DURATION = Histogram(
+    "recital_db_pool_checkout_seconds",
+    "Time to check out a DB connection - including waiting for a free one",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "recital_db_pool_connections",
+    "DB pool connections by state",
+    ["engine", "state"],
+)
+
+JOB_DURATION = Histogram(
+    "recital_job_duration_seconds",
+    "Run time of scheduled jobs",
+    ["job"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+JOB_LAG = Histogram(
+    "recital_job_lag_seconds",
+    "Delay between the scheduled run time of a job and its submission",
+    ["job"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300),
+)
+JOB_EVENTS = Counter(
+    "recital_job_events_total",
+    "Scheduled job outcomes other than success",
+    ["job", "event"],
+)
+
+MEDIA_TOOL_DURATION = Histogram(
+    "recital_media_tool_duration_seconds",
+    "Run time of ffmpeg / ffprobe invocations",
+    ["tool", "operation"],
+    buckets=(0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+
+TRANSCODES = Gauge(
+    "recital_transcodes",
+    "ffmpeg transcodes by state - running or queued for a slot",
+    ["state"],
+)
+TRANSCODE_CONCURRENCY_LIMIT = Gauge(
+    "recital_transcode_concurrency_limit",
+    "Transcodes currently admitted to run at once - lowered under load",
+)
+
+STORAGE_REQUEST_DURATION = Histogram(
+    "recital_storage_request_duration_seconds",
+    "Latency of content storage (S3) operations",
+    ["operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+STORAGE_UPLOAD_BYTES = Counter(
+    "recital_storage_upload_bytes_total",
+    "Bytes uploaded to the content storage (S3)",
+    ["operation"],
+)
+
+CACHE_LOOKUPS = Counter(
+    "recital_cache_lookups_total",
+    "Cached value lookups - the hit ratio is 1 - misses / lookups",
+    ["cache"],
+)
+CACHE_MISSES = Counter(
+    "recital_cache_misses_total",
+    "Cached value lookups which computed the value",
+    ["cache"],
+)
+
+
+def timed_pool_class(pool_class: type[Pool], engine_name: str) -> type[Pool]:
+    checkout_duration = DB_POOL_CHECKOUT_DURATION.labels(engine_name)
+
+    class TimedPool(pool_class):
+        def connect(self):
+            started = time.perf_counter()
+            try:
+                return super().connect()
+            finally:
+                checkout_duration.observe(time.perf_counter() - started)
+
+    TimedPool.__name__ = f"Timed{pool_class.__name__}"
+    return TimedPool
+
+
+def instrument_engine_pool(get_pool: Callable[[], Pool], engine_name: str) -> None:
+    # Sampled on scrape - the engine may replace its pool (e.g. on dispose)
+    def pool_stat(stat_name: str) -> Callable[[], float]:
+        def read_stat() -> float:
+            stat = getattr(get_pool(), stat_name, None)
+            return stat() if stat else math.nan
+
+        return read_stat
+
+    for state, stat_name in [
+        ("checked_out", "checkedout"),
+        ("idle", "checkedin"),
+        ("overflow", "overflow"),
+        ("size", "size"),
+    ]:
+        DB_POOL_CONNECTIONS.labels(engine_name, state).set_function(pool_stat(stat_name))
+
+
+class SessionFinalizationBacklogCollector(Collector):
+    # Queried on scrape - counts of the sessions finalization did not complete yet
+    def __init__(self, get_finalization_backlog: Callable[[], list[tuple[str, bool, bool, int]]]) -> None:
+        self.get_finalization_backlog = get_finalization_backlog
+
+    def _backlog_family(self) -> GaugeMetricFamily:
+        return GaugeMetricFamily(
+            "recital_sessions_pending_finalization",
+            "Sessions not yet uploaded (or discarded) by status",
+            labels=["status", "disavowed", "quarantined"],
+        )
+
+    def describe(self):
+        # Registration does not run the query
+        yield self._backlog_family()
+
+    def collect(self):
+        backlog = self._backlog_family()
+        for status, disavowed, quarantined, count in self.get_finalization_backlog():
+            backlog.add_metric([status, str(bool(disavowed)).lower(), str(bool(quarantined)).lower()], count)
+        yield backlog
+
+
+session_finalization_backlog_collector: SessionFinalizationBacklogCollector = None
+
+
+def register_session_finalization_backlog(get_finalization_backlog: Callable[[], list]) -> None:
+    global session_finalization_backlog_collector
+    if session_finalization_backlog_collector is not None:
+        REGISTRY.unregister(session_finalization_backlog_collector)
+    session_finalization_backlog_collector = SessionFinalizationBacklogCollector(get_finalization_backlog)
+    REGISTRY.register(session_finalization_backlog_collector)
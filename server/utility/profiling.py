@@ -0,0 +1,94 @@
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+from utility.data_layout import PROFILES_FOLDER
+
+# Samples per second are 1 / interval - a sample walks the stacks of all threads
+DEFAULT_SAMPLING_INTERVAL_SEC = 0.002
+MAX_STORED_PROFILES = 100
+
+# Leaf frames of threads waiting for work - left out so idle workers do not bury the profile
+IDLE_FRAMES = {
+    ("selectors.py", "select"),  # The event loop waiting for IO
+    ("threading.py", "wait"),  # Worker threads waiting for tasks
+    ("thread.py", "_worker"),  # Executor threads blocked on their queue
+}
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of all threads from a background thread - only while running.
+    The profile is in the "folded stacks" format (one "root;...;leaf count" line per stack),
+    read by flamegraph.pl, speedscope and most flamegraph tools.
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLING_INTERVAL_SEC) -> None:
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.sampler: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self.sampler = threading.Thread(target=self._sample_until_stopped, name="sampling-profiler", daemon=True)
+        self.sampler.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.sampler.join()
+
+    def _sample_until_stopped(self) -> None:
+        sampler_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == sampler_id:
+                    continue
+                if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES:
+                    continue
+
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                frames.append(thread_names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(frames))] += 1
+            self.samples += 1
+
+    def get_folded_stacks(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfileStore:
+    # Kept as files - any worker process can serve a profile recorded by another
+    def __init__(self, data_folder: str, max_profiles: int = MAX_STORED_PROFILES) -> None:
+        self.folder = Path(data_folder, PROFILES_FOLDER)
+        self.max_profiles = max_profiles
+
+    def _get_profile_path(self, profile_id: str) -> Optional[Path]:
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        return Path(self.folder, f"{profile_id}.folded")
+
+    def save(self, profile_id: str, folded_stacks: str) -> None:
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self._get_profile_path(profile_id).write_text(folded_stacks)
+
+        # Oldest first out
+        profiles = sorted(self.folder.glob("*.folded"), key=lambda path: path.stat().st_mtime)
+        for profile_path in profiles[: -self.max_profiles]:
+            profile_path.unlink(missing_ok=True)
+
+    def load(self, profile_id: str) -> Optional[str]:
+        profile_path = self._get_profile_path(profile_id)
+        if not profile_path or not profile_path.is_file():
+            return None
+        return profile_path.read_text()
@@ -0,0 +1,179 @@
+import functools
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, Literal, Optional
+
+from pydantic import BaseModel, computed_field
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Statements are aggregated by fingerprint - the statement with its literals and bind parameters
+# replaced by "?" - per source, the API route or scheduled job which executed them.
+# Kept in memory per worker process, since it started or was last reset.
+
+DEFAULT_SLOW_QUERY_THRESHOLD_MS = 500
+MAX_TRACKED_QUERIES = 2000
+UNTRACKED_FINGERPRINT = "<untracked>"
+UNKNOWN_QUERY_SOURCE = "other"
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_WHITESPACE = re.compile(r"\s+")
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+# psycopg2 / asyncpg / named / qmark styles - "::" casts are left alone
+_BIND_PARAMS = re.compile(r"%\(\w+\)s|%s|\$\d+|(?<![:\w]):\w+")
+_NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\bIN \((?:\?, )*\?\)", re.IGNORECASE)
+_VALUES_ROWS = re.compile(r"(\((?:\?, )*\?\))(?:, \((?:\?, )*\?\))+")
+
+
+@functools.lru_cache(maxsize=1024)
+def fingerprint_statement(statement: str) -> str:
+    # Expanded IN lists and multi-row inserts of any length share a fingerprint
+    fingerprint = _COMMENTS.sub(" ", statement)
+    fingerprint = _WHITESPACE.sub(" ", fingerprint).strip()
+    fingerprint = _STRINGS.sub("?", fingerprint)
+    fingerprint = _BIND_PARAMS.sub("?", fingerprint)
+    fingerprint = _NUMBERS.sub("?", fingerprint)
+    fingerprint = _IN_LISTS.sub("IN (?+)", fingerprint)
+    return _VALUES_ROWS.sub(r"\1, ...", fingerprint)
+
+
+def _get_value_shape(value) -> str:
+    # Types and sizes only - bound values are user content
+    if isinstance(value, (str, bytes, list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def get_parameters_shape(parameters, executemany: bool) -> str:
+    if executemany and parameters:
+        return f"{len(parameters)} x {get_parameters_shape(parameters[0], False)}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{name}: {_get_value_shape(value)}" for name, value in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(_get_value_shape(value) for value in parameters) + ")"
+    return _get_value_shape(parameters)
+
+
+class QueryStatsEntry(BaseModel):
+    fingerprint: Optional[str] = None
+    source: Optional[str] = None
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+
+    @computed_field
+    @property
+    def mean_ms(self) -> float:
+        return self.total_ms / self.count if self.count else 0.0
+
+
+QueryStatsGroupBy = Literal["fingerprint", "source", "fingerprint_and_source"]
+QueryStatsOrderBy = Literal["total", "max", "count", "mean"]
+
+
+class QueryStats:
+    def __init__(self, max_tracked: int = MAX_TRACKED_QUERIES) -> None:
+        self.max_tracked = max_tracked
+        self.slow_query_threshold_ms = DEFAULT_SLOW_QUERY_THRESHOLD_MS
+        self.entries: dict[tuple[str, str], QueryStatsEntry] = {}
+        self.lock = threading.Lock()
+
+    def add(self, fingerprint: str, source: str, duration_ms: float) -> None:
+        key = (fingerprint, source)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                if len(self.entries) >= self.max_tracked:
+                    # Bounded - statements never seen before are lumped together once full
+                    key = (UNTRACKED_FINGERPRINT, source)
+                    entry = self.entries.get(key)
+                if entry is None:
+                    entry = self.entries[key] = QueryStatsEntry(fingerprint=key[0], source=source)
+            entry.count += 1
+            entry.total_ms += duration_ms
+            entry.max_ms = max(entry.max_ms, duration_ms)
+
+    def get_top(
+        self, limit: int, group_by: QueryStatsGroupBy = "fingerprint", order_by: QueryStatsOrderBy = "total"
+    ) -> list[QueryStatsEntry]:
+        with self.lock:
+            entries = [entry.model_copy() for entry in self.entries.values()]
+
+        if group_by != "fingerprint_and_source":
+            grouped: dict[str, QueryStatsEntry] = {}
+            for entry in entries:
+                group_key = getattr(entry, group_by)
+                group = grouped.setdefault(group_key, QueryStatsEntry(**{group_by: group_key}))
+                group.count += entry.count
+                group.total_ms += entry.total_ms
+                group.max_ms = max(group.max_ms, entry.max_ms)
+            entries = list(grouped.values())
+
+        sort_key = {
+            "total": lambda entry: entry.total_ms,
+            "max": lambda entry: entry.max_ms,
+            "count": lambda entry: entry.count,
+            "mean": lambda entry: entry.mean_ms,
+        }[order_by]
+        return sorted(entries, key=sort_key, reverse=True)[:limit]
+
+    def reset(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+query_stats = QueryStats()
+
+# Resolved when a statement completes - a request route is only known once the request was routed
+current_query_source: ContextVar[Optional[Callable[[], str]]] = ContextVar("current_query_source", default=None)
+
+
+@contextmanager
+def query_source(name: str) -> Iterator[None]:
+    token = current_query_source.set(lambda: name)
+    try:
+        yield
+    finally:
+        current_query_source.reset(token)
+
+
+def get_query_source() -> str:
+    get_source = current_query_source.get()
+    return get_source() if get_source else UNKNOWN_QUERY_SOURCE
+
+
+def record_query_stats(engine: Engine) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_stats_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("query_stats_started", None)
+        if started is None:
+            return
+
+        duration_ms = (time.perf_counter() - started) * 1000
+        fingerprint = fingerprint_statement(statement)
+        source = get_query_source()
+        query_stats.add(fingerprint, source, duration_ms)
+
+        if duration_ms >= query_stats.slow_query_threshold_ms:
+            logger.warning(
+                "Slow query (%.0f ms, %s): %s parameters: %s",
+                duration_ms,
+                source,
+                fingerprint,
+                get_parameters_shape(parameters, executemany),
+            )
+
+
+def configure_slow_query_log(threshold_ms: int) -> None:
+    query_stats.slow_query_threshold_ms = threshold_ms
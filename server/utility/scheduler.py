@@ -1,8 +1,77 @@
+import functools
+import inspect
+import time
+from datetime import datetime, timezone
+
 from pytz import utc
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED, JobEvent
 from apscheduler.schedulers.base import BaseScheduler
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.util import get_callable_name
+
+from utility.metrics import JOB_DURATION, JOB_EVENTS, JOB_LAG
+from utility.query_stats import query_source
+
+
+def timed_job(func, job_name: str):
+    # Measures the job run itself - not the time it waited for an executor
+    source = f"job {job_name}"
+    job_duration = JOB_DURATION.labels(job_name)
+    job_errors = JOB_EVENTS.labels(job_name, "error")
+
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def run_timed_coroutine_job(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                with query_source(source):
+                    return await func(*args, **kwargs)
+            except Exception:
+                job_errors.inc()
+                raise
+            finally:
+                job_duration.observe(time.perf_counter() - started)
+
+        return run_timed_coroutine_job
+
+    @functools.wraps(func)
+    def run_timed_job(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            with query_source(source):
+                return func(*args, **kwargs)
+        except Exception:
+            job_errors.inc()
+            raise
+        finally:
+            job_duration.observe(time.perf_counter() - started)
+
+    return run_timed_job
 
 
 class JobScheduler(AsyncIOScheduler):
     def __init__(self):
         super().__init__(timezone=utc)
+        # One off jobs are removed before their events are dispatched - their names are kept until then
+        self.job_names: dict[str, str] = {}
+        self.add_listener(self._record_job_event, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED)
+
+    def add_job(self, func, *args, name=None, **kwargs):
+        # Jobs are measured by name - per session job ids would not make bounded labels
+        name = name or get_callable_name(func)
+        job = super().add_job(timed_job(func, name), *args, name=name, **kwargs)
+        self.job_names[job.id] = name
+        return job
+
+    def _record_job_event(self, event: JobEvent) -> None:
+        job_name = self.job_names.get(event.job_id, "unknown")
+        if self.get_job(event.job_id) is None:
+            self.job_names.pop(event.job_id, None)
+
+        if event.code == EVENT_JOB_SUBMITTED:
+            # Coalesced runs are submitted once - the earliest of them waited the most
+            scheduled_run_time = min(event.scheduled_run_times)
+            JOB_LAG.labels(job_name).observe((datetime.now(timezone.utc) - scheduled_run_time).total_seconds())
+        elif event.code == EVENT_JOB_MISSED:
+            JOB_EVENTS.labels(job_name, "missed").inc()
@@ -0,0 +1,150 @@
+import secrets
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterator, NamedTuple, Optional
+
+from opentelemetry import trace
+from opentelemetry.trace import Status, StatusCode
+
+try:
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+except ImportError:  # Optional - without it spans are only kept in the session timelines
+    TracerProvider = None
+
+# Spans go to OpenTelemetry (exported when an exporter is configured) and - within a session
+# trace - into the timeline of the session, which is stored once the traced work is done.
+
+tracer = trace.get_tracer("crowd-recital")
+
+
+class TraceSpan:
+    def __init__(self, name: str, trace_id: str, span_id: str, parent_span_id: Optional[str], otel_span) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_span_id = parent_span_id
+        self.started_at = datetime.now(timezone.utc)
+        self.duration = 0.0
+        self.status = "ok"
+        self.attributes: dict[str, Any] = {}
+        self.otel_span = otel_span
+
+    def set_attributes(self, **attributes) -> None:
+        attributes = {key: value for key, value in attributes.items() if value is not None}
+        self.attributes.update(attributes)
+        self.otel_span.set_attributes(attributes)
+
+    def set_error(self, error: str) -> None:
+        self.status = "error"
+        self.attributes["error"] = error
+        self.otel_span.set_status(Status(StatusCode.ERROR, error))
+
+
+class SessionTimeline(NamedTuple):
+    session_id: str
+    spans: list[TraceSpan]
+
+
+current_timeline: ContextVar[Optional[SessionTimeline]] = ContextVar("current_timeline", default=None)
+current_span: ContextVar[Optional[TraceSpan]] = ContextVar("current_span", default=None)
+
+
+def _get_span_ids(otel_span, parent: Optional[TraceSpan]) -> tuple[str, str]:
+    # Exported spans and timeline spans share ids - random ones when nothing is exported
+    span_context = otel_span.get_span_context()
+    if span_context.is_valid:
+        return format(span_context.trace_id, "032x"), format(span_context.span_id, "016x")
+    return parent.trace_id if parent else secrets.token_hex(16), secrets.token_hex(8)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[TraceSpan]:
+    timeline = current_timeline.get()
+    parent = current_span.get()
+    if timeline and "session_id" not in attributes:
+        attributes["session_id"] = timeline.session_id
+
+    # Exceptions are recorded on the OpenTelemetry span by the context manager
+    with tracer.start_as_current_span(name) as otel_span:
+        trace_id, span_id = _get_span_ids(otel_span, parent)
+        trace_span = TraceSpan(name, trace_id, span_id, parent.span_id if parent else None, otel_span)
+        trace_span.set_attributes(**attributes)
+        token = current_span.set(trace_span)
+        started = time.perf_counter()
+        try:
+            yield trace_span
+        except Exception as e:
+            trace_span.set_error(repr(e))
+            raise
+        finally:
+            trace_span.duration = time.perf_counter() - started
+            current_span.reset(token)
+            if timeline:
+                timeline.spans.append(trace_span)
+
+
+@contextmanager
+def session_trace(
+    session_id: str, name: str, store_timeline: Callable[[SessionTimeline], None], **attributes
+) -> Iterator[TraceSpan]:
+    # The spans within are collected into the session timeline - stored even when the work failed
+    timeline = SessionTimeline(session_id, [])
+    token = current_timeline.set(timeline)
+    try:
+        with span(name, **attributes) as root_span:
+            yield root_span
+    finally:
+        current_timeline.reset(token)
+        try:
+            store_timeline(timeline)
+        except Exception as e:
+            print(f"Warning - Unable to store the trace timeline of session {session_id}")
+            print(e)
+
+
+def set_span_attributes(**attributes) -> None:
+    trace_span = current_span.get()
+    if trace_span:
+        trace_span.set_attributes(**attributes)
+
+
+def set_span_error(error: str) -> None:
+    trace_span = current_span.get()
+    if trace_span:
+        trace_span.set_error(error)
+
+
+def configure_tracing(exporter: Optional[str], export_file: Optional[str], service_version: str) -> None:
+    if not exporter:
+        return
+
+    if TracerProvider is None:
+        print("Warning - Tracing export requires the opentelemetry-sdk package. Not exporting.")
+        return
+
+    if exporter == "console":
+        span_exporter = ConsoleSpanExporter()
+    elif exporter == "file":
+        # One JSON span per line
+        span_exporter = ConsoleSpanExporter(
+            out=open(export_file, "a"), formatter=lambda span: span.to_json(indent=None) + "\n"
+        )
+    elif exporter == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            print("Warning - OTLP tracing export requires the opentelemetry-exporter-otlp package. Not exporting.")
+            return
+        span_exporter = OTLPSpanExporter()  # Configured by the standard OTEL_EXPORTER_OTLP_* env vars
+    else:
+        print(f"Warning - Unknown tracing exporter {exporter}. Not exporting.")
+        return
+
+    resource = Resource.create({"service.name": "crowd-recital", "service.version": service_version})
+    tracer_provider = TracerProvider(resource=resource)
+    tracer_provider.add_span_processor(BatchSpanProcessor(span_exporter))
+    trace.set_tracer_provider(tracer_provider)
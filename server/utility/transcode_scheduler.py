@@ -0,0 +1,163 @@
+import fcntl
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional, TextIO
+
+from pydantic import BaseModel
+
+from errors import TranscodeDeferredError
+from utility import tracing
+from utility.data_layout import TRANSCODE_SLOTS_FOLDER
+from utility.metrics import TRANSCODE_CONCURRENCY_LIMIT, TRANSCODES
+
+DEFAULT_MAX_CONCURRENCY = 2
+DEFAULT_THREADS = 2
+DEFAULT_NICENESS = 10
+DEFAULT_MAX_LOAD_PER_CPU = 0.75
+DEFAULT_MAX_WAIT_SEC = 60
+
+# Waiting transcodes look for a free slot (and at the load) this often
+SLOT_POLL_SEC = 1
+
+
+class TranscodeSchedulerStatus(BaseModel):
+    running: int
+    queued: int
+    concurrency_limit: int
+    max_concurrency: int
+    load_per_cpu: float
+
+
+def get_load_per_cpu() -> float:
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):  # Not available on this platform
+        return 0.0
+
+
+class TranscodeScheduler:
+    """
+    Admits ffmpeg processes sharing the box with the API - a few at a time, at a low CPU and IO
+    priority and with an explicit thread budget.
+    The slots are lock files in the data folder, shared by all worker and job processes on the box.
+    While the load average (per core) is above the target fewer slots are open - none at all under
+    a heavy load, when a transcode waiting longer than max_wait_sec is deferred (TranscodeDeferredError).
+    """
+
+    def __init__(
+        self,
+        data_folder: str,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        threads: int = DEFAULT_THREADS,
+        niceness: int = DEFAULT_NICENESS,
+        max_load_per_cpu: float = DEFAULT_MAX_LOAD_PER_CPU,
+        max_wait_sec: float = DEFAULT_MAX_WAIT_SEC,
+    ) -> None:
+        self.slots_folder = Path(data_folder, TRANSCODE_SLOTS_FOLDER)
+        self.max_concurrency = max(1, max_concurrency)
+        self.threads = threads
+        self.max_load_per_cpu = max_load_per_cpu
+        self.max_wait_sec = max_wait_sec
+        self.queued = 0  # Of this process - waiting ones are not visible across processes
+        self.queued_lock = threading.Lock()
+
+        # Priority wrappers - when available on the box
+        self.priority_prefix = []
+        if niceness and shutil.which("nice"):
+            self.priority_prefix += ["nice", "-n", str(niceness)]
+        if niceness and shutil.which("ionice"):
+            self.priority_prefix += ["ionice", "-c", "2", "-n", "7"]  # Lowest best-effort IO priority
+
+        TRANSCODES.labels("running").set_function(self.get_running)
+        TRANSCODES.labels("queued").set_function(lambda: self.queued)
+        TRANSCODE_CONCURRENCY_LIMIT.set_function(self.get_concurrency_limit)
+
+    def build_ffmpeg_command(self, input: str, output_args: list[str], output: str) -> list[str]:
+        # The thread budget applies to both decoding (before the input) and encoding (before the output)
+        threads_args = ["-threads", str(self.threads)] if self.threads else []
+        return [
+            *self.priority_prefix,
+            "ffmpeg",
+            "-y",
+            *threads_args,
+            "-i",
+            input,
+            *output_args,
+            *threads_args,
+            output,
+        ]
+
+    def get_concurrency_limit(self) -> int:
+        load_per_cpu = get_load_per_cpu()
+        if load_per_cpu <= self.max_load_per_cpu:
+            return self.max_concurrency
+        # Zero once the load is more than max_concurrency times the target
+        return int(self.max_concurrency * self.max_load_per_cpu / load_per_cpu)
+
+    def _get_slot_path(self, slot_index: int) -> Path:
+        return Path(self.slots_folder, f"{slot_index}.lock")
+
+    def _try_lock_slot(self, slot_index: int) -> Optional[TextIO]:
+        # The lock is released when the file is closed - or when its process dies
+        slot_file = open(self._get_slot_path(slot_index), "a")
+        try:
+            fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            slot_file.close()
+            return None
+        return slot_file
+
+    def _try_acquire_slot(self) -> Optional[TextIO]:
+        for slot_index in range(self.get_concurrency_limit()):
+            slot_file = self._try_lock_slot(slot_index)
+            if slot_file:
+                return slot_file
+        return None
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        self.slots_folder.mkdir(parents=True, exist_ok=True)
+        queued_at = time.perf_counter()
+        with self.queued_lock:
+            self.queued += 1
+        try:
+            while not (slot_file := self._try_acquire_slot()):
+                if time.perf_counter() - queued_at >= self.max_wait_sec:
+                    tracing.set_span_attributes(deferred=True)
+                    raise TranscodeDeferredError(f"No transcode slot within {self.max_wait_sec} seconds")
+                time.sleep(SLOT_POLL_SEC)
+        finally:
+            with self.queued_lock:
+                self.queued -= 1
+        tracing.set_span_attributes(queued_sec=round(time.perf_counter() - queued_at, 3))
+
+        try:
+            yield
+        finally:
+            slot_file.close()
+
+    def get_running(self) -> int:
+        # Box wide - a held slot cannot be locked again, not even from this process
+        running = 0
+        for slot_index in range(self.max_concurrency):
+            if not self._get_slot_path(slot_index).exists():
+                continue
+            slot_file = self._try_lock_slot(slot_index)
+            if slot_file:
+                slot_file.close()
+            else:
+                running += 1
+        return running
+
+    def get_status(self) -> TranscodeSchedulerStatus:
+        return TranscodeSchedulerStatus(
+            running=self.get_running(),
+            queued=self.queued,
+            concurrency_limit=self.get_concurrency_limit(),
+            max_concurrency=self.max_concurrency,
+            load_per_cpu=get_load_per_cpu(),
+        )
@@ -5,7 +5,7 @@ import type {
 } from "./types/common";
 import { APIError, APINotFoundError } from "./types/common";
 import { reportResponseError } from "@/analytics";
-import { TextDocumentResponse, Document } from "@/models";
+import { TextDocumentResponse, TextDocumentParagraphsResponse } from "@/models";
 import { setSortAndPagingQueryParams } from "@/client/common";
 
 const documentsApiBase = "/api/documents";
@@ -77,9 +77,46 @@ export const loadTextDocument = async (documentId: string) => {
   }
 };
 
-export const getDocument = async (documentId: string) => {
-  const textDoc = await loadTextDocument(documentId);
-  return Document.fromTextDocument(textDoc);
+// Paragraphs fetched at a time while reading a document
+export const documentParagraphsPageSize = 50;
+
+export const loadTextDocumentParagraphs = async (
+  documentId: string,
+  from: number,
+  count: number,
+) => {
+  const requestQueryParams = new URLSearchParams({
+    from: String(from),
+    count: String(count),
+  });
+  const response = await fetch(
+    `${documentsApiBase}/${documentId}/paragraphs?${requestQueryParams.toString()}`,
+    {
+      method: "GET",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      credentials: "include",
+    },
+  );
+  if (!response.ok) {
+    const errorMessage = await reportResponseError(
+      response,
+      "documents",
+      "loadDocumentParagraphs",
+      `Load Document ${documentId} Paragraphs Failed.`,
+    );
+
+    let error = new APIError(errorMessage, response.status);
+    if (response.status === 404) {
+      error = new APINotFoundError(errorMessage);
+    }
+    throw error;
+  } else {
+    const paragraphsInfo: TextDocumentParagraphsResponse =
+      await response.json();
+    return paragraphsInfo;
+  }
 };
 
 export type DocumentFilters = {
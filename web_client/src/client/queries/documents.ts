@@ -1,7 +1,17 @@
-import { keepPreviousData, queryOptions } from "@tanstack/react-query";
+import {
+  InfiniteData,
+  infiniteQueryOptions,
+  keepPreviousData,
+  queryOptions,
+} from "@tanstack/react-query";
 
+import { Document, TextDocumentParagraphsResponse } from "@/models";
 import { SortConfiguration } from "../types/common";
-import { getDocument, loadDocuments } from "../documents";
+import {
+  documentParagraphsPageSize,
+  loadDocuments,
+  loadTextDocumentParagraphs,
+} from "../documents";
 
 export function getDocumentsOptions(
   page: number,
@@ -19,12 +29,25 @@ export function getDocumentsOptions(
   });
 }
 
-export function getDocumentOptions(id: string) {
-  return queryOptions({
-    queryKey: ["document", id],
-    queryFn: () => getDocument(id),
+// Stable - the document is rebuilt only when another page was loaded
+const selectDocumentFromPages = (
+  data: InfiniteData<TextDocumentParagraphsResponse, number>,
+) => Document.fromParagraphsPages(data.pages);
+
+export function getDocumentParagraphsOptions(id: string) {
+  return infiniteQueryOptions({
+    queryKey: ["document", id, "paragraphs"],
+    queryFn: ({ pageParam }) =>
+      loadTextDocumentParagraphs(id, pageParam, documentParagraphsPageSize),
+    initialPageParam: 0,
+    getNextPageParam: (lastPage) => {
+      const nextStart = lastPage.start + lastPage.paragraphs.length;
+      return lastPage.paragraphs.length && nextStart < lastPage.total_paragraphs
+        ? nextStart
+        : undefined;
+    },
+    select: selectDocumentFromPages,
     staleTime: 1000 * 60 * 10, // 10 minutes
-    placeholderData: keepPreviousData,
     // This atm the document structure returned is optimized
     // for reciting - it has internal links and cycles.
     // Consider moving this to an on-page memo
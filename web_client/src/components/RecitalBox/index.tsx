@@ -71,9 +71,10 @@ const useAutoSessionStop = (
 
 type RecitalBoxProps = {
   document: Document;
+  onActiveParagraphChange?: (paragraphIndex: number) => void;
 };
 
-const RecitalBox = ({ document }: RecitalBoxProps) => {
+const RecitalBox = ({ document, onActiveParagraphChange }: RecitalBoxProps) => {
   const { t } = useTranslation("recordings");
   const [sessionStartError, setSessionStartError] = useState<Error | null>(
     null,
@@ -83,6 +84,10 @@ const RecitalBox = ({ document }: RecitalBoxProps) => {
     useDocumentNavigation(document);
   const activeSentenceElementRef = useRef<HTMLSpanElement>(null);
 
+  useEffect(() => {
+    onActiveParagraphChange?.(activeParagraphIndex);
+  }, [activeParagraphIndex, onActiveParagraphChange]);
+
   const [createNewSession, endSession] = useRecordingSession(document?.id);
   const endSessionAndMoveOn = useCallback(
     (sessionId: string) => {
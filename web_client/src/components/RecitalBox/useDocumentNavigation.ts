@@ -35,6 +35,20 @@ type LocationCheckpoint = {
 const StoreLocCheckpointsKey = "doclocs";
 const maxStoredLocCheckpoints = 5;
 
+// Where reading stopped last time - known before the document paragraphs are loaded
+export const getStoredParagraphIndex = (documentId: string): number => {
+  try {
+    const checkpoints: LocationCheckpoint[] | null = JSON.parse(
+      localStorage.getItem(StoreLocCheckpointsKey) || "null",
+    );
+    return (
+      checkpoints?.find((cp) => cp.id === documentId)?.paragraphIdx ?? 0
+    );
+  } catch {
+    return 0;
+  }
+};
+
 const useDocumentNavigation = (document: Document) => {
   const [activeDocumentId, setActiveDocumentId] = useState<string | null>(null);
   const [activeParagraphIndex, setActiveParagraphIndex] = useState<number>(0);
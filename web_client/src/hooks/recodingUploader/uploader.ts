@@ -1,5 +1,14 @@
 import { reportResponseError } from "@/analytics";
 import { alterSessionBaseUrl } from "@/client/sessions";
+import { EnvConfig } from "@/config";
+
+const maxSegmentUploadAttempts = 5;
+const segmentUploadRetryDelayMs = 1000;
+
+type DirectUpload = {
+  url: string;
+  fields: Record<string, string>;
+};
 
 type UploadQueueItem = {
   segmentId: number;
@@ -104,28 +113,35 @@ class SegmentedAudioDataUploader extends EventTarget {
     }
   }
 
-  private async uploadAudioSegment(
-    segmentId: number,
+  private async getUploadedOffset(segmentUrl: string): Promise<number> {
+    const response = await fetch(segmentUrl, { method: "HEAD" });
+    if (!response.ok) {
+      throw new Error("Failed to query the audio segment upload status");
+    }
+    return Number(response.headers.get("Upload-Offset") || 0);
+  }
+
+  private async uploadAudioSegmentAttempt(
+    segmentUrl: string,
     audioDataBlob: Blob,
     mimeType: string,
-  ) {
-    console.log(`<Uploader> Uploading segment ${segmentId}`);
-    const formData = new FormData();
-
-    const audioBlob = new Blob([audioDataBlob], {
-      type: mimeType,
-    });
-    formData.append("audio_data", audioBlob);
-
-    try {
-      const response = await fetch(
-        `${alterSessionBaseUrl}/${this.sessionId}/upload-audio-segment/${segmentId}`,
-        {
-          method: "POST",
-          body: formData,
+    offset: number,
+  ): Promise<number | null> {
+    // Send the bytes the server does not have yet
+    if (offset < audioDataBlob.size) {
+      const response = await fetch(segmentUrl, {
+        method: "PATCH",
+        headers: {
+          "Upload-Offset": offset.toString(),
+          "Content-Type": "application/octet-stream",
         },
-      );
+        body: audioDataBlob.slice(offset),
+      });
 
+      if (response.status === 409) {
+        // Resume from where the server actually is
+        return Number(response.headers.get("Upload-Offset") || 0);
+      }
       if (!response.ok) {
         const errorMessage = await reportResponseError(
           response,
@@ -135,14 +151,186 @@ class SegmentedAudioDataUploader extends EventTarget {
         );
         throw new Error(errorMessage);
       }
-    } catch (error) {
-      console.error("Error:", error);
-      this.dispatchEvent(
-        new ErrorEvent("error", {
-          error: error,
-          message: "Error uploading audio segment",
-        }),
+    }
+
+    const response = await this.commitAudioSegment(
+      segmentUrl,
+      audioDataBlob,
+      mimeType,
+    );
+
+    if (response.status === 409) {
+      return Number(response.headers.get("Upload-Offset") || 0);
+    }
+    if (!response.ok) {
+      const errorMessage = await reportResponseError(
+        response,
+        "uploader",
+        "commitAudioSegment",
+        "Upload Segment Failed",
+      );
+      throw new Error(errorMessage);
+    }
+
+    // Committed
+    return null;
+  }
+
+  private async commitAudioSegment(
+    segmentUrl: string,
+    audioDataBlob: Blob,
+    mimeType: string,
+  ): Promise<Response> {
+    return fetch(`${segmentUrl}/commit`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ size: audioDataBlob.size, mime_type: mimeType }),
+    });
+  }
+
+  private async uploadAudioSegmentDirectAttempt(
+    segmentUrl: string,
+    audioDataBlob: Blob,
+    mimeType: string,
+  ): Promise<boolean> {
+    // The server presigns a form - the audio data is posted straight to the content storage
+    const directUploadResponse = await fetch(`${segmentUrl}/direct-upload`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ mime_type: mimeType }),
+    });
+    if (!directUploadResponse.ok) {
+      const errorMessage = await reportResponseError(
+        directUploadResponse,
+        "uploader",
+        "getAudioSegmentDirectUpload",
+        "Upload Segment Failed",
       );
+      throw new Error(errorMessage);
+    }
+    const directUpload: DirectUpload = await directUploadResponse.json();
+
+    const formData = new FormData();
+    Object.entries(directUpload.fields).forEach(([key, value]) =>
+      formData.append(key, value),
+    );
+    formData.append("file", audioDataBlob); // Must be the last field
+    const storageResponse = await fetch(directUpload.url, {
+      method: "POST",
+      body: formData,
+    });
+    if (!storageResponse.ok) {
+      throw new Error(
+        `Direct audio segment upload failed (${storageResponse.status})`,
+      );
+    }
+
+    const response = await this.commitAudioSegment(
+      segmentUrl,
+      audioDataBlob,
+      mimeType,
+    );
+    if (response.status === 409) {
+      // Not stored whole - upload again
+      return false;
+    }
+    if (!response.ok) {
+      const errorMessage = await reportResponseError(
+        response,
+        "uploader",
+        "commitAudioSegment",
+        "Upload Segment Failed",
+      );
+      throw new Error(errorMessage);
+    }
+
+    return true;
+  }
+
+  private dispatchUploadError(error: unknown) {
+    console.error("Error:", error);
+    this.dispatchEvent(
+      new ErrorEvent("error", {
+        error: error,
+        message: "Error uploading audio segment",
+      }),
+    );
+  }
+
+  private async uploadAudioSegmentDirect(
+    segmentUrl: string,
+    audioDataBlob: Blob,
+    mimeType: string,
+  ) {
+    for (let attempt = 1; ; attempt++) {
+      try {
+        if (
+          await this.uploadAudioSegmentDirectAttempt(
+            segmentUrl,
+            audioDataBlob,
+            mimeType,
+          )
+        ) {
+          return;
+        }
+        if (attempt >= maxSegmentUploadAttempts) {
+          throw new Error("Audio segment upload did not complete");
+        }
+      } catch (error) {
+        if (attempt >= maxSegmentUploadAttempts) {
+          this.dispatchUploadError(error);
+          return;
+        }
+      }
+
+      await new Promise((res) =>
+        setTimeout(res, segmentUploadRetryDelayMs * attempt),
+      );
+    }
+  }
+
+  private async uploadAudioSegment(
+    segmentId: number,
+    audioDataBlob: Blob,
+    mimeType: string,
+  ) {
+    console.log(`<Uploader> Uploading segment ${segmentId}`);
+    const segmentUrl = `${alterSessionBaseUrl}/${this.sessionId}/audio-segments/${segmentId}`;
+
+    if (EnvConfig.getBoolean("direct_audio_upload")) {
+      await this.uploadAudioSegmentDirect(segmentUrl, audioDataBlob, mimeType);
+      return;
+    }
+
+    // Retries resume the upload - only the bytes the server is missing are resent
+    let offset: number | null = 0;
+    for (let attempt = 1; offset !== null; attempt++) {
+      try {
+        offset = await this.uploadAudioSegmentAttempt(
+          segmentUrl,
+          audioDataBlob,
+          mimeType,
+          offset,
+        );
+        if (offset !== null && attempt >= maxSegmentUploadAttempts) {
+          throw new Error("Audio segment upload did not complete");
+        }
+      } catch (error) {
+        if (attempt >= maxSegmentUploadAttempts) {
+          this.dispatchUploadError(error);
+          return;
+        }
+
+        await new Promise((res) =>
+          setTimeout(res, segmentUploadRetryDelayMs * attempt),
+        );
+        try {
+          offset = await this.getUploadedOffset(segmentUrl);
+        } catch (statusError) {
+          console.error("Error:", statusError);
+          // Keep the last known offset - the server corrects it if needed
+        }
+      }
     }
   }
 }
@@ -93,6 +93,8 @@ class Document {
   title?: string;
   paragraphs: Paragraph[];
   public?: boolean | null;
+  // Of the whole document - when only some of its paragraphs are loaded
+  totalParagraphs?: number;
   constructor(paragraphs: Paragraph[]) {
     this.paragraphs = paragraphs;
   }
@@ -140,6 +142,20 @@ class Document {
     document.public = textDocument.public;
     return document;
   }
+
+  static fromParagraphsPages(
+    pages: TextDocumentParagraphsResponse[],
+  ): Document {
+    const document = Document.fromParagraphsTextList(
+      pages.flatMap((page) => page.paragraphs),
+    );
+    const firstPage = pages[0];
+    document.id = firstPage.document_id;
+    document.title = firstPage.title;
+    document.public = firstPage.public;
+    document.totalParagraphs = firstPage.total_paragraphs;
+    return document;
+  }
 }
 
 export type TextDocumentResponse = {
@@ -151,4 +167,13 @@ export type TextDocumentResponse = {
   created_at: string;
 };
 
+export type TextDocumentParagraphsResponse = {
+  document_id: string;
+  title: string;
+  public: boolean | null;
+  start: number;
+  total_paragraphs: number;
+  paragraphs: string[][];
+};
+
 export { Sentence, Paragraph, Document };
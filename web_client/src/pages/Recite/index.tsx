@@ -4,11 +4,17 @@ import RecitalBox from "@/components/RecitalBox";
 
 type Props = {
   document: Document;
+  onActiveParagraphChange?: (paragraphIndex: number) => void;
 };
 
-const Recite = ({ document }: Props) => {
+const Recite = ({ document, onActiveParagraphChange }: Props) => {
   useTrackPageView("recite");
-  return <RecitalBox document={document} />;
+  return (
+    <RecitalBox
+      document={document}
+      onActiveParagraphChange={onActiveParagraphChange}
+    />
+  );
 };
 
 export default Recite;
@@ -1,25 +1,73 @@
 import { createFileRoute, notFound } from "@tanstack/react-router";
+import { useEffect, useMemo, useState } from "react";
 
 import { APINotFoundError } from "@/client/types/common";
-import { getDocumentOptions } from "@/client/queries/documents";
+import { documentParagraphsPageSize } from "@/client/documents";
+import { getDocumentParagraphsOptions } from "@/client/queries/documents";
+import { getStoredParagraphIndex } from "@/components/RecitalBox/useDocumentNavigation";
 import RecitePage from "@/pages/Recite";
-import { useQuery } from "@tanstack/react-query";
+import { useInfiniteQuery } from "@tanstack/react-query";
+
+// Paragraphs kept loaded ahead of the active one - the next page is fetched as reading goes on
+const loadAheadParagraphs = 20;
 
 function Recite() {
   const docId = Route.useParams().docId;
-  const { data: document } = useQuery(getDocumentOptions(docId));
+  const {
+    data: document,
+    hasNextPage,
+    isFetchingNextPage,
+    fetchNextPage,
+  } = useInfiniteQuery(getDocumentParagraphsOptions(docId));
+  const storedParagraphIndex = useMemo(
+    () => getStoredParagraphIndex(docId),
+    [docId],
+  );
+  const [activeParagraphIndex, setActiveParagraphIndex] = useState(0);
+
+  const loadedParagraphs = document?.paragraphs.length ?? 0;
+  const neededParagraphs =
+    Math.max(storedParagraphIndex, activeParagraphIndex) + loadAheadParagraphs;
+  useEffect(() => {
+    if (
+      hasNextPage &&
+      !isFetchingNextPage &&
+      loadedParagraphs < neededParagraphs
+    ) {
+      fetchNextPage();
+    }
+  }, [
+    hasNextPage,
+    isFetchingNextPage,
+    loadedParagraphs,
+    neededParagraphs,
+    fetchNextPage,
+  ]);
 
   if (!document) return null;
+  // Reading resumes where it stopped - that paragraph must be loaded first
+  if (hasNextPage && loadedParagraphs <= storedParagraphIndex) return null;
 
-  return <RecitePage document={document} />;
+  return (
+    <RecitePage
+      document={document}
+      onActiveParagraphChange={setActiveParagraphIndex}
+    />
+  );
 }
 
 export const Route = createFileRoute("/_main/recite/$docId")({
   loader: async ({ context: { queryClient }, params }) => {
     try {
-      return await queryClient.ensureQueryData(
-        getDocumentOptions(params.docId),
-      );
+      // Only the pages up to where reading stopped - not the whole document
+      const pages =
+        Math.floor(
+          getStoredParagraphIndex(params.docId) / documentParagraphsPageSize,
+        ) + 1;
+      return await queryClient.ensureInfiniteQueryData({
+        ...getDocumentParagraphsOptions(params.docId),
+        pages,
+      });
     } catch (error) {
       if (error instanceof APINotFoundError) {
         throw notFound();
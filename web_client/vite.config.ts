@@ -1,5 +1,6 @@
 import path from "path";
 import fs from "fs";
+import zlib from "zlib";
 import { defineConfig, PluginOption } from "vite";
 import react from "@vitejs/plugin-react";
 import { TanStackRouterVite } from "@tanstack/router-plugin/vite";
@@ -45,9 +46,54 @@ const injectEnvConfigScriptPlugin: () => PluginOption = () => {
   };
 };
 
+// Writes .br and .gz variants next to the built files
+// so the server can send them without compressing on each request
+const precompressBuildOutputPlugin: () => PluginOption = () => {
+  const compressibleFile = /\.(js|mjs|css|html|svg|json|txt|map)$/;
+  const minSize = 1024;
+  let outDir = "dist";
+
+  const listFiles = (dir: string): string[] =>
+    fs
+      .readdirSync(dir, { withFileTypes: true })
+      .flatMap((entry) =>
+        entry.isDirectory()
+          ? listFiles(path.join(dir, entry.name))
+          : [path.join(dir, entry.name)],
+      );
+
+  return {
+    name: "precompress-build-output",
+    apply: "build",
+    configResolved: (config) => {
+      outDir = path.resolve(config.root, config.build.outDir);
+    },
+    closeBundle: () => {
+      for (const file of listFiles(outDir)) {
+        if (!compressibleFile.test(file)) continue;
+        const content = fs.readFileSync(file);
+        if (content.length < minSize) continue;
+
+        fs.writeFileSync(`${file}.gz`, zlib.gzipSync(content, { level: 9 }));
+        fs.writeFileSync(
+          `${file}.br`,
+          zlib.brotliCompressSync(content, {
+            params: { [zlib.constants.BROTLI_PARAM_QUALITY]: 11 },
+          }),
+        );
+      }
+    },
+  };
+};
+
 // https://vitejs.dev/config/
 export default defineConfig({
-  plugins: [TanStackRouterVite(), react(), injectEnvConfigScriptPlugin()],
+  plugins: [
+    TanStackRouterVite(),
+    react(),
+    injectEnvConfigScriptPlugin(),
+    precompressBuildOutputPlugin(),
+  ],
   resolve: {
     alias: {
       "@": path.resolve(__dirname, "./src"),